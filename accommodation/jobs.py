@@ -0,0 +1,18 @@
+from django_slack import slack_message
+
+from jobs.queue import job
+
+from .mailer import send_booking_confirmation_mail
+from .models import Booking
+
+
+@job
+def send_booking_confirmation(booking_id):
+    booking = Booking.objects.select_related('guest').get(pk=booking_id)
+    send_booking_confirmation_mail(booking)
+
+
+@job
+def send_booking_created_slack_message(booking_id):
+    booking = Booking.objects.select_related('guest').get(pk=booking_id)
+    slack_message('accommodation/booking_created.slack', {'booking': booking})
@@ -1,16 +1,17 @@
 from datetime import datetime, timezone
 
-from django_slack import slack_message
 import stripe
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.shortcuts import redirect, render
 
 from ironcage.stripe_integration import create_charge
+from jobs.queue import enqueue
 
-from .mailer import send_booking_confirmation_mail
+from . import jobs
 from .models import Booking, available_rooms, get_room_by_key, has_availability
 
 
@@ -57,15 +58,16 @@ def booking_payment(request):
             messages.warning(request, f'Payment for this booking failed ({e._message})')
             return redirect('accommodation:new_booking')
 
-        booking = Booking.objects.create(
-            guest=request.user,
-            room_key=room.key,
-            stripe_charge_id=charge.id,
-            stripe_charge_created=datetime.fromtimestamp(charge.created, tz=timezone.utc),
-        )
+        with transaction.atomic():
+            booking = Booking.objects.create(
+                guest=request.user,
+                room_key=room.key,
+                stripe_charge_id=charge.id,
+                stripe_charge_created=datetime.fromtimestamp(charge.created, tz=timezone.utc),
+            )
+            enqueue(jobs.send_booking_confirmation, booking_id=booking.id)
+            enqueue(jobs.send_booking_created_slack_message, booking_id=booking.id)
 
-        send_booking_confirmation_mail(booking)
-        slack_message('accommodation/booking_created.slack', {'booking': booking})
         messages.info(request, 'Payment for this booking has been received')
         return redirect('index')
 
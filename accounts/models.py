@@ -1,3 +1,4 @@
+from functools import lru_cache
 import json
 import os
 
@@ -5,33 +6,49 @@ from django.conf import settings
 from django.contrib.auth.models import PermissionsMixin
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.db import models
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
 from accommodation.models import Booking
 from grants.models import Application
-from ironcage.utils import Scrambler
+from ironcage.utils import LazyChoices, Scrambler
 from tickets.models import Ticket
 from ukpa.models import Nomination
 
 from .managers import UserManager
 
 
-# https://en.wikipedia.org/wiki/Member_states_of_the_United_Nations
-with open(os.path.join(settings.BASE_DIR, 'accounts', 'data', 'countries.txt')) as f:
-    COUNTRIES = [line.strip() for line in f]
+# The reference data for the demographics questions is only loaded when it is
+# first needed, so that processes that never render the profile form (such as
+# most management commands) don't pay for it at import time.
 
-# https://en.wikipedia.org/wiki/List_of_adjectival_and_demonymic_forms_for_countries_and_nations
-with open(os.path.join(settings.BASE_DIR, 'accounts', 'data', 'nationalities.txt')) as f:
-    NATIONALITIES = [line.strip() for line in f]
+@lru_cache()
+def countries():
+    # https://en.wikipedia.org/wiki/Member_states_of_the_United_Nations
+    with open(os.path.join(settings.BASE_DIR, 'accounts', 'data', 'countries.txt')) as f:
+        return [line.strip() for line in f]
 
-# https://www.ons.gov.uk/ons/guide-method/harmonisation/primary-set-of-harmonised-concepts-and-questions/ethnic-group.pdf
-with open(os.path.join(settings.BASE_DIR, 'accounts', 'data', 'ethnicities.json')) as f:
-    ETHNICITIES = json.load(f)
+
+@lru_cache()
+def nationalities():
+    # https://en.wikipedia.org/wiki/List_of_adjectival_and_demonymic_forms_for_countries_and_nations
+    with open(os.path.join(settings.BASE_DIR, 'accounts', 'data', 'nationalities.txt')) as f:
+        return [line.strip() for line in f]
+
+
+@lru_cache()
+def ethnicities():
+    # https://www.ons.gov.uk/ons/guide-method/harmonisation/primary-set-of-harmonised-concepts-and-questions/ethnic-group.pdf
+    with open(os.path.join(settings.BASE_DIR, 'accounts', 'data', 'ethnicities.json')) as f:
+        return json.load(f)
 
 
 class Manager(UserManager):
     def get_by_user_id_or_404(self, user_id):
-        id = self.model.id_scrambler.backward(user_id)
+        try:
+            id = self.model.id_scrambler.backward(user_id)
+        except ValueError:
+            raise Http404
         return get_object_or_404(self.model, pk=id)
 
 
@@ -45,12 +62,12 @@ class User(AbstractBaseUser, PermissionsMixin):
         ['other', 'please specify'],
     ]
 
-    COUNTRY_CHOICES = [['not shared', 'prefer not to say']] + [[country, country] for country in COUNTRIES] + [['other', 'not listed here (please specify)']]
+    COUNTRY_CHOICES = LazyChoices(lambda: [['not shared', 'prefer not to say']] + [[country, country] for country in countries()] + [['other', 'not listed here (please specify)']])
 
-    NATIONALITY_CHOICES = [['not shared', 'prefer not to say']] + [[nationality, nationality] for nationality in NATIONALITIES] + [['other', 'not listed here (please specify)']]
+    NATIONALITY_CHOICES = LazyChoices(lambda: [['not shared', 'prefer not to say']] + [[nationality, nationality] for nationality in nationalities()] + [['other', 'not listed here (please specify)']])
 
     # Sorry
-    ETHNICITY_CHOICES = [['not shared', 'prefer not to say']] + [[ethnicity_category, [[ethnicity, ethnicity] for ethnicity in ethnicities]] for ethnicity_category, ethnicities in ETHNICITIES]
+    ETHNICITY_CHOICES = LazyChoices(lambda: [['not shared', 'prefer not to say']] + [[ethnicity_category, [[ethnicity, ethnicity] for ethnicity in category_ethnicities]] for ethnicity_category, category_ethnicities in ethnicities()])
 
     email_addr = models.EmailField(
         'email address',
@@ -92,7 +109,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     EMAIL_FIELD = 'email_addr'
     REQUIRED_FIELDS = ['name']
 
-    id_scrambler = Scrambler(8000)
+    id_scrambler = Scrambler(8000, bits=settings.ID_SCRAMBLER_BITS)
 
     objects = Manager()
 
@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
 from tickets.tests import factories as tickets_factories
@@ -6,6 +7,23 @@ from accounts.models import User
 
 
 class UserTests(TestCase):
+    def test_reference_data_choices(self):
+        self.assertEqual(User.COUNTRY_CHOICES[0], ['not shared', 'prefer not to say'])
+        self.assertIn(['United Kingdom', 'United Kingdom'], User.COUNTRY_CHOICES)
+        self.assertIn(['British', 'British'], User.NATIONALITY_CHOICES)
+        self.assertEqual(User.ETHNICITY_CHOICES[1][0], 'White')
+        self.assertEqual(User.COUNTRY_CHOICES[-1], ['other', 'not listed here (please specify)'])
+
+        # The choices are memoised
+        self.assertIs(User.COUNTRY_CHOICES.choices(), User.COUNTRY_CHOICES.choices())
+
+    def test_reference_data_choices_validation(self):
+        user = User(country_of_residence='Narnia')
+        field = User._meta.get_field('country_of_residence')
+        with self.assertRaises(ValidationError):
+            field.clean('Narnia', user)
+        self.assertEqual(field.clean('United Kingdom', user), 'United Kingdom')
+
     def test_create_user(self):
         user = User.objects.create_user(
             email_addr='alice@example.com',
@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.db import models
 from django.db.models import Q
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 
@@ -37,7 +38,7 @@ class Proposal(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    id_scrambler = Scrambler(3000)
+    id_scrambler = Scrambler(3000, bits=settings.ID_SCRAMBLER_BITS)
 
     class Meta:
         permissions = [
@@ -46,7 +47,10 @@ class Proposal(models.Model):
 
     class Manager(models.Manager):
         def get_by_proposal_id_or_404(self, proposal_id):
-            id = self.model.id_scrambler.backward(proposal_id)
+            try:
+                id = self.model.id_scrambler.backward(proposal_id)
+            except ValueError:
+                raise Http404
             return get_object_or_404(self.model, pk=id)
 
         def accepted_talks(self):
@@ -1,11 +1,11 @@
-from django_slack import slack_message
 import stripe
 
 from django.db import transaction
 
-from ironcage.stripe_integration import create_charge_for_order
+from ironcage.stripe_integration import NON_RETRYABLE_STRIPE_ERRORS, STRIPE_ERROR_MESSAGE, create_charge_for_order, refund_charge
+from jobs.queue import enqueue
 
-from .mailer import send_order_confirmation_mail
+from . import jobs
 from .models import Order
 
 import structlog
@@ -32,22 +32,69 @@ def update_pending_order(order, adult_name, adult_email_addr, adult_phone_number
         order.update(adult_name, adult_email_addr, adult_phone_number, accessibility_reqs, dietary_reqs, unconfirmed_details)
 
 
+def start_stripe_charge(order, token):
+    '''Mark the order as processing, and enqueue a job to charge the card.
+
+    The order is confirmed, or marked as failed, by that job or by our
+    webhook hearing from Stripe about the charge, whichever happens first.
+    '''
+    logger.info('children:start_stripe_charge', order=order.order_id, token=token)
+    assert order.payment_required()
+    with transaction.atomic():
+        order.mark_as_processing()
+        enqueue(jobs.process_stripe_charge, order_id=order.id, token=token)
+
+
 def process_stripe_charge(order, token):
     logger.info('children:process_stripe_charge', order=order.order_id, token=token)
-    assert order.payment_required()
+    assert order.is_unconfirmed()
     try:
         charge = create_charge_for_order(order, token)
-        confirm_order(order, charge.id, charge.created)
     except stripe.error.CardError as e:
         mark_order_as_failed(order, e._message)
+    except NON_RETRYABLE_STRIPE_ERRORS:
+        logger.exception('children:process_stripe_charge_error', order=order.order_id)
+        mark_order_as_failed(order, STRIPE_ERROR_MESSAGE)
+    else:
+        confirm_order(order, charge.id, charge.created)
+
+
+def process_stripe_charge_event(charge, succeeded):
+    '''Confirm the order that a charge was for, or mark it as failed, when
+    our webhook hears from Stripe about the charge.
+
+    This is called by tickets.actions.process_stripe_event, in the
+    transaction that records that the event has been processed.
+    '''
+    order = Order.objects.get_for_charge_for_update(charge)
+
+    # The order is only processing if neither this event nor the job that
+    # created the charge has already confirmed it or marked it as failed.
+    if order is None:
+        pass
+    elif succeeded:
+        if order.is_processing():
+            confirm_order(order, charge['id'], charge['created'])
+        elif order.payment_required():
+            # The job that created the charge gave up waiting to hear from
+            # Stripe, and marked the order as failed, but the card was
+            # charged after all.
+            if charge['amount'] == order.cost_pence_incl_vat():
+                confirm_order(order, charge['id'], charge['created'])
+            else:
+                # The order has been changed since
+                logger.warning('children:refund_charge_for_changed_order', order=order.order_id, charge_id=charge['id'])
+                refund_charge(charge['id'])
+    elif order.is_processing():
+        mark_order_as_failed(order, charge['failure_message'] or 'Your card was declined.')
 
 
 def confirm_order(order, charge_id, charge_created):
     logger.info('children:confirm_order', order=order.order_id, charge_id=charge_id)
     with transaction.atomic():
         order.confirm(charge_id, charge_created)
-    send_receipt(order)
-    slack_message('children/order_created.slack', {'order': order})
+        send_receipt(order)
+        enqueue(jobs.send_order_created_slack_message, order_id=order.id)
 
 
 def mark_order_as_failed(order, charge_failure_reason):
@@ -57,5 +104,4 @@ def mark_order_as_failed(order, charge_failure_reason):
 
 
 def send_receipt(order):
-    logger.info('children:children:send_receipt', order=order.order_id)
-    send_order_confirmation_mail(order)
+    enqueue(jobs.send_receipt, order_id=order.id)
@@ -0,0 +1,46 @@
+from django_slack import slack_message
+
+from django.db import transaction
+
+from ironcage.stripe_integration import STRIPE_ERROR_MESSAGE
+from jobs.queue import job
+
+from . import actions
+from .mailer import send_order_confirmation_mail
+from .models import Order
+
+import structlog
+logger = structlog.get_logger()
+
+
+@job
+def send_receipt(order_id):
+    order = Order.objects.select_related('purchaser').get(pk=order_id)
+    logger.info('children:send_receipt', order=order.order_id)
+    send_order_confirmation_mail(order)
+
+
+@job
+def send_order_created_slack_message(order_id):
+    order = Order.objects.select_related('purchaser').get(pk=order_id)
+    slack_message('children/order_created.slack', {'order': order})
+
+
+def give_up_stripe_charge(order_id, token):
+    # The card couldn't be charged after several attempts, so the purchaser is
+    # allowed to try again.  If the card was charged after all, our webhook
+    # still confirms the order when it hears about the charge.
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        if order.is_processing():
+            actions.mark_order_as_failed(order, STRIPE_ERROR_MESSAGE)
+
+
+@job(on_dead=give_up_stripe_charge)
+def process_stripe_charge(order_id, token):
+    # The order is locked while the card is charged, so that if our webhook
+    # hears about the charge in the meantime, it waits to see what happened.
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        if order.is_processing():
+            actions.process_stripe_charge(order, token)
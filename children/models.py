@@ -3,6 +3,7 @@ from datetime import datetime, timezone
 from django.conf import settings
 from django.contrib.postgres.fields import JSONField
 from django.db import models
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 
@@ -25,13 +26,29 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    id_scrambler = Scrambler(6000)
+    id_scrambler = Scrambler(6000, bits=settings.ID_SCRAMBLER_BITS)
 
     class Manager(models.Manager):
         def get_by_order_id_or_404(self, order_id):
-            id = self.model.id_scrambler.backward(order_id)
+            try:
+                id = self.model.id_scrambler.backward(order_id)
+            except ValueError:
+                raise Http404
             return get_object_or_404(self.model, pk=id)
 
+        def get_for_charge_for_update(self, charge):
+            '''Return the order that a Stripe charge was for, locked until the
+            end of the transaction, or None if the charge wasn't for an order
+            for children's tickets.'''
+            metadata = charge['metadata']
+            if metadata.get('app') != self.model._meta.app_label:
+                return None
+            try:
+                id = self.model.id_scrambler.backward(metadata.get('order_id'))
+            except ValueError:
+                return None
+            return self.select_for_update().filter(pk=id).first()
+
         def create_pending(self, purchaser, adult_name, adult_email_addr, adult_phone_number, accessibility_reqs, dietary_reqs, unconfirmed_details):
             assert len(unconfirmed_details) > 0
 
@@ -74,7 +91,7 @@ class Order(models.Model):
         self.save()
 
     def confirm(self, charge_id, charge_created):
-        assert self.payment_required()
+        assert self.is_unconfirmed()
 
         for name, date_of_birth in self.unconfirmed_details:
             self.tickets.create(name=name, date_of_birth=date_of_birth)
@@ -86,6 +103,12 @@ class Order(models.Model):
 
         self.save()
 
+    def mark_as_processing(self):
+        self.stripe_charge_failure_reason = ''
+        self.status = 'processing'
+
+        self.save()
+
     def mark_as_failed(self, charge_failure_reason):
         self.stripe_charge_failure_reason = charge_failure_reason
         self.status = 'failed'
@@ -95,6 +118,15 @@ class Order(models.Model):
     def payment_required(self):
         return self.status in ['pending', 'failed']
 
+    def is_processing(self):
+        return self.status == 'processing'
+
+    def is_unconfirmed(self):
+        '''Return whether the order's tickets have yet to be created, either
+        because it hasn't been paid for, or because its payment is still being
+        processed.'''
+        return self.payment_required() or self.is_processing()
+
     def num_tickets(self):
         return len(self.all_tickets())
 
@@ -105,7 +137,7 @@ class Order(models.Model):
         return 100 * self.cost_incl_vat()
 
     def all_tickets(self):
-        if self.payment_required():
+        if self.is_unconfirmed():
             tickets = []
             for name, date_of_birth in self.unconfirmed_details:
                 ticket = Ticket(name=name, date_of_birth=date_of_birth)
@@ -126,11 +158,14 @@ class Ticket(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    id_scrambler = Scrambler(7000)
+    id_scrambler = Scrambler(7000, bits=settings.ID_SCRAMBLER_BITS)
 
     class Manager(models.Manager):
         def get_by_ticket_id_or_404(self, ticket_id):
-            id = self.model.id_scrambler.backward(ticket_id)
+            try:
+                id = self.model.id_scrambler.backward(ticket_id)
+            except ValueError:
+                raise Http404
             return get_object_or_404(self.model, pk=id)
 
     objects = Manager()
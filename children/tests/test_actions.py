@@ -1,10 +1,14 @@
 from datetime import date
 
 from django.core import mail
-from django.test import TestCase
+from django.test import TestCase, override_settings
+
+import stripe
 
 from . import factories
+from ironcage.stripe_integration import STRIPE_ERROR_MESSAGE
 from ironcage.tests import utils
+from jobs.models import Job
 
 from children import actions
 
@@ -120,3 +124,25 @@ class ProcessStripeChargeTests(TestCase):
             actions.process_stripe_charge(self.order, token)
         self.order.refresh_from_db()
         self.assertEqual(self.order.status, 'failed')
+
+    def test_process_stripe_charge_invalid_request(self):
+        token = 'tok_ abcdefghijklmnopqurstuvwx'
+        error = stripe.error.InvalidRequestError('No such token: tok_ abcdefghijklmnopqurstuvwx', 'source')
+        with utils.patched_charge_creation_error(error):
+            actions.process_stripe_charge(self.order, token)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'failed')
+        self.assertEqual(self.order.stripe_charge_failure_reason, STRIPE_ERROR_MESSAGE)
+
+
+class StartStripeChargeTests(TestCase):
+    @override_settings(JOBS_RUN_INLINE=False)
+    def test_start_stripe_charge(self):
+        order = factories.create_pending_order()
+
+        actions.start_stripe_charge(order, 'tok_abcdefghijklmnopqurstuvwx')
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'processing')
+        self.assertFalse(order.payment_required())
+        self.assertEqual(Job.objects.get().name, 'children.jobs.process_stripe_charge')
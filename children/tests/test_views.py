@@ -1,6 +1,11 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+import stripe
 
 from ironcage.tests import utils
+from tickets import fake_stripe
 
 from . import factories
 
@@ -181,6 +186,49 @@ class OrderPaymentTests(TestCase):
         self.assertContains(rsp, '<th>Date</th><td>Unpaid</td>', html=True)
         self.assertContains(rsp, '<div id="stripe-form">')
 
+    def test_stripe_error(self):
+        self.client.force_login(self.order.purchaser)
+        error = stripe.error.APIConnectionError('Could not connect to Stripe')
+        with utils.patched_charge_creation_error(error):
+            rsp = self.client.post(
+                f'/children/orders/{self.order.order_id}/payment/',
+                {'stripeToken': 'tok_abcdefghijklmnopqurstuvwx'},
+                follow=True,
+            )
+        self.assertContains(rsp, 'Payment for this order failed (There was a problem taking your payment.')
+        self.assertContains(rsp, '<div id="stripe-form">')
+
+    @override_settings(JOBS_RUN_INLINE=False)
+    def test_payment_is_processed_by_job(self):
+        self.client.force_login(self.order.purchaser)
+        rsp = self.client.post(
+            f'/children/orders/{self.order.order_id}/payment/',
+            {'stripeToken': 'tok_abcdefghijklmnopqurstuvwx'},
+            follow=True,
+        )
+        self.assertContains(rsp, 'Your payment is being processed')
+        self.assertContains(rsp, '<th>Date</th><td>Processing</td>', html=True)
+        self.assertContains(rsp, '<div id="payment-processing">')
+        self.assertNotContains(rsp, '<div id="stripe-form">')
+
+        with utils.patched_charge_creation_success():
+            call_command('runjobs', once=True)
+
+        rsp = self.client.get(f'/children/orders/{self.order.order_id}/')
+        self.assertContains(rsp, '<th>Date</th><td>May 21, 2017</td>', html=True)
+        self.assertNotContains(rsp, '<div id="payment-processing">')
+
+    def test_when_processing(self):
+        self.order.mark_as_processing()
+        self.client.force_login(self.order.purchaser)
+        rsp = self.client.post(
+            f'/children/orders/{self.order.order_id}/payment/',
+            {'stripeToken': 'tok_abcdefghijklmnopqurstuvwx'},
+            follow=True,
+        )
+        self.assertRedirects(rsp, f'/children/orders/{self.order.order_id}/')
+        self.assertContains(rsp, 'Payment for this order is being processed')
+
     def test_when_already_paid(self):
         factories.confirm_order(self.order)
         self.client.force_login(self.order.purchaser)
@@ -210,3 +258,37 @@ class OrderPaymentTests(TestCase):
         )
         self.assertRedirects(rsp, '/')
         self.assertContains(rsp, 'Only the purchaser of an order can pay for the order')
+
+
+class StripeWebhookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = factories.create_pending_order()
+
+    def setUp(self):
+        self.order.mark_as_processing()
+
+    def post_event(self, event):
+        payload, signature = fake_stripe.encode(event, settings.STRIPE_WEBHOOK_SECRET)
+        return self.client.post(
+            '/tickets/stripe/webhook/',
+            payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=signature,
+        )
+
+    def test_charge_succeeded(self):
+        rsp = self.post_event(fake_stripe.charge_event(self.order))
+        self.assertEqual(rsp.status_code, 200)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'successful')
+        self.assertEqual(self.order.tickets.count(), 1)
+
+    def test_charge_failed(self):
+        rsp = self.post_event(fake_stripe.charge_event(self.order, succeeded=False))
+        self.assertEqual(rsp.status_code, 200)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'failed')
+        self.assertEqual(self.order.stripe_charge_failure_reason, 'Your card was declined.')
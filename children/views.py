@@ -4,7 +4,7 @@ from django.contrib import messages
 from django.shortcuts import redirect, render
 from django.views.decorators.http import require_POST
 
-from .actions import create_pending_order, process_stripe_charge, update_pending_order
+from .actions import create_pending_order, start_stripe_charge, update_pending_order
 from .forms import OrderForm, TicketFormSet
 from .models import Order
 
@@ -133,14 +133,23 @@ def order_payment(request, order_id):
         messages.warning(request, 'Only the purchaser of an order can pay for the order')
         return redirect('index')
 
+    if order.is_processing():
+        messages.error(request, 'Payment for this order is being processed')
+        return redirect(order)
+
     if not order.payment_required():
         messages.error(request, 'This order has already been paid')
         return redirect(order)
 
     token = request.POST['stripeToken']
-    process_stripe_charge(order, token)
+    start_stripe_charge(order, token)
 
-    if not order.payment_required():
+    # If jobs are run inline, the payment will already have been processed
+    order.refresh_from_db()
+
+    if order.is_processing():
+        messages.info(request, 'Your payment is being processed.')
+    elif not order.payment_required():
         messages.success(request, 'Payment for this order has been received.')
 
     return redirect(order)
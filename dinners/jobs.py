@@ -0,0 +1,10 @@
+from jobs.queue import job
+
+from .mailer import send_booking_confirmation_mail
+from .models import Booking
+
+
+@job
+def send_booking_confirmation(booking_id):
+    booking = Booking.objects.select_related('guest').get(pk=booking_id)
+    send_booking_confirmation_mail(booking)
@@ -5,12 +5,14 @@ import stripe
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.shortcuts import redirect, render
 
 from ironcage.stripe_integration import create_charge
+from jobs.queue import enqueue
 
+from . import jobs
 from .forms import ConferenceDinnerForm, ContributorsDinnerForm, WhichDinnerForm
-from .mailer import send_booking_confirmation_mail
 from .models import Booking, seats_left
 
 
@@ -61,14 +63,15 @@ def _contributors_dinner_unbooked(request):
                 assert False
 
             if menu_form.is_valid():
-                booking = Booking.objects.create(
-                    guest=request.user,
-                    venue=which_dinner,
-                    starter=menu_form.cleaned_data['starter'],
-                    main=menu_form.cleaned_data['main'],
-                    pudding=menu_form.cleaned_data['pudding'],
-                )
-                send_booking_confirmation_mail(booking)
+                with transaction.atomic():
+                    booking = Booking.objects.create(
+                        guest=request.user,
+                        venue=which_dinner,
+                        starter=menu_form.cleaned_data['starter'],
+                        main=menu_form.cleaned_data['main'],
+                        pudding=menu_form.cleaned_data['pudding'],
+                    )
+                    enqueue(jobs.send_booking_confirmation, booking_id=booking.id)
                 return redirect('dinners:contributors_dinner')
 
     context = {
@@ -141,9 +144,10 @@ def conference_dinner_payment(request):
 
         booking.stripe_charge_id = charge.id,
         booking.stripe_charge_created = datetime.fromtimestamp(charge.created, tz=timezone.utc)
-        booking.save()
 
-        send_booking_confirmation_mail(booking)
+        with transaction.atomic():
+            booking.save()
+            enqueue(jobs.send_booking_confirmation, booking_id=booking.id)
 
         messages.info(request, 'Payment succeeded')
         return redirect('dinners:conference_dinner')
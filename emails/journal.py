@@ -0,0 +1,55 @@
+'''Recording who has been sent each email in a bulk mail run.
+
+A Journal is passed the Result of sending each email by a BulkMailer, and
+writes a BulkMailDelivery for each to the database in batches.  If a run is
+killed, the deliveries since the last batch are lost, and those recipients
+will be sent the email again when the run is resumed.
+'''
+
+from accounts.models import User
+
+from .models import BulkMailDelivery
+
+import structlog
+logger = structlog.get_logger()
+
+
+# How many deliveries are written to the database at a time
+BATCH_SIZE = 100
+
+
+class Journal:
+    def __init__(self, run, batch_size=BATCH_SIZE):
+        self.run = run
+        self.batch_size = batch_size
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def record(self, result):
+        '''Record a bulk_mail.Result for a mail whose fourth item is the
+        recipient's user_id.'''
+
+        user_id = result.mail[3]
+        self.pending.append(BulkMailDelivery(
+            run=self.run,
+            recipient_id=User.id_scrambler.backward(user_id),
+            status='sent' if result.sent else 'failed',
+            message_id=result.message_id,
+            error=result.error or '',
+        ))
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        BulkMailDelivery.objects.bulk_create(self.pending)
+        logger.info('bulk_mail_journal_written', run=self.run.id, num_deliveries=len(self.pending))
+        self.pending = []
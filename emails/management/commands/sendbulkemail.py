@@ -1,13 +1,12 @@
 from argparse import RawTextHelpFormatter
-import os
-import re
 
-from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 from django.template.loader import get_template
 
-from accounts.models import User
-from ironcage.emails import send_mail
+from emails import segments, spool as email_spool
+from emails.journal import Journal
+from emails.models import BulkMailRun
+from ironcage import bulk_mail
 
 import structlog
 logger = structlog.get_logger()
@@ -15,7 +14,7 @@ logger = structlog.get_logger()
 
 class Command(BaseCommand):
     help = '''
-Sends emails to all users belonging to a given pre-defined queryset.
+Sends emails to all users in a segment.
 
 For instance,
 
@@ -25,62 +24,32 @@ $ ./manage.py sendbulkemail --recipients staff --template staff-test \\
 will send an email to all staff users.  The email will be constructed from
 the template at emails/templates/emails/staff-test.txt, and will have
 subject "This is a test".
-    '''.strip()
-
-    recipients = {
-        'admins': User.objects.filter(email_addr__in=os.environ.get('ADMINS', '').split(',')),
-        'staff': User.objects.filter(is_staff=True),
-        'all': User.objects.all(),
-        'ticket-holders': User.objects.exclude(ticket=None),
-        'ticket-holders-without-accommodation': User.objects.exclude(ticket=None).exclude(has_booked_hotel=True),
-        'cfp-proposers': User.objects.filter(
-            proposals__isnull=False,
-            proposals__special_reply_required=False,
-        ).distinct(),
-        'grant-applicants-without-cfp-proposal': User.objects.filter(
-            grant_application__isnull=False,
-            grant_application__special_reply_required=False,
-            proposals__isnull=True,
-        ).distinct(),
-        'grant-applicants-with-funds-offered': User.objects.filter(
-            grant_application__amount_offered__gt=0,
-        ),
-        'speakers': User.objects.filter(
-            proposals__state='accepted',
-        ).distinct(),
-        'speakers-without-tickets': User.objects.filter(
-            proposals__state='accepted',
-            ticket__isnull=True
-        ).distinct(),
-        'talk-speakers': User.objects.filter(
-            proposals__state='accepted',
-            proposals__session_type='talk',
-        ).distinct(),
-        'workshop-speakers': User.objects.filter(
-            proposals__state='accepted',
-            proposals__session_type='workshop',
-        ).distinct(),
-        'poster-speakers': User.objects.filter(
-            proposals__state='accepted',
-            proposals__session_type='poster',
-        ).distinct(),
-        'accepted-speakers-seeking-mentors': User.objects.filter(
-            proposals__state='accepted',
-            proposals__would_like_mentor=True,
-        ).distinct(),
-        'contributors': User.objects.filter(is_contributor=True),
-        'contributors-without-dinner-booking': User.objects.filter(
-            is_contributor=True,
-            dinner_bookings__isnull=True,
-        ),
-        'ticket-holders-who-are-not-contributors': User.objects.exclude(ticket=None).filter(is_contributor=False),
-        'ticket-holders-with-incomplete-name': User.objects.filter(ticket__isnull=False).exclude(name__contains=' '),
-        'accommodation-guests': User.objects.filter(booking__isnull=False),
-        'possible-vegans': User.objects.filter(
-            dinner_bookings__starter='courgette',
-            dinner_bookings__main='stew',
-        )
-    }
+
+The recipients are given as a segment expression, which names segments and
+conditions on users and the things they have, combined with &, |, and !.  For
+instance:
+
+    --recipients 'ticket-holders & !contributors & proposal.state=accepted'
+
+See emails/segments.py for the syntax.  The named segments are:
+
+{segments}
+
+--count prints how many users are in the segment, and --explain prints the
+query plan for finding them, without rendering or sending anything.
+
+Each email is rendered once, into a spool file with one JSON object per line,
+before any are sent.  With --dry-run, the spool is written but nothing is
+sent, so that the rendered emails can be inspected.
+
+Each email that is sent is recorded against the run, whose id is printed when
+sending starts.  If the run stops partway through, or some emails fail to be
+sent, it can be resumed with:
+
+$ ./manage.py sendbulkemail --resume RUN_ID
+
+which sends the email to the recipients who have not yet been sent it.
+    '''.strip().format(segments='\n'.join(f' * {name}' for name in segments.SEGMENTS))
 
     def create_parser(self, *args, **kwargs):
         parser = super(Command, self).create_parser(*args, **kwargs)
@@ -88,39 +57,86 @@ subject "This is a test".
         return parser
 
     def add_arguments(self, parser):
-        parser.add_argument('--template', required=True, help='Base name of template file')
-        parser.add_argument('--subject', required=True, help='Subject of email')
-        parser.add_argument('--recipients', required=True, choices=self.recipients, help='Recipients of email')
+        parser.add_argument('--template', help='Base name of template file')
+        parser.add_argument('--subject', help='Subject of email')
+        parser.add_argument('--recipients', help='Segment expression describing recipients of email')
+        parser.add_argument('--resume', type=int, metavar='RUN_ID', help='Resume an earlier run, sending to recipients who have not yet been sent the email')
         parser.add_argument('--list-recipients', action='store_true', help='If provided, lists recipients before sending')
-        parser.add_argument('--dry-run', action='store_true')
-
-    def handle(self, *args, template, subject, recipients, list_recipients, dry_run, **kwargs):
-        template = get_template(f'emails/{template}.txt')
+        parser.add_argument('--count', action='store_true', help='If provided, prints the number of recipients and stops')
+        parser.add_argument('--explain', action='store_true', help='If provided, prints the query plan for finding recipients and stops')
+        parser.add_argument('--dry-run', action='store_true', help='If provided, renders the emails to the spool without sending them')
+        parser.add_argument('--spool', help='Path of file to render emails to (default: a new file in the temporary directory)')
+        parser.add_argument('--processes', type=int, default=None, help='Number of processes to render emails in (default: one per CPU)')
+        bulk_mail.add_arguments(parser)
+
+    def handle(self, *args, template, subject, recipients, resume, list_recipients, count, explain, dry_run, spool, processes, workers, rate, **kwargs):
+        previewing = count or explain
+
+        if resume is None:
+            if not recipients:
+                raise CommandError('--recipients is required, unless resuming a run with --resume')
+            if not previewing and not (template and subject):
+                raise CommandError('--template and --subject are required, unless resuming a run with --resume')
+            run = None
+        else:
+            if template or subject or recipients:
+                raise CommandError('--template, --subject and --recipients are taken from the run being resumed, and cannot be given')
+            try:
+                run = BulkMailRun.objects.get(id=resume)
+            except BulkMailRun.DoesNotExist:
+                raise CommandError(f'There is no run {resume}')
+            template, subject, recipients = run.template, run.subject, run.recipients
+            self.stdout.write(f'Resuming run {run.id}, which has sent the email to {run.num_sent()} recipient(s)')
+
+        if not previewing:
+            # Make sure that the template exists before loading any recipients.
+            template_name = f'emails/{template}.txt'
+            get_template(template_name)
+
+        segment = recipients
+        try:
+            recipients = segments.users(segment)
+        except segments.InvalidSegment as e:
+            raise CommandError(str(e))
+        if run is not None:
+            recipients = run.exclude_sent(recipients)
+
+        if explain:
+            self.stdout.write(segments.explain(recipients))
+            return
 
-        recipients = self.recipients[recipients]
         num_recipients = recipients.count()
 
+        if count:
+            self.stdout.write(f'There are {num_recipients} recipient(s)')
+            return
+
         if dry_run:
             self.stdout.write('This is a dry run')
             self.stdout.write(f'Running this would send the email to {num_recipients} recipient(s)')
         else:
             self.stdout.write(f'About to send the email to {num_recipients} recipient(s)')
 
-        for recipient in recipients.order_by('email_addr'):
-            if list_recipients:
-                if dry_run:
-                    self.stdout.write('~' * 80)
+        if list_recipients:
+            for recipient in recipients.order_by('email_addr'):
                 self.stdout.write(f' * {recipient.name} ({recipient.email_addr})')
 
-            # Here, we are making sure that template.render() raises no errors,
-            # *before* we start to send any emails.
-            context = {'recipient': recipient, 'settings': settings}
-            body = render(template, context)
-            assert 'THIS SHOULD NEVER HAPPEN' not in body, f'Could not render template for {recipient.email_addr}'
-            if dry_run:
-                self.stdout.write(body)
+        # Every email is rendered, and so checked, *before* we start to send
+        # any of them.  The rendered emails are then sent from the spool.
+        spool_path = spool or email_spool.default_path(template)
+        messages = (
+            (recipient.user_id, recipient.email_addr, f'{subject} | {recipient.user_id}', {'recipient': recipient})
+            for recipient in recipients.order_by('id')
+        )
 
-        if dry_run:
+        try:
+            num_messages = email_spool.write(spool_path, template_name, messages, processes=processes)
+        except email_spool.InvalidMessages as e:
+            raise CommandError(f'{e} (see {spool_path})')
+
+        self.stdout.write(f'Rendered {num_messages} email(s) to {spool_path}')
+
+        if dry_run or num_messages == 0:
             return
 
         self.stdout.write('Are you sure? [yN]')
@@ -133,25 +149,21 @@ subject "This is a test".
             elif rsp in ['y', 'Y']:
                 break
 
-        self.stdout.write(f'Sending {num_recipients} email(s)')
-        logger.info('sending bulk email', template=template.template.name, num_recipients=num_recipients)
-
-        for recipient in recipients.order_by('id'):
-            context = {'recipient': recipient, 'settings': settings}
-            body = render(template, context)
-            qualified_subject = f'{subject} | {recipient.user_id}'
-            logger.info('sending email', recipient=recipient.id, email_addr=recipient.email_addr)
-            send_mail(
-                qualified_subject,
-                body,
-                recipient.email_addr,
-            )
-
-
-def render(template, context):
-    body = template.render(context)
-    body = '\n'.join(line.lstrip() for line in body.splitlines())
-    body = re.sub(r'\n\n+', '\n\n', body)
-    body = body.replace('&#39;', "'")
-    body = body.replace('&amp;', '&')
-    return body
+        if run is None:
+            run = BulkMailRun.objects.create(template=template, subject=subject, recipients=segment)
+
+        self.stdout.write(f'Sending {num_messages} email(s) in run {run.id}')
+        logger.info('sending bulk email', run=run.id, template=template_name, num_recipients=num_messages, spool=spool_path)
+
+        def mails():
+            for message in email_spool.read(spool_path):
+                logger.info('sending email', recipient=message.key, email_addr=message.to_addr)
+                yield (*message.as_mail(), message.key)
+
+        mailer = bulk_mail.BulkMailer(num_workers=workers, rate=rate, progress=lambda progress: self.stdout.write(str(progress)))
+        with Journal(run) as journal:
+            progress = mailer.send(mails(), total=num_messages, on_result=journal.record)
+        self.stdout.write(str(progress))
+
+        if progress.num_failed:
+            self.stdout.write(f'To retry sending to the recipients that failed, run with --resume {run.id}')
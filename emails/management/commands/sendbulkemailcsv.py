@@ -1,11 +1,11 @@
 import csv
-import re
 
 from django.conf import settings
 from django.core.management import BaseCommand
 from django.template.loader import get_template
 
-from ironcage.emails import send_mail
+from emails.spool import render
+from ironcage import bulk_mail
 
 
 class Command(BaseCommand):
@@ -35,8 +35,9 @@ will have subject "This is a test".
         parser.add_argument('--subject', required=True, help='Subject of email')
         parser.add_argument('--recipients', required=True, help='Path to CSV file of recipients')
         parser.add_argument('--dry-run', action='store_true')
+        bulk_mail.add_arguments(parser)
 
-    def handle(self, *args, template, subject, recipients, dry_run, **kwargs):
+    def handle(self, *args, template, subject, recipients, dry_run, workers, rate, **kwargs):
         settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
         template = get_template(f'emails/{template}.txt')
@@ -75,20 +76,11 @@ will have subject "This is a test".
 
         self.stdout.write(f'Sending {num_recipients} email(s)')
 
-        for recipient in recipients:
-            body = render(template, recipient)
-            qualified_subject = subject
-            send_mail(
-                qualified_subject,
-                body,
-                recipient['email_addr'],
-            )
-
-
-def render(template, context):
-    body = template.render(context)
-    body = '\n'.join(line.lstrip() for line in body.splitlines())
-    body = re.sub(r'\n\n+', '\n\n', body)
-    body = body.replace('&#39;', "'")
-    body = body.replace('&amp;', '&')
-    return body
+        mails = (
+            (subject, render(template, recipient), recipient['email_addr'])
+            for recipient in recipients
+        )
+
+        mailer = bulk_mail.BulkMailer(num_workers=workers, rate=rate, progress=lambda progress: self.stdout.write(str(progress)))
+        progress = mailer.send(mails, total=num_recipients)
+        self.stdout.write(str(progress))
@@ -1,10 +1,9 @@
-import re
-
 from django.conf import settings
 from django.core.management import BaseCommand
 from django.template.loader import get_template
 
-from ironcage.emails import send_mail
+from emails.spool import render
+from ironcage import bulk_mail
 from tickets.models import TicketInvitation
 
 import structlog
@@ -16,11 +15,12 @@ class Command(BaseCommand):
         parser.add_argument('--template', required=True, help='Base name of template file')
         parser.add_argument('--subject', required=True, help='Subject of email')
         parser.add_argument('--dry-run', action='store_true')
+        bulk_mail.add_arguments(parser)
 
-    def handle(self, *args, template, subject, dry_run, **kwargs):
+    def handle(self, *args, template, subject, dry_run, workers, rate, **kwargs):
         template = get_template(f'emails/{template}.txt')
 
-        invitations = TicketInvitation.objects.filter(status='unclaimed')
+        invitations = TicketInvitation.objects.filter(status='unclaimed').select_related('ticket')
         num_recipients = len(invitations)
 
         for invitation in invitations:
@@ -49,22 +49,14 @@ class Command(BaseCommand):
 
         logger.info('sending ticket reminder', template=template.template.name, num_recipients=num_recipients)
 
-        for invitation in invitations:
-            context = {'invitation': invitation, 'settings': settings}
-            body = render(template, context)
-            qualified_subject = f'{subject} | {invitation.ticket.ticket_id}'
-            logger.info('sending email', email_addr=invitation.email_addr)
-            send_mail(
-                qualified_subject,
-                body,
-                invitation.email_addr,
-            )
-
-
-def render(template, context):
-    body = template.render(context)
-    body = '\n'.join(line.lstrip() for line in body.splitlines())
-    body = re.sub(r'\n\n+', '\n\n', body)
-    body = body.replace('&#39;', "'")
-    body = body.replace('&amp;', '&')
-    return body
+        def mails():
+            for invitation in invitations:
+                context = {'invitation': invitation, 'settings': settings}
+                body = render(template, context)
+                qualified_subject = f'{subject} | {invitation.ticket.ticket_id}'
+                logger.info('sending email', email_addr=invitation.email_addr)
+                yield qualified_subject, body, invitation.email_addr
+
+        mailer = bulk_mail.BulkMailer(num_workers=workers, rate=rate, progress=lambda progress: self.stdout.write(str(progress)))
+        progress = mailer.send(mails(), total=num_recipients)
+        self.stdout.write(str(progress))
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import models
+
+
+class BulkMailRun(models.Model):
+    '''A run of sendbulkemail.
+
+    Each email sent in the run is recorded as a BulkMailDelivery, so that if a
+    run stops partway through, it can be resumed with `manage.py sendbulkemail
+    --resume RUN_ID` without sending to anybody twice.
+    '''
+
+    template = models.CharField(max_length=200)
+    subject = models.CharField(max_length=400)
+    recipients = models.TextField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.template} to {self.recipients} ({self.id})'
+
+    def exclude_sent(self, recipients):
+        '''Return the users in the recipients queryset that have not been sent
+        the email in this run.'''
+
+        # This is a single subquery, which uses the index on deliveries to
+        # find the recipients that have been sent the email, rather than an
+        # annotation that would be evaluated for every user.
+        sent = self.deliveries.filter(status='sent').values('recipient_id')
+        return recipients.exclude(pk__in=sent)
+
+    def num_sent(self):
+        return self.deliveries.filter(status='sent').count()
+
+
+class BulkMailDelivery(models.Model):
+    '''An attempt to send an email to one recipient in a BulkMailRun.
+
+    There may be several for a recipient, if sending failed and the run was
+    resumed.
+    '''
+
+    run = models.ForeignKey(BulkMailRun, related_name='deliveries', on_delete=models.CASCADE)
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='bulk_mail_deliveries', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10)
+    message_id = models.CharField(max_length=200, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = [['run', 'recipient', 'status']]
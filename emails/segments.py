@@ -0,0 +1,294 @@
+'''Segments of users to send bulk emails to.
+
+A segment is described by an expression like:
+
+    ticket-holders & !contributors & proposal.state=accepted
+
+which is compiled to a Q object for filtering users.  An expression is made of:
+
+ * the name of a segment defined in SEGMENTS, such as ticket-holders
+ * a condition on a field of the user, such as user.is_contributor=true
+ * a condition on a field of something that belongs to the user, such as
+   proposal.state=accepted, which matches users with at least one accepted
+   proposal
+ * several conditions that must all be met by the same thing, such as
+   proposal(state=accepted, session_type=talk), or just proposal() to match
+   users with any proposal
+ * expressions combined with & (and), | (or), and ! (not), and grouped with
+   parentheses
+
+Conditions can use =, !=, <, <=, >, and >=.  Values can be quoted with single
+or double quotes if they contain anything other than letters, digits, and
+@.+:_-.  Boolean fields take true or false.
+
+Conditions on related things are compiled to subqueries, like:
+
+    WHERE id IN (SELECT proposer_id FROM cfp_proposal WHERE state = 'accepted')
+
+which Postgres runs as a semi-join, so that a user matches at most once and
+the query never needs DISTINCT, however many conditions are combined.
+'''
+
+import os
+import re
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection, models
+from django.db.models import Q
+
+from accommodation.models import Booking as AccommodationBooking
+from accounts.models import User
+from cfp.models import Proposal
+from dinners.models import Booking as DinnerBooking
+from grants.models import Application
+from tickets.models import Order, Ticket
+
+
+# The things that can be named in conditions, with the field on each that
+# refers to the user they belong to
+RELATIONS = {
+    'user': (User, None),
+    'ticket': (Ticket, 'owner'),
+    'order': (Order, 'purchaser'),
+    'proposal': (Proposal, 'proposer'),
+    'grant-application': (Application, 'applicant'),
+    'dinner-booking': (DinnerBooking, 'guest'),
+    'accommodation-booking': (AccommodationBooking, 'guest'),
+}
+
+LOOKUPS = {
+    '=': 'exact',
+    '!=': 'exact',
+    '<': 'lt',
+    '<=': 'lte',
+    '>': 'gt',
+    '>=': 'gte',
+}
+
+
+# Each value is either an expression, or a function returning a Q object for
+# segments that can't be written as expressions.  Expressions may refer to
+# segments defined before them.
+SEGMENTS = {
+    'all': lambda: Q(),
+    'admins': lambda: Q(email_addr__in=os.environ.get('ADMINS', '').split(',')),
+    'staff': 'user.is_staff=true',
+    'ticket-holders': 'ticket()',
+    'ticket-holders-without-accommodation': 'ticket-holders & !user.has_booked_hotel=true',
+    'cfp-proposers': 'proposal(special_reply_required=false)',
+    'grant-applicants-without-cfp-proposal': 'grant-application(special_reply_required=false) & !proposal()',
+    'grant-applicants-with-funds-offered': 'grant-application.amount_offered>0',
+    'speakers': 'proposal.state=accepted',
+    'speakers-without-tickets': 'speakers & !ticket-holders',
+    'talk-speakers': 'proposal(state=accepted, session_type=talk)',
+    'workshop-speakers': 'proposal(state=accepted, session_type=workshop)',
+    'poster-speakers': 'proposal(state=accepted, session_type=poster)',
+    'accepted-speakers-seeking-mentors': 'proposal(state=accepted, would_like_mentor=true)',
+    'contributors': 'user.is_contributor=true',
+    'contributors-without-dinner-booking': 'contributors & !dinner-booking()',
+    'ticket-holders-who-are-not-contributors': 'ticket-holders & !contributors',
+    'ticket-holders-with-incomplete-name': lambda: compile_segment('ticket-holders') & ~Q(name__contains=' '),
+    'accommodation-guests': 'accommodation-booking()',
+    'possible-vegans': 'dinner-booking(starter=courgette, main=stew)',
+}
+
+
+class InvalidSegment(Exception):
+    pass
+
+
+def compile_segment(expression):
+    '''Return a Q object for filtering users in the segment described by
+    expression, or raise InvalidSegment.'''
+
+    return _Parser(expression).parse()
+
+
+def users(expression):
+    '''Return a queryset of the users in the segment described by
+    expression.'''
+
+    return User.objects.filter(compile_segment(expression))
+
+
+def explain(queryset):
+    '''Return Postgres's plan for running queryset, as a string.'''
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+_NAME_RE = re.compile(r'[a-z][a-z0-9_-]*', re.IGNORECASE)
+_FIELD_RE = re.compile(r'[a-z][a-z0-9_]*', re.IGNORECASE)
+_OPERATOR_RE = re.compile(r'!=|<=|>=|=|<|>')
+_VALUE_RE = re.compile(r'"([^"]*)"|\'([^\']*)\'|([\w@.+:-]+)')
+
+
+class _Parser:
+    '''A recursive descent parser for the grammar:
+
+        expression := term ('|' term)*
+        term       := factor ('&' factor)*
+        factor     := '!' factor | '(' expression ')' | atom
+        atom       := relation '.' condition
+                    | relation '(' [condition (',' condition)*] ')'
+                    | segment
+        condition  := field operator value
+
+    which builds a Q object as it goes.
+    '''
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.pos = 0
+
+    def parse(self):
+        q = self.parse_expression()
+        self.skip_space()
+        if self.pos < len(self.expression):
+            self.fail('Expected & or | or end of expression')
+        return q
+
+    def parse_expression(self):
+        q = self.parse_term()
+        while self.accept('|'):
+            q = q | self.parse_term()
+        return q
+
+    def parse_term(self):
+        q = self.parse_factor()
+        while self.accept('&'):
+            q = q & self.parse_factor()
+        return q
+
+    def parse_factor(self):
+        if self.accept('!'):
+            return ~self.parse_factor()
+
+        if self.accept('('):
+            q = self.parse_expression()
+            self.expect(')')
+            return q
+
+        return self.parse_atom()
+
+    def parse_atom(self):
+        start = self.pos
+        name = self.expect_re(_NAME_RE, 'Expected a segment or a condition')
+
+        if self.accept('.'):
+            relation = self.relation(name, start)
+            return self.relation_q(relation, [self.parse_condition(name, relation)])
+
+        if self.accept('('):
+            relation = self.relation(name, start)
+            conditions = []
+            if not self.accept(')'):
+                conditions.append(self.parse_condition(name, relation))
+                while self.accept(','):
+                    conditions.append(self.parse_condition(name, relation))
+                self.expect(')')
+            return self.relation_q(relation, conditions)
+
+        if name not in SEGMENTS:
+            self.fail(f'Unknown segment: {name}', start)
+
+        segment = SEGMENTS[name]
+        if callable(segment):
+            return segment()
+        return compile_segment(segment)
+
+    def parse_condition(self, relation_name, relation):
+        model = relation[0]
+
+        start = self.pos
+        field_name = self.expect_re(_FIELD_RE, 'Expected a field')
+        try:
+            field = model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            field = None
+        if field is None or not field.concrete or field.is_relation:
+            self.fail(f'Unknown field: {relation_name}.{field_name}', start)
+
+        operator = self.expect_re(_OPERATOR_RE, 'Expected an operator')
+
+        start = self.pos
+        self.skip_space()
+        match = _VALUE_RE.match(self.expression, self.pos)
+        if match is None:
+            self.fail('Expected a value')
+        self.pos = match.end()
+        value = self.to_python(field, next(group for group in match.groups() if group is not None), start)
+
+        q = Q(**{f'{field_name}__{LOOKUPS[operator]}': value})
+        if operator == '!=':
+            q = ~q
+        return q
+
+    def relation(self, name, start):
+        if name not in RELATIONS:
+            self.fail(f'Unknown relation: {name}', start)
+        return RELATIONS[name]
+
+    def relation_q(self, relation, conditions):
+        model, user_field = relation
+
+        q = Q()
+        for condition in conditions:
+            q &= condition
+
+        if user_field is None:
+            return q
+
+        # Rows that don't belong to a user are excluded, since a NULL in the
+        # subquery would make NOT IN match nobody.
+        if model._meta.get_field(user_field).null:
+            q &= Q(**{f'{user_field}__isnull': False})
+
+        return Q(pk__in=model.objects.filter(q).values(user_field))
+
+    def to_python(self, field, value, start):
+        if isinstance(field, (models.BooleanField, models.NullBooleanField)):
+            try:
+                return {'true': True, 'false': False}[value.lower()]
+            except KeyError:
+                self.fail(f'Expected true or false for {field.name}', start)
+
+        try:
+            return field.to_python(value)
+        except ValidationError:
+            self.fail(f'Invalid value for {field.name}: {value}', start)
+
+    def skip_space(self):
+        while self.pos < len(self.expression) and self.expression[self.pos].isspace():
+            self.pos += 1
+
+    def accept(self, token):
+        self.skip_space()
+        if self.expression.startswith(token, self.pos):
+            self.pos += len(token)
+            return True
+        return False
+
+    def expect(self, token):
+        if not self.accept(token):
+            self.fail(f'Expected {token}')
+
+    def expect_re(self, regex, message):
+        self.skip_space()
+        match = regex.match(self.expression, self.pos)
+        if match is None:
+            self.fail(message)
+        self.pos = match.end()
+        return match.group()
+
+    def fail(self, message, pos=None):
+        if pos is None:
+            pos = self.pos
+        else:
+            # pos may be before whitespace that was skipped
+            while pos < len(self.expression) and self.expression[pos].isspace():
+                pos += 1
+        raise InvalidSegment(f'{message} at position {pos + 1} of "{self.expression}"')
@@ -0,0 +1,171 @@
+'''Spools of rendered bulk emails.
+
+Rendering a template for every recipient is the slow part of sending a bulk
+email, and it has to be done in full before anything is sent, so that a broken
+template doesn't leave half the recipients with an email.  Rather than render
+everything once to check it and again to send it, each email is rendered once
+into a spool: a JSON Lines file with one rendered message per line, keyed by
+recipient.  The spool can be inspected after a dry run, and is streamed to the
+mail server when the email is sent.
+
+Rendering is spread across a pool of processes.  Each message's context is
+pickled and sent to a worker process, which loads the template itself and
+makes any database queries that the template needs over its own connection.
+'''
+
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+
+import structlog
+logger = structlog.get_logger()
+
+
+# Templates include this when they are missing something they need
+SENTINEL = 'THIS SHOULD NEVER HAPPEN'
+
+# How many messages are sent to a worker process at a time
+CHUNK_SIZE = 20
+
+
+class Message(namedtuple('Message', ['key', 'to_addr', 'subject', 'body'])):
+    def as_mail(self):
+        '''Return the (subject, message, to_addr) tuple that a BulkMailer
+        sends.'''
+
+        return self.subject, self.body, self.to_addr
+
+
+class InvalidMessages(Exception):
+    def __init__(self, keys):
+        super().__init__(f'Could not render template for {", ".join(str(key) for key in keys)}')
+        self.keys = keys
+
+
+def default_path(template_name):
+    '''Create an empty spool that only the current user can read, since it
+    will contain personal details, and return its path.'''
+
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    fd, path = tempfile.mkstemp(prefix=f'{template_name}-{timestamp}-', suffix='.jsonl')
+    os.close(fd)
+    return path
+
+
+def write(path, template_name, messages, processes=None):
+    '''Render messages into a spool at path, and return the number rendered.
+
+    messages is an iterable of (key, to_addr, subject, context) tuples.  Each
+    context must be picklable, and is rendered with the template at
+    template_name, with settings added.  The messages are written in the
+    order that they are given.
+
+    If any message contains SENTINEL, InvalidMessages is raised with their
+    keys, once all messages have been rendered.  The spool is kept, so that
+    the invalid messages can be inspected.
+    '''
+
+    if processes is None:
+        processes = settings.BULK_MAIL_RENDER_PROCESSES or os.cpu_count()
+
+    # The messages are loaded here, before any worker processes are started,
+    # so that any database queries needed to build them are made in this
+    # process, and not in the pool's thread that hands out work.
+    args = [(template_name, *message) for message in messages]
+
+    num_written = 0
+    invalid_keys = []
+
+    with open(path, 'w') as f, _starmapper(processes) as starmap:
+        for message in starmap(_render_message, args):
+            json.dump(message._asdict(), f)
+            f.write('\n')
+            num_written += 1
+
+            if SENTINEL in message.body:
+                invalid_keys.append(message.key)
+
+    logger.info('bulk_mail_spooled', path=path, template=template_name, num_messages=num_written, processes=processes)
+
+    if invalid_keys:
+        raise InvalidMessages(invalid_keys)
+
+    return num_written
+
+
+def read(path):
+    '''Yield the Messages in the spool at path, one line at a time.'''
+
+    with open(path) as f:
+        for line in f:
+            yield Message(**json.loads(line))
+
+
+def count(path):
+    with open(path) as f:
+        return sum(1 for _ in f)
+
+
+class _starmapper:
+    '''Context manager giving a function like itertools.starmap() that runs
+    either in this process, or in a pool of worker processes.'''
+
+    def __init__(self, processes):
+        self.processes = processes
+        self.pool = None
+
+    def __enter__(self):
+        if self.processes <= 1:
+            return itertools.starmap
+
+        # Worker processes are forked, and must not share this process's
+        # database connections, so these are closed first.  Django reopens
+        # them when they are next needed.
+        connections.close_all()
+        self.pool = multiprocessing.Pool(self.processes)
+        return lambda fn, iterable: self.pool.imap(_Star(fn), iterable, chunksize=CHUNK_SIZE)
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+
+class _Star:
+    '''Picklable equivalent of lambda args: fn(*args).'''
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __call__(self, args):
+        return self.fn(*args)
+
+
+def _render_message(template_name, key, to_addr, subject, context):
+    context = {'settings': settings, **context}
+    body = render(_get_template(template_name), context)
+    return Message(key, to_addr, subject, body)
+
+
+@lru_cache()
+def _get_template(template_name):
+    return get_template(template_name)
+
+
+def render(template, context):
+    body = template.render(context)
+    body = '\n'.join(line.lstrip() for line in body.splitlines())
+    body = re.sub(r'\n\n+', '\n\n', body)
+    body = body.replace('&#39;', "'")
+    body = body.replace('&amp;', '&')
+    return body
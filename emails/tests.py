@@ -1,13 +1,34 @@
+import os
+import tempfile
+
 from django.core import mail
-from django.core.management import call_command
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.test.utils import captured_stdin
 from django.utils.six import StringIO
 
+from accounts.models import User
 from accounts.tests import factories as accounts_factories
+from cfp.tests import factories as cfp_factories
+from grants.tests import factories as grants_factories
+from tickets.tests import factories as tickets_factories
+
+from emails import segments, spool
+from emails.models import BulkMailRun
+
+
+class SpoolTestMixin:
+    def setUp(self):
+        super().setUp()
+        fd, self.spool_path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.spool_path)
+        super().tearDown()
 
 
-class SendBulkEmailTests(TestCase):
+class SendBulkEmailTests(SpoolTestMixin, TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.alice = accounts_factories.create_staff_user(name='Alice', email_addr='alice@example.com')
@@ -20,16 +41,24 @@ class SendBulkEmailTests(TestCase):
             'sendbulkemail',
             '--recipients=staff',
             '--template=staff-test',
-            '--subject="This is a test"',
+            '--subject=This is a test',
             '--dry-run',
+            f'--spool={self.spool_path}',
             stdout=stdout,
         )
 
         self.assertIn('This is a dry run', stdout.getvalue())
         self.assertIn('Running this would send the email to 2 recipient(s)', stdout.getvalue())
+        self.assertIn(f'Rendered 2 email(s) to {self.spool_path}', stdout.getvalue())
 
         self.assertEqual(len(mail.outbox), 0)
 
+        messages = list(spool.read(self.spool_path))
+        self.assertEqual([message.to_addr for message in messages], ['alice@example.com', 'bob@example.com'])
+        self.assertEqual(messages[0].key, self.alice.user_id)
+        self.assertEqual(messages[0].subject, f'This is a test | {self.alice.user_id}')
+        self.assertIn('Hi Alice', messages[0].body)
+
     def test_wet_run(self):
         stdout = StringIO()
         with captured_stdin() as stdin:
@@ -41,11 +70,13 @@ class SendBulkEmailTests(TestCase):
                 '--recipients=staff',
                 '--template=staff-test',
                 '--subject=This is a test',
+                f'--spool={self.spool_path}',
                 stdout=stdout,
             )
 
         self.assertIn('About to send the email to 2 recipient(s)', stdout.getvalue())
         self.assertIn('Sending 2 email(s)', stdout.getvalue())
+        self.assertIn('Sent 2 of 2 email(s), with 0 failure(s)', stdout.getvalue())
 
         self.assertEqual(len(mail.outbox), 2)
         email = mail.outbox[0]
@@ -53,3 +84,246 @@ class SendBulkEmailTests(TestCase):
         self.assertEqual(email.from_email, 'PyCon UK 2017 <noreply@pyconuk.org>')
         self.assertEqual(email.subject, f'This is a test | {self.alice.user_id}')
         self.assertIn('Hi Alice', email.body)
+
+        run = BulkMailRun.objects.get()
+        self.assertEqual((run.template, run.subject, run.recipients), ('staff-test', 'This is a test', 'staff'))
+        self.assertIn(f'Sending 2 email(s) in run {run.id}', stdout.getvalue())
+
+        deliveries = run.deliveries.order_by('recipient_id')
+        self.assertEqual([delivery.status for delivery in deliveries], ['sent', 'sent'])
+        self.assertEqual(deliveries[0].recipient, self.alice)
+        self.assertEqual(deliveries[0].message_id, email.extra_headers['Message-ID'])
+
+    def send(self, *args):
+        stdout = StringIO()
+        with captured_stdin() as stdin:
+            stdin.write('Y\n')
+            stdin.seek(0)
+            call_command('sendbulkemail', *args, f'--spool={self.spool_path}', stdout=stdout)
+        return stdout.getvalue()
+
+    def test_resume(self):
+        carol = accounts_factories.create_staff_user(name='Carol', email_addr='carol@example.org')
+
+        with override_settings(EMAIL_BACKEND='ironcage.tests.test_bulk_mail.FailingEmailBackend'):
+            output = self.send('--recipients=staff', '--template=staff-test', '--subject=This is a test')
+
+        run = BulkMailRun.objects.get()
+        self.assertIn('Sent 2 of 3 email(s), with 1 failure(s)', output)
+        self.assertIn(f'run with --resume {run.id}', output)
+        self.assertEqual(run.num_sent(), 2)
+        self.assertEqual(run.deliveries.get(status='failed').recipient, carol)
+
+        mail.outbox = []
+        output = self.send(f'--resume={run.id}')
+
+        self.assertIn(f'Resuming run {run.id}, which has sent the email to 2 recipient(s)', output)
+        self.assertIn('About to send the email to 1 recipient(s)', output)
+        self.assertEqual([email.to for email in mail.outbox], [['carol@example.org']])
+        self.assertEqual(mail.outbox[0].subject, f'This is a test | {carol.user_id}')
+        self.assertEqual(run.num_sent(), 3)
+        self.assertEqual(run.deliveries.count(), 4)
+
+        mail.outbox = []
+        output = self.send(f'--resume={run.id}')
+
+        self.assertIn('About to send the email to 0 recipient(s)', output)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_resume_unknown_run(self):
+        with self.assertRaisesMessage(CommandError, 'There is no run 123'):
+            call_command('sendbulkemail', '--resume=123', '--dry-run')
+
+    def test_resume_with_template(self):
+        run = BulkMailRun.objects.create(template='staff-test', subject='This is a test', recipients='staff')
+        with self.assertRaises(CommandError):
+            call_command('sendbulkemail', f'--resume={run.id}', '--template=staff-test', '--dry-run')
+
+    def test_missing_arguments(self):
+        with self.assertRaises(CommandError):
+            call_command('sendbulkemail', '--template=staff-test', '--dry-run')
+
+    def test_segment_expression(self):
+        output = self.send('--recipients=staff & !user.name=Bob', '--template=staff-test', '--subject=This is a test')
+
+        self.assertIn('About to send the email to 1 recipient(s)', output)
+        self.assertEqual([email.to for email in mail.outbox], [['alice@example.com']])
+        self.assertEqual(BulkMailRun.objects.get().recipients, 'staff & !user.name=Bob')
+
+    def test_invalid_segment(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown segment: stuff'):
+            call_command('sendbulkemail', '--recipients=stuff', '--template=staff-test', '--subject=This is a test', '--dry-run')
+
+    def test_count(self):
+        stdout = StringIO()
+        call_command('sendbulkemail', '--recipients=staff', '--count', stdout=stdout)
+
+        self.assertEqual(stdout.getvalue(), 'There are 2 recipient(s)\n')
+        self.assertFalse(os.path.getsize(self.spool_path))
+
+    def test_explain(self):
+        stdout = StringIO()
+        call_command('sendbulkemail', '--recipients=ticket-holders & !staff', '--explain', stdout=stdout)
+
+        self.assertIn('tickets_ticket', stdout.getvalue())
+        self.assertNotIn('Unique', stdout.getvalue())
+
+
+class SegmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = accounts_factories.create_user(name='Alice', email_addr='alice@example.com', is_contributor=True)
+        tickets_factories.create_ticket(cls.alice)
+
+        cls.bob = accounts_factories.create_user(name='Bob', email_addr='bob@example.com')
+        tickets_factories.create_ticket(cls.bob)
+        cfp_factories.create_proposal(cls.bob, session_type='talk')
+        cfp_factories.create_proposal(cls.bob, session_type='poster')
+
+        cls.carol = accounts_factories.create_user(name='Carol', email_addr='carol@example.com', is_contributor=True)
+        cfp_factories.create_proposal(cls.carol, session_type='workshop')
+
+        cls.dave = accounts_factories.create_user(name='Dave', email_addr='dave@example.com')
+        cfp_factories.create_proposal(cls.dave, session_type='workshop')
+        cfp_factories.create_proposal(cls.dave, session_type='talk', state='rejected')
+        application = grants_factories.create_application(cls.dave)
+        application.amount_offered = 100
+        application.save()
+
+        cls.erin = accounts_factories.create_user(name='Erin', email_addr='erin@example.com')
+
+        # This ticket doesn't have an owner, and its purchaser doesn't have a
+        # ticket
+        ticket = tickets_factories.create_ticket_with_unclaimed_invitation()
+        cls.frank = ticket.order.purchaser
+
+    def assertSegment(self, expression, expected_users):
+        self.assertEqual(set(segments.users(expression)), set(expected_users))
+
+    def test_named_segment(self):
+        self.assertSegment('ticket-holders', [self.alice, self.bob])
+
+    def test_not(self):
+        self.assertSegment('!ticket-holders', [self.carol, self.dave, self.erin, self.frank])
+
+    def test_user_condition(self):
+        self.assertSegment('user.is_contributor=true', [self.alice, self.carol])
+        self.assertSegment('user.name!=Alice & user.is_contributor=true', [self.carol])
+
+    def test_quoted_value(self):
+        self.assertSegment('user.email_addr="bob@example.com" | user.name=\'Carol\'', [self.bob, self.carol])
+
+    def test_relation_condition(self):
+        self.assertSegment('proposal.state=accepted', [self.bob, self.carol, self.dave])
+
+    def test_conditions_on_same_row(self):
+        self.assertSegment('proposal.state=accepted & proposal.session_type=talk', [self.bob, self.dave])
+        self.assertSegment('proposal(state=accepted, session_type=talk)', [self.bob])
+
+    def test_any_row(self):
+        self.assertSegment('grant-application()', [self.dave])
+        self.assertSegment('!proposal() & !ticket()', [self.erin, self.frank])
+
+    def test_comparison(self):
+        self.assertSegment('grant-application.amount_offered>0', [self.dave])
+        self.assertSegment('grant-application.amount_offered>=101', [])
+
+    def test_combination(self):
+        self.assertSegment('ticket-holders & !contributors & proposal.state=accepted', [self.bob])
+        self.assertSegment('(contributors | speakers) & !ticket-holders', [self.carol, self.dave])
+        self.assertSegment('!(contributors | speakers)', [self.erin, self.frank])
+        self.assertSegment('!!contributors', [self.alice, self.carol])
+
+    def test_single_query_without_duplicates(self):
+        users = segments.users('speakers | talk-speakers | proposal.session_type=poster')
+
+        self.assertNotIn('DISTINCT', str(users.query))
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(user.name for user in users), ['Bob', 'Carol', 'Dave'])
+
+    def test_named_segments(self):
+        for name in segments.SEGMENTS:
+            with self.subTest(name=name):
+                list(segments.users(name))
+
+    def test_invalid_segments(self):
+        for expression, message in [
+            ('stuff', 'Unknown segment: stuff at position 1'),
+            ('staff & thing.name=x', 'Unknown relation: thing at position 9'),
+            ('proposal.colour=red', 'Unknown field: proposal.colour at position 10'),
+            ('proposal.proposer=1', 'Unknown field: proposal.proposer'),
+            ('user.is_staff=yes', 'Expected true or false for is_staff'),
+            ('grant-application.amount_offered>lots', 'Invalid value for amount_offered: lots'),
+            ('proposal.state', 'Expected an operator'),
+            ('proposal.state=', 'Expected a value'),
+            ('(staff | contributors', 'Expected )'),
+            ('staff contributors', 'Expected & or | or end of expression at position 7'),
+            ('', 'Expected a segment or a condition'),
+        ]:
+            with self.subTest(expression=expression):
+                with self.assertRaisesMessage(segments.InvalidSegment, message):
+                    segments.compile_segment(expression)
+
+
+class BulkMailRunTests(TestCase):
+    def test_exclude_sent(self):
+        alice = accounts_factories.create_user(email_addr='alice@example.com')
+        bob = accounts_factories.create_user(email_addr='bob@example.com')
+        carol = accounts_factories.create_user(email_addr='carol@example.com')
+        run = BulkMailRun.objects.create(template='staff-test', subject='This is a test', recipients='all')
+        other_run = BulkMailRun.objects.create(template='staff-test', subject='This is a test', recipients='all')
+        run.deliveries.create(recipient=alice, status='sent')
+        run.deliveries.create(recipient=bob, status='failed')
+        other_run.deliveries.create(recipient=carol, status='sent')
+
+        recipients = run.exclude_sent(User.objects.all())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(list(recipients.order_by('id')), [bob, carol])
+
+
+class SpoolTests(SpoolTestMixin, SimpleTestCase):
+    def build_messages(self, num_messages):
+        return [
+            (ix, f'attendee{ix}@example.com', 'This is a test', {'name': f'Attendee {ix}'})
+            for ix in range(num_messages)
+        ]
+
+    def test_write_and_read(self):
+        num_messages = spool.write(self.spool_path, 'emails/csv-test.txt', self.build_messages(3), processes=1)
+
+        self.assertEqual(num_messages, 3)
+        self.assertEqual(spool.count(self.spool_path), 3)
+
+        messages = list(spool.read(self.spool_path))
+        self.assertEqual([message.key for message in messages], [0, 1, 2])
+        self.assertEqual(messages[1].to_addr, 'attendee1@example.com')
+        self.assertTrue(messages[1].body.startswith('Hi Attendee 1,\n\nThis is a test email.'))
+        self.assertEqual(messages[1].as_mail(), ('This is a test', messages[1].body, 'attendee1@example.com'))
+
+    def test_write_in_processes(self):
+        spool.write(self.spool_path, 'emails/csv-test.txt', self.build_messages(50), processes=3)
+
+        messages = list(spool.read(self.spool_path))
+        self.assertEqual([message.key for message in messages], list(range(50)))
+        self.assertIn('Hi Attendee 49,', messages[49].body)
+
+    def test_invalid_messages(self):
+        messages = [
+            ('alice', 'alice@example.com', 'Grants', {'recipient': {'get_grant_application': {'special_reply_required': False}}}),
+            ('bob', 'bob@example.com', 'Grants', {'recipient': {'get_grant_application': {'special_reply_required': True}}}),
+        ]
+
+        with self.assertRaises(spool.InvalidMessages) as cm:
+            spool.write(self.spool_path, 'emails/grant-applications-notification.txt', messages, processes=1)
+
+        self.assertEqual(cm.exception.keys, ['bob'])
+        self.assertEqual(spool.count(self.spool_path), 2)
+
+    def test_default_path_can_only_be_read_by_owner(self):
+        path = spool.default_path('csv-test')
+        try:
+            self.assertTrue(os.path.basename(path).startswith('csv-test-'))
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        finally:
+            os.remove(path)
@@ -1,14 +1,15 @@
 from django.conf import settings
 from django.db import models
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 
-from tickets.constants import DAYS
+from tickets.days import DaysMixin
 
 from ironcage.utils import Scrambler
 
 
-class Application(models.Model):
+class Application(DaysMixin, models.Model):
     applicant = models.OneToOneField(settings.AUTH_USER_MODEL, related_name='grant_application', on_delete=models.CASCADE)
     amount_requested = models.IntegerField()
     would_like_ticket_set_aside = models.BooleanField()
@@ -22,11 +23,14 @@ class Application(models.Model):
     requested_ticket_only = models.BooleanField(default=False)
     special_reply_required = models.BooleanField(default=False)
 
-    id_scrambler = Scrambler(4000)
+    id_scrambler = Scrambler(4000, bits=settings.ID_SCRAMBLER_BITS)
 
     class Manager(models.Manager):
         def get_by_application_id_or_404(self, application_id):
-            id = self.model.id_scrambler.backward(application_id)
+            try:
+                id = self.model.id_scrambler.backward(application_id)
+            except ValueError:
+                raise Http404
             return get_object_or_404(self.model, pk=id)
 
     objects = Manager()
@@ -39,6 +43,3 @@ class Application(models.Model):
 
     def get_absolute_url(self):
         return reverse('grants:application', args=[self.application_id])
-
-    def days(self):
-        return [DAYS[day] for day in DAYS if getattr(self, day)]
@@ -9,7 +9,7 @@ from django.forms.models import model_to_dict
 from django.shortcuts import redirect, render
 from django.views.decorators.http import require_POST
 
-from tickets.constants import DAYS
+from tickets.days import DaySet
 
 from .forms import ApplicationForm
 from .models import Application
@@ -40,11 +40,7 @@ def new_application(request):
         form = ApplicationForm(request.POST)
         if form.is_valid():
             application = form.save(commit=False)
-            for day in DAYS:
-                if day in form.cleaned_data['days']:
-                    setattr(application, day, True)
-                else:
-                    setattr(application, day, False)
+            application.day_set = DaySet.from_days(form.cleaned_data['days'])
             application.applicant = request.user
             application.save()
             messages.success(request, 'Thank you for submitting your application')
@@ -83,17 +79,13 @@ def application_edit(request, application_id):
         form = ApplicationForm(request.POST, instance=application)
         if form.is_valid():
             application = form.save(commit=False)
-            for day in DAYS:
-                if day in form.cleaned_data['days']:
-                    setattr(application, day, True)
-                else:
-                    setattr(application, day, False)
+            application.day_set = DaySet.from_days(form.cleaned_data['days'])
             application.save()
             messages.success(request, 'Thank you for updating your application')
             return redirect(application)
     else:
         data = model_to_dict(application)
-        data['days'] = [day for day in DAYS if getattr(application, day)]
+        data['days'] = application.days_abbrev()
         form = ApplicationForm(data)
 
     context = {
@@ -0,0 +1,206 @@
+'''Sending a large number of mails quickly.
+
+send_mail() opens a new connection to the mail server for every mail, which
+for a mailshot to every attendee means a TCP and TLS handshake and a login
+per recipient, one after another.  A BulkMailer instead starts a number of
+worker threads, each of which keeps its own connection open while it sends,
+and shares a throttle so that together they send no more than a given number
+of mails per second.
+
+Mails are rendered by the caller, in the calling thread, and handed to the
+workers through a bounded queue, so that they don't all need to be held in
+memory at once and so that the workers never touch the database.  Likewise,
+the result of sending each mail is handed back to the calling thread, so that
+the caller can record it.
+'''
+
+from collections import namedtuple
+import queue
+from smtplib import SMTPServerDisconnected
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.message import DNS_NAME, make_msgid
+
+from .emails import build_mail
+
+import structlog
+logger = structlog.get_logger()
+
+
+class Progress(namedtuple('Progress', ['num_sent', 'num_failed', 'total', 'elapsed'])):
+    def rate(self):
+        if not self.elapsed:
+            return 0
+        return (self.num_sent + self.num_failed) / self.elapsed
+
+    def __str__(self):
+        return f'Sent {self.num_sent} of {self.total} email(s), with {self.num_failed} failure(s), in {self.elapsed:.1f}s ({self.rate():.1f}/s)'
+
+
+class Result(namedtuple('Result', ['mail', 'message_id', 'error'])):
+    @property
+    def sent(self):
+        return self.error is None
+
+
+class Throttle:
+    '''Spaces out calls to wait(), across threads, so that there are no more
+    than rate of them per second.  A rate of 0 means no limit.'''
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+
+        if at > now:
+            time.sleep(at - now)
+
+
+class BulkMailer:
+    '''Sends mails with a number of worker threads, each with a persistent
+    connection to the mail server.
+
+    If a mail can't be sent, it is logged and counted, and the rest are still
+    sent.  If the server drops a connection, the worker reconnects and tries
+    again once.
+    '''
+
+    def __init__(self, num_workers=None, rate=None, progress=None, progress_every=100, connection_kwargs=None):
+        self.num_workers = num_workers or settings.BULK_MAIL_WORKERS
+        self.rate = settings.BULK_MAIL_RATE if rate is None else rate
+        self.progress = progress
+        self.progress_every = progress_every
+        self.connection_kwargs = connection_kwargs or {}
+
+    def send(self, mails, total=None, on_result=None):
+        '''Send mails, an iterable of (subject, message, to_addr) tuples, and
+        return the final Progress.
+
+        If progress was given, it is called with a Progress after every
+        progress_every mails.  total is the number of mails, if mails doesn't
+        have a length.
+
+        If on_result is given, it is called in the calling thread with a Result
+        for each mail, soon after the mail is sent or fails to be sent.  Each
+        tuple in mails may have more items after to_addr, such as a key
+        identifying the recipient, which are ignored when sending, but are
+        available to on_result as part of Result.mail.
+        '''
+
+        if total is None:
+            total = len(mails)
+
+        self.queue = queue.Queue(maxsize=self.num_workers * 10)
+        self.results = queue.Queue()
+        self.on_result = on_result
+        self.throttle = Throttle(self.rate)
+        self.lock = threading.Lock()
+        self.num_sent = 0
+        self.num_failed = 0
+        self.total = total
+        self.start = time.perf_counter()
+
+        workers = [threading.Thread(target=self.work, daemon=True) for _ in range(min(self.num_workers, max(total, 1)))]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for mail in mails:
+                self.queue.put(mail)
+                self.handle_results()
+        finally:
+            for _ in workers:
+                self.queue.put(None)
+            for worker in workers:
+                worker.join()
+            self.handle_results()
+
+        progress = self.current_progress()
+        logger.info('bulk_mail_sent', num_sent=progress.num_sent, num_failed=progress.num_failed, elapsed=round(progress.elapsed, 3))
+        return progress
+
+    def work(self):
+        connection = get_connection(**self.connection_kwargs)
+
+        # The connection must be opened here for it to stay open between
+        # mails.  If it can't be, each mail will try again and fail, so that
+        # the queue is still drained.
+        try:
+            connection.open()
+        except Exception as e:
+            logger.warning('bulk_mail_connection_failed', error=repr(e))
+
+        try:
+            while True:
+                mail = self.queue.get()
+                if mail is None:
+                    break
+
+                self.throttle.wait()
+
+                subject, message, to_addr = mail[:3]
+                message_id = make_msgid(domain=DNS_NAME)
+
+                try:
+                    self.send_one(connection, subject, message, to_addr, message_id)
+                except Exception as e:
+                    logger.warning('bulk_mail_failed', to_addr=to_addr, error=repr(e))
+                    self.record(Result(mail, message_id, repr(e)))
+                else:
+                    self.record(Result(mail, message_id, None))
+        finally:
+            connection.close()
+
+    def send_one(self, connection, subject, message, to_addr, message_id):
+        mail = build_mail(subject, message, to_addr, connection=connection)
+        mail.extra_headers['Message-ID'] = message_id
+        try:
+            mail.send()
+        except SMTPServerDisconnected:
+            connection.close()
+            connection.open()
+            mail.send()
+
+    def record(self, result):
+        if self.on_result is not None:
+            self.results.put(result)
+
+        with self.lock:
+            if result.sent:
+                self.num_sent += 1
+            else:
+                self.num_failed += 1
+            num_done = self.num_sent + self.num_failed
+
+            if self.progress is not None and num_done % self.progress_every == 0 and num_done < self.total:
+                self.progress(self.current_progress())
+
+    def handle_results(self):
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.on_result(result)
+
+    def current_progress(self):
+        return Progress(self.num_sent, self.num_failed, self.total, time.perf_counter() - self.start)
+
+
+def add_arguments(parser):
+    '''Add the options for a BulkMailer to a management command's parser.'''
+
+    parser.add_argument('--workers', type=int, default=settings.BULK_MAIL_WORKERS, help='Number of connections to send over')
+    parser.add_argument('--rate', type=float, default=settings.BULK_MAIL_RATE, help='Most emails to send per second, or 0 for no limit')
@@ -2,10 +2,8 @@ from django.conf import settings
 from django.core.mail import get_connection, EmailMultiAlternatives
 
 
-def send_mail(subject, message, to_addr):
-    connection = get_connection()
-
-    mail = EmailMultiAlternatives(
+def build_mail(subject, message, to_addr, connection=None):
+    return EmailMultiAlternatives(
         subject,
         message,
         settings.EMAIL_FROM_ADDR,
@@ -14,4 +12,21 @@ def send_mail(subject, message, to_addr):
         connection=connection
     )
 
+
+def send_mail(subject, message, to_addr):
+    connection = get_connection()
+    mail = build_mail(subject, message, to_addr, connection=connection)
     return mail.send()
+
+
+def send_mails(mails):
+    '''Send several mails over a single connection.
+
+    mails is an iterable of (subject, message, to_addr) tuples.  Returns the
+    number of mails sent.
+    '''
+    connection = get_connection()
+    messages = [build_mail(subject, message, to_addr, connection=connection) for subject, message, to_addr in mails]
+    if not messages:
+        return 0
+    return connection.send_messages(messages)
@@ -0,0 +1,123 @@
+'''Reports how long it takes to import a module, broken down by each module that
+it imports.
+
+This is intended to be run in a fresh interpreter, via the startupprofile
+management command, since by the time a management command runs most of the
+modules we're interested in have already been imported.  It must not import
+anything from Django at module level for the same reason.
+
+$ python -m ironcage.importprofile ironcage.wsgi --limit 20
+
+(Python 3.7 has `python -X importtime` for this, but we're on Python 3.6.)
+'''
+
+import argparse
+import importlib
+import resource
+import sys
+import time
+
+
+class TimingLoader:
+    '''Wraps a module's loader, recording how long it takes to execute the
+    module.'''
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler.push()
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler.pop(module.__name__, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportProfiler:
+    '''A meta path finder that defers to the other finders, but wraps the
+    loaders that they return in a TimingLoader.'''
+
+    def __init__(self):
+        self.timings = []
+        self._child_times = []
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if hasattr(spec.loader, 'exec_module'):
+            spec.loader = TimingLoader(spec.loader, self)
+        return spec
+
+    def push(self):
+        self._child_times.append(0)
+
+    def pop(self, name, elapsed):
+        child_time = self._child_times.pop()
+        if self._child_times:
+            self._child_times[-1] += elapsed
+        self.timings.append((name, elapsed - child_time, elapsed))
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        sys.meta_path.remove(self)
+
+
+def profile_import(module_name):
+    '''Import the named module, and return a list of (module, self time,
+    cumulative time) tuples for every module that was imported as a result.'''
+
+    profiler = ImportProfiler()
+    profiler.install()
+    try:
+        importlib.import_module(module_name)
+    finally:
+        profiler.uninstall()
+    return profiler.timings
+
+
+def format_report(timings, limit):
+    lines = []
+    lines.append(f'{"cumulative (ms)":>16} {"self (ms)":>10}  module')
+
+    for name, self_time, cumulative_time in sorted(timings, key=lambda t: -t[2])[:limit]:
+        lines.append(f'{cumulative_time * 1000:>16.1f} {self_time * 1000:>10.1f}  {name}')
+
+    total = sum(self_time for _, self_time, _ in timings)
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    lines.append('')
+    lines.append(f'Imported {len(timings)} modules in {total * 1000:.1f} ms')
+    lines.append(f'Max RSS: {max_rss_mb:.1f} MB')
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('module')
+    parser.add_argument('--limit', type=int, default=30)
+    args = parser.parse_args(argv)
+
+    timings = profile_import(args.module)
+    print(format_report(timings, args.limit))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management import BaseCommand
+
+from ... import bulk_mail
+from ...emails import build_mail
+from ...smtp_sink import SmtpSink
+
+
+class Command(BaseCommand):
+    help = '''
+Compares sending emails one connection at a time, as send_mail() does, with
+sending them with a BulkMailer, against an SMTP server running locally that
+discards what it receives.
+
+Since the local server doesn't use TLS or authentication, and is on the same
+machine, this understates the cost of opening a connection to a real server.
+    '''.strip()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--num-mails', type=int, default=1500, help='Number of emails to send')
+        bulk_mail.add_arguments(parser)
+
+    def handle(self, *args, num_mails, workers, rate, **kwargs):
+        sink = SmtpSink()
+        sink.start()
+
+        try:
+            mails = [
+                ('PyCon UK 2017 benchmark', 'This is a test\n' * 20, f'attendee{ix}@example.com')
+                for ix in range(num_mails)
+            ]
+
+            start = time.perf_counter()
+            for subject, message, to_addr in mails:
+                build_mail(subject, message, to_addr, connection=get_connection(**sink.connection_kwargs())).send()
+            self.report('One connection per email', time.perf_counter() - start, sink)
+
+            sink.reset()
+            mailer = bulk_mail.BulkMailer(num_workers=workers, rate=rate, connection_kwargs=sink.connection_kwargs())
+            progress = mailer.send(mails)
+            self.report(f'BulkMailer with {workers} worker(s)', progress.elapsed, sink)
+        finally:
+            sink.stop()
+
+    def report(self, label, elapsed, sink):
+        num_mails = len(sink.recipients)
+        self.stdout.write(f'{label}: {num_mails} email(s) over {sink.num_connections} connection(s) in {elapsed:.2f}s ({num_mails / elapsed:.0f}/s)')
@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+    help = '''
+Reports how long it takes to import a module (by default, the WSGI module that
+gunicorn loads) broken down by each module that it imports.
+
+The import is done in a fresh interpreter, so that modules already imported by
+this command are included.
+    '''.strip()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='ironcage.wsgi', help='Module to profile')
+        parser.add_argument('--limit', type=int, default=30, help='Number of modules to report on')
+
+    def handle(self, *args, module, limit, **kwargs):
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'ironcage.importprofile', module, f'--limit={limit}'],
+            cwd=settings.BASE_DIR,
+            universal_newlines=True,
+        )
+        self.stdout.write(output)
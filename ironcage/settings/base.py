@@ -28,6 +28,7 @@ ENVVAR_WATCHED = [
     'SECRET_KEY',
     'STRIPE_API_KEY_PUBLISHABLE',
     'STRIPE_API_KEY_SECRET',
+    'STRIPE_WEBHOOK_SECRET',
 ]
 
 # Quick-start development settings - unsuitable for production
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
     'cfp',
     'emails',
     'grants',
+    'jobs',
     'reports',
     'tickets',
     'ukpa',
@@ -107,6 +109,26 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Reports are cached in the database rather than in memory, so that when
+    # one gunicorn worker invalidates a report, the others see it too.
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'reports_cache',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -208,6 +230,22 @@ LOGGING = {
 
 STRIPE_API_KEY_PUBLISHABLE = os.environ.get('STRIPE_API_KEY_PUBLISHABLE', ENVVAR_SENTINAL)
 STRIPE_API_KEY_SECRET = os.environ.get('STRIPE_API_KEY_SECRET', ENVVAR_SENTINAL)
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', ENVVAR_SENTINAL)
+
+# Where the Stripe API is, which can be changed to point at a stub server
+STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE', 'https://api.stripe.com')
+
+# Timeouts, in seconds, for connecting to Stripe and for waiting for a response
+STRIPE_CONNECT_TIMEOUT = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', 5))
+STRIPE_READ_TIMEOUT = float(os.environ.get('STRIPE_READ_TIMEOUT', 30))
+
+# How many times calls that are safe to retry are retried, and how long to wait,
+# in seconds, before the first retry (the wait doubles for each retry)
+STRIPE_MAX_RETRIES = int(os.environ.get('STRIPE_MAX_RETRIES', 2))
+STRIPE_RETRY_BACKOFF = float(os.environ.get('STRIPE_RETRY_BACKOFF', 0.5))
+
+# How many connections to Stripe each process keeps open
+STRIPE_POOL_SIZE = int(os.environ.get('STRIPE_POOL_SIZE', 10))
 
 
 # Mailgun
@@ -218,6 +256,14 @@ EMAIL_HOST_USER = os.environ.get('MAILGUN_SMTP_LOGIN', ENVVAR_SENTINAL)
 EMAIL_HOST_PASSWORD = os.environ.get('MAILGUN_SMTP_PASSWORD', ENVVAR_SENTINAL)
 EMAIL_USE_TLS = True
 
+# How many connections bulk emails are sent over, and the most that are sent
+# per second across all of them (0 for no limit)
+BULK_MAIL_WORKERS = int(os.environ.get('BULK_MAIL_WORKERS', 4))
+BULK_MAIL_RATE = float(os.environ.get('BULK_MAIL_RATE', 20))
+
+# How many processes bulk emails are rendered in (0 for one per CPU)
+BULK_MAIL_RENDER_PROCESSES = int(os.environ.get('BULK_MAIL_RENDER_PROCESSES', 0))
+
 
 # Slack
 
@@ -257,6 +303,42 @@ SERVER_EMAIL = 'PyCon UK 2017 <noreply@pyconuk.org>'
 EMAIL_FROM_ADDR = f'PyCon UK 2017 <noreply@pyconuk.org>'
 EMAIL_REPLY_TO_ADDR = 'PyCon UK 2017 <pyconuk-committee@uk.python.org>'
 
+# Ticket availability
+
+# How long, in seconds, the number of tickets left for each day is cached for
+# showing on the order form.  Orders are always checked against the database.
+TICKET_AVAILABILITY_CACHE_TIMEOUT = 10
+
+# Ticket invitation reminders
+
+# Unclaimed ticket invitations are reminded this many days after they were
+# sent, by `manage.py sendticketinvitationreminders`, which should be run
+# periodically
+TICKET_INVITATION_REMINDER_DAYS = [int(days) for days in os.environ.get('TICKET_INVITATION_REMINDER_DAYS', '3,7,14').split(',')]
+
+# How many reminders are sent in each transaction
+TICKET_INVITATION_REMINDER_BATCH_SIZE = int(os.environ.get('TICKET_INVITATION_REMINDER_BATCH_SIZE', 100))
+
+# Public IDs
+
+# Width, in bits, of the scrambled public IDs given to orders, tickets, etc.
+# Changing this changes every existing ID, so it should only be changed for a
+# new deployment.  16 bits gives 4 character IDs and allows 2**16 instances of
+# each model; 32 bits gives 8 character IDs.
+ID_SCRAMBLER_BITS = int(os.environ.get('ID_SCRAMBLER_BITS', 16))
+
+# Reports
+
+# Whether the heaviest reports read from materialized views, which are only as
+# up to date as the last run of `manage.py refreshreports`.
+REPORTS_USE_MATERIALIZED_VIEWS = bool(os.environ.get('REPORTS_USE_MATERIALIZED_VIEWS'))
+
+# Jobs
+
+# Whether jobs are run as soon as they are enqueued, rather than by a separate
+# `manage.py runjobs` process.
+JOBS_RUN_INLINE = bool(os.environ.get('JOBS_RUN_INLINE'))
+
 # Maintenance mode
 
 MAINTENANCE_MODE = os.environ.get('MAINTENANCE_MODE', False)
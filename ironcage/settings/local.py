@@ -20,3 +20,7 @@ LOGGING['loggers']['django']['handlers'].remove('slack_admins')
 
 # Email address to send mail from
 SERVER_EMAIL = 'PyCon UK 2017 <noreply@localhost:8000>'
+
+# Run jobs once the transaction that enqueued them is committed, without
+# needing a worker
+JOBS_RUN_INLINE = True
@@ -11,3 +11,21 @@ ADMINS = ['admin@example.com']
 
 # Don't spam logs to the console
 LOGGING['loggers']['']['handlers'].remove('console')
+
+# Run jobs once the transaction that enqueued them is committed, without
+# needing a worker
+JOBS_RUN_INLINE = True
+
+# Don't let one test see the ticket availability cached by another
+TICKET_AVAILABILITY_CACHE_TIMEOUT = 0
+
+# Send bulk emails in order, and without waiting between them
+BULK_MAIL_WORKERS = 1
+BULK_MAIL_RATE = 0
+
+# Render bulk emails in the test process, since other processes can't see data
+# created inside a test's transaction
+BULK_MAIL_RENDER_PROCESSES = 1
+
+# Run transaction.on_commit() callbacks, and so inline jobs, in TestCases
+TEST_RUNNER = 'ironcage.tests.runner.TestRunner'
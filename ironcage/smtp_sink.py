@@ -0,0 +1,62 @@
+'''A local SMTP server that accepts and counts mails without delivering them,
+for testing and benchmarking code that talks SMTP.'''
+
+import asyncore
+import smtpd
+import threading
+
+
+class _Server(smtpd.SMTPServer):
+    def __init__(self, sink, *args, **kwargs):
+        self.sink = sink
+        super().__init__(*args, **kwargs)
+
+    def handle_accepted(self, conn, addr):
+        with self.sink.lock:
+            self.sink.num_connections += 1
+        super().handle_accepted(conn, addr)
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        with self.sink.lock:
+            self.sink.recipients.extend(rcpttos)
+
+
+class SmtpSink:
+    def __init__(self, host='127.0.0.1', port=0):
+        self.map = {}
+        self.lock = threading.Lock()
+        self.server = _Server(self, (host, port), None, map=self.map, decode_data=True)
+        self.host, self.port = self.server.socket.getsockname()[:2]
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.num_connections = 0
+            self.recipients = []
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while self.running:
+            asyncore.loop(timeout=0.01, map=self.map, count=1)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        asyncore.close_all(map=self.map)
+
+    def connection_kwargs(self):
+        '''Return the arguments for get_connection() for an SMTP connection to
+        this server.'''
+
+        return {
+            'backend': 'django.core.mail.backends.smtp.EmailBackend',
+            'host': self.host,
+            'port': self.port,
+            'username': '',
+            'password': '',
+            'use_tls': False,
+        }
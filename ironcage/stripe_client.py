@@ -0,0 +1,181 @@
+'''The HTTP client that the Stripe library uses to talk to Stripe.
+
+The library's default client opens a new connection for each call, has no
+retries, and records nothing.  This client keeps a pool of connections alive
+between calls, retries calls that are safe to retry, and keeps histograms of
+how long calls take and how they fail, which are logged through structlog.
+
+It is installed once per process by configure(), with timeouts and the retry
+policy taken from settings.
+'''
+
+from bisect import bisect_left
+from collections import Counter, defaultdict
+import re
+from threading import Lock
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+import stripe
+from stripe.http_client import RequestsClient
+
+from django.conf import settings
+
+import structlog
+logger = structlog.get_logger()
+
+
+# Upper bounds, in milliseconds, of the buckets of the latency histograms.
+LATENCY_BUCKETS_MS = [25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf')]
+
+# The histograms are logged after every this many calls.
+LOG_STATS_EVERY = 100
+
+# Responses with these statuses may succeed if the call is retried.
+RETRYABLE_STATUSES = {409, 429, 500, 502, 503, 504}
+
+
+class Stats:
+    '''Histograms of the latency of calls to Stripe, and counts of calls by
+    outcome, for each endpoint.'''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.latencies = defaultdict(lambda: [0] * len(LATENCY_BUCKETS_MS))
+            self.outcomes = defaultdict(Counter)
+            self.num_calls = 0
+
+    def record(self, endpoint, elapsed, outcome):
+        with self.lock:
+            self.latencies[endpoint][bisect_left(LATENCY_BUCKETS_MS, elapsed * 1000)] += 1
+            self.outcomes[endpoint][outcome] += 1
+            self.num_calls += 1
+            return self.num_calls
+
+    def snapshot(self):
+        '''Return a dict mapping each endpoint to its latency histogram (which
+        maps the upper bound of each bucket to the number of calls in it) and
+        its counts of outcomes.'''
+
+        with self.lock:
+            return {
+                endpoint: {
+                    'latency_ms': {
+                        str(bound): count
+                        for bound, count in zip(LATENCY_BUCKETS_MS, self.latencies[endpoint])
+                        if count
+                    },
+                    'outcomes': dict(self.outcomes[endpoint]),
+                }
+                for endpoint in sorted(self.latencies)
+            }
+
+
+stats = Stats()
+
+
+def endpoint_for(method, url):
+    '''Return the method and path of a call, with any Stripe IDs in the path
+    replaced by a placeholder.
+
+    >>> endpoint_for('post', 'https://api.stripe.com/v1/charges/ch_123/refunds')
+    'POST /v1/charges/{id}/refunds'
+    '''
+    path = re.sub(r'^\w+://[^/]+', '', url).split('?')[0]
+    path = re.sub(r'/[a-z]+_[A-Za-z0-9_]+', '/{id}', path)
+    return f'{method.upper()} {path}'
+
+
+class PooledRequestsClient(RequestsClient):
+    '''A client for the Stripe library that reuses connections, retries, and
+    records the latency and outcome of each call.
+
+    A call is only retried if it is safe to do so: that is, if it is a GET, or
+    if it has an idempotency key, or if no connection could be made.
+    '''
+
+    name = 'pooled-requests'
+
+    def __init__(self, connect_timeout, read_timeout, max_retries, retry_backoff, pool_size, **kwargs):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        super().__init__(timeout=(connect_timeout, read_timeout), session=session, **kwargs)
+
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    def request(self, method, url, headers, post_data=None):
+        endpoint = endpoint_for(method, url)
+        can_retry = method.lower() == 'get' or 'Idempotency-Key' in (headers or {})
+
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                content, status_code, response_headers = super().request(method, url, headers, post_data)
+            except stripe.error.APIConnectionError as e:
+                elapsed = time.perf_counter() - start
+                outcome = 'connection_error'
+                # A connection error means that Stripe might not have seen the
+                # request, unless it was the response that we didn't get.
+                retry = can_retry or isinstance(e.__context__, requests.exceptions.ConnectTimeout)
+                self.record(endpoint, elapsed, outcome, attempt)
+                if not retry or attempt == self.max_retries:
+                    raise
+            else:
+                elapsed = time.perf_counter() - start
+                outcome = str(status_code)
+                self.record(endpoint, elapsed, outcome, attempt)
+                if not (can_retry and status_code in RETRYABLE_STATUSES) or attempt == self.max_retries:
+                    return content, status_code, response_headers
+
+            time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def record(self, endpoint, elapsed, outcome, attempt):
+        logger.info('stripe_request', endpoint=endpoint, outcome=outcome, attempt=attempt, elapsed_ms=round(elapsed * 1000, 1))
+        num_calls = stats.record(endpoint, elapsed, outcome)
+        if num_calls % LOG_STATS_EVERY == 0:
+            logger.info('stripe_request_stats', stats=stats.snapshot())
+
+
+_client = None
+_lock = Lock()
+
+
+def configure():
+    '''Install the pooled client, if it hasn't been installed already, and
+    return it.'''
+
+    global _client
+
+    with _lock:
+        if _client is None:
+            _client = PooledRequestsClient(
+                connect_timeout=settings.STRIPE_CONNECT_TIMEOUT,
+                read_timeout=settings.STRIPE_READ_TIMEOUT,
+                max_retries=settings.STRIPE_MAX_RETRIES,
+                retry_backoff=settings.STRIPE_RETRY_BACKOFF,
+                pool_size=settings.STRIPE_POOL_SIZE,
+                verify_ssl_certs=stripe.verify_ssl_certs,
+            )
+            stripe.default_http_client = _client
+            stripe.api_base = settings.STRIPE_API_BASE
+        return _client
+
+
+def reset():
+    '''Uninstall the client, so that the next call to configure() installs a
+    new one with the current settings.'''
+
+    global _client
+
+    with _lock:
+        _client = None
+        stripe.default_http_client = None
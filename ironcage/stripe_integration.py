@@ -2,33 +2,78 @@ import stripe
 
 from django.conf import settings
 
+from . import stripe_client
 
-def set_stripe_api_key():
-    stripe.api_key = settings.STRIPE_API_KEY_SECRET
 
+# Errors from Stripe that won't go away if the charge is retried.  Other errors,
+# such as failing to connect to Stripe, are raised so that the job that makes
+# the charge is retried.
+NON_RETRYABLE_STRIPE_ERRORS = (
+    stripe.error.InvalidRequestError,
+    stripe.error.AuthenticationError,
+    stripe.error.PermissionError,
+)
 
-def create_charge(amount_pence, description, statement_descriptor, token):
+# Shown to the purchaser when their card couldn't be charged, for a reason that
+# isn't to do with the card
+STRIPE_ERROR_MESSAGE = 'There was a problem taking your payment.  Please try again.'
+
+
+def create_charge(amount_pence, description, statement_descriptor, token, metadata=None, idempotency_key=None):
     assert len(statement_descriptor) <= 22
-    set_stripe_api_key()
+    stripe_client.configure()
     return stripe.Charge.create(
+        api_key=settings.STRIPE_API_KEY_SECRET,
         amount=amount_pence,
         currency='gbp',
         description=description,
         statement_descriptor=statement_descriptor,
         source=token,
+        metadata=metadata or {},
+        idempotency_key=idempotency_key,
     )
 
 
 def create_charge_for_order(order, token):
-    assert order.payment_required()
+    assert order.status in ['pending', 'failed', 'processing']
+    app_label = order._meta.app_label
+    # The metadata lets us find the order when Stripe tells our webhook about
+    # the charge, and the idempotency key means that if the job that creates
+    # the charge is retried, the card isn't charged twice.
     return create_charge(
         order.cost_pence_incl_vat(),
         f'PyCon UK order {order.order_id}',
         f'PyCon UK {order.order_id}',
         token,
+        metadata={'app': app_label, 'order_id': order.order_id},
+        idempotency_key=f'{app_label}-order-{order.order_id}-{token}',
     )
 
 
 def refund_charge(charge_id):
-    set_stripe_api_key()
-    stripe.Refund.create(charge=charge_id)
+    stripe_client.configure()
+    # A charge can only be refunded in full once, so the idempotency key just
+    # makes retrying safe.
+    stripe.Refund.create(
+        api_key=settings.STRIPE_API_KEY_SECRET,
+        charge=charge_id,
+        idempotency_key=f'refund-{charge_id}',
+    )
+
+
+def is_live_mode():
+    '''Return whether we are using Stripe's live keys, so that real cards are
+    charged.'''
+    return settings.STRIPE_API_KEY_SECRET.startswith('sk_live_')
+
+
+def is_test_mode():
+    '''Return whether we are using Stripe's test keys.'''
+    return settings.STRIPE_API_KEY_SECRET.startswith('sk_test_')
+
+
+def construct_event(payload, sig_header):
+    '''Return the event that Stripe sent to our webhook, raising
+    stripe.error.SignatureVerificationError if it wasn't signed with our
+    webhook's secret, or ValueError if it isn't valid JSON.'''
+    return stripe.Webhook.construct_event(payload, sig_header, settings.STRIPE_WEBHOOK_SECRET)
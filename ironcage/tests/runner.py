@@ -0,0 +1,87 @@
+'''A test runner that runs transaction.on_commit() callbacks in TestCases.
+
+TestCase wraps each test in a transaction that is rolled back, so callbacks
+registered with on_commit() would never be run.  Jobs that are run inline are
+registered like this, so that they are run once the transaction that enqueued
+them has been committed, as they are by the worker in production.
+
+This runner treats the transactions opened by TestCase as though they weren't
+there: a callback is run when the outermost transaction opened by the code
+under test is committed, or straight away if there isn't one.  Callbacks
+registered in a transaction that is rolled back are discarded, as usual.
+'''
+
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.transaction import Atomic, get_connection
+from django.test import TestCase
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.originals = {
+            (TestCase, '_enter_atomics'): TestCase.__dict__['_enter_atomics'],
+            (TestCase, '_rollback_atomics'): TestCase.__dict__['_rollback_atomics'],
+            (Atomic, '__exit__'): Atomic.__exit__,
+            (BaseDatabaseWrapper, 'on_commit'): BaseDatabaseWrapper.on_commit,
+        }
+
+        enter_atomics = TestCase._enter_atomics.__func__
+        rollback_atomics = TestCase._rollback_atomics.__func__
+        atomic_exit = Atomic.__exit__
+        on_commit = BaseDatabaseWrapper.on_commit
+
+        def _enter_atomics(cls):
+            atomics = enter_atomics(cls)
+            _record_test_depth(atomics)
+            return atomics
+
+        def _rollback_atomics(cls, atomics):
+            rollback_atomics(cls, atomics)
+            _record_test_depth(atomics)
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            atomic_exit(self, exc_type, exc_value, traceback)
+            connection = get_connection(self.using)
+            if exc_type is None and not connection.needs_rollback and _is_at_test_depth(connection):
+                callbacks, connection.run_on_commit = connection.run_on_commit, []
+                for _, func in callbacks:
+                    func()
+
+        def _on_commit(self, func):
+            if _is_at_test_depth(self):
+                func()
+            else:
+                on_commit(self, func)
+
+        TestCase._enter_atomics = classmethod(_enter_atomics)
+        TestCase._rollback_atomics = classmethod(_rollback_atomics)
+        Atomic.__exit__ = __exit__
+        BaseDatabaseWrapper.on_commit = _on_commit
+
+    def teardown_test_environment(self, **kwargs):
+        for (cls, name), value in self.originals.items():
+            setattr(cls, name, value)
+        super().teardown_test_environment(**kwargs)
+
+
+def _depth(connection):
+    '''Return the number of atomic blocks that are open on connection.'''
+
+    return len(connection.savepoint_ids) + (1 if connection.in_atomic_block else 0)
+
+
+def _record_test_depth(atomics):
+    for db_name in atomics:
+        connection = connections[db_name]
+        connection.test_atomic_depth = _depth(connection)
+
+
+def _is_at_test_depth(connection):
+    '''Return whether the only atomic blocks open on connection are those opened
+    by TestCase.'''
+
+    test_depth = getattr(connection, 'test_atomic_depth', 0)
+    return test_depth > 0 and _depth(connection) == test_depth
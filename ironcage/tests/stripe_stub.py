@@ -0,0 +1,131 @@
+'''A local HTTP server that imitates the parts of Stripe's API that we use, for
+testing our Stripe client without talking to Stripe.'''
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+from socketserver import ThreadingMixIn
+from threading import Thread
+import time
+from urllib.parse import parse_qsl
+
+
+class StubStripeServer:
+    '''Charges made with the token tok_chargeDeclined are declined.
+
+    Statuses appended to failures are returned, in order, instead of handling
+    the next requests, and delay is the number of seconds to wait before
+    responding.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+        stub = self
+
+        class Handler(StubStripeRequestHandler):
+            server_stub = stub
+
+        self.httpd = ThreadedHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset(self):
+        self.requests = []
+        self.connections = set()
+        self.failures = []
+        self.delay = 0
+        self.num_objects = 0
+
+    def next_id(self, prefix):
+        self.num_objects += 1
+        return f'{prefix}_stub{self.num_objects}'
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubStripeRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1, so that connections are kept alive
+    protocol_version = 'HTTP/1.1'
+
+    server_stub = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server_stub
+        stub.connections.add(self.client_address)
+
+        length = int(self.headers.get('Content-Length', 0))
+        params = dict(parse_qsl(self.rfile.read(length).decode('utf8')))
+        stub.requests.append({'path': self.path, 'headers': dict(self.headers), 'params': params})
+
+        if stub.delay:
+            time.sleep(stub.delay)
+
+        if stub.failures:
+            status = stub.failures.pop(0)
+            self.respond(status, {'error': {'type': 'api_error', 'message': 'Something went wrong'}})
+        elif self.path == '/v1/charges':
+            self.create_charge(params)
+        elif self.path == '/v1/refunds':
+            self.create_refund(params)
+        else:
+            self.respond(404, {'error': {'type': 'invalid_request_error', 'message': 'Unrecognized request URL'}})
+
+    def create_charge(self, params):
+        if params.get('source') == 'tok_chargeDeclined':
+            self.respond(402, {'error': {
+                'type': 'card_error',
+                'code': 'card_declined',
+                'message': 'Your card was declined.',
+            }})
+            return
+
+        self.respond(200, {
+            'id': self.server_stub.next_id('ch'),
+            'object': 'charge',
+            'amount': int(params['amount']),
+            'currency': params['currency'],
+            'created': int(time.time()),
+            'description': params.get('description'),
+            'status': 'succeeded',
+            'metadata': {
+                key[len('metadata['):-1]: value
+                for key, value in params.items()
+                if key.startswith('metadata[')
+            },
+        })
+
+    def create_refund(self, params):
+        self.respond(200, {
+            'id': self.server_stub.next_id('re'),
+            'object': 'refund',
+            'charge': params['charge'],
+            'status': 'succeeded',
+        })
+
+    def respond(self, status, body):
+        content = json.dumps(body).encode('utf8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, as it does in the timeout tests
+            self.close_connection = True
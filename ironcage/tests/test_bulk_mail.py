@@ -0,0 +1,116 @@
+import time
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.test import SimpleTestCase
+
+from ironcage.bulk_mail import BulkMailer, Throttle
+from ironcage.smtp_sink import SmtpSink
+
+
+class FailingEmailBackend(LocmemEmailBackend):
+    '''Fails to send mail to anybody at example.org.'''
+
+    def send_messages(self, messages):
+        if any(addr.endswith('@example.org') for message in messages for addr in message.to):
+            raise Exception('Mailbox unavailable')
+        return super().send_messages(messages)
+
+
+def build_mails(num_mails, domain='example.com'):
+    return [('Test', 'This is a test', f'attendee{ix}@{domain}') for ix in range(num_mails)]
+
+
+class BulkMailerTests(SimpleTestCase):
+    def test_send(self):
+        progress = BulkMailer(num_workers=4, rate=0).send(build_mails(50))
+
+        self.assertEqual(progress.num_sent, 50)
+        self.assertEqual(progress.num_failed, 0)
+        self.assertEqual(len(mail.outbox), 50)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            sorted(to_addr for _, _, to_addr in build_mails(50)),
+        )
+
+    def test_send_from_generator(self):
+        mails = (m for m in build_mails(10))
+        progress = BulkMailer(num_workers=2, rate=0).send(mails, total=10)
+        self.assertEqual(progress.num_sent, 10)
+
+    def test_failures_are_counted(self):
+        mailer = BulkMailer(num_workers=2, rate=0, connection_kwargs={'backend': 'ironcage.tests.test_bulk_mail.FailingEmailBackend'})
+
+        progress = mailer.send(build_mails(5) + build_mails(3, domain='example.org'))
+
+        self.assertEqual(progress.num_sent, 5)
+        self.assertEqual(progress.num_failed, 3)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_results(self):
+        results = []
+        mails = [(*mail, ix) for ix, mail in enumerate(build_mails(5) + build_mails(2, domain='example.org'))]
+        mailer = BulkMailer(num_workers=2, rate=0, connection_kwargs={'backend': 'ironcage.tests.test_bulk_mail.FailingEmailBackend'})
+
+        mailer.send(mails, on_result=results.append)
+
+        self.assertEqual(sorted(result.mail[3] for result in results), list(range(7)))
+        self.assertEqual(sorted(result.mail[3] for result in results if not result.sent), [5, 6])
+        self.assertIn('Mailbox unavailable', [result for result in results if not result.sent][0].error)
+
+        message_ids = {result.mail[2]: result.message_id for result in results}
+        for message in mail.outbox:
+            self.assertEqual(message.extra_headers['Message-ID'], message_ids[message.to[0]])
+
+    def test_progress(self):
+        reports = []
+        BulkMailer(num_workers=3, rate=0, progress=reports.append, progress_every=10).send(build_mails(35))
+
+        self.assertEqual([p.num_sent for p in reports], [10, 20, 30])
+        self.assertTrue(str(reports[0]).startswith('Sent 10 of 35 email(s), with 0 failure(s), in'))
+
+    def test_rate_is_limited(self):
+        start = time.monotonic()
+        BulkMailer(num_workers=4, rate=100).send(build_mails(21))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+
+class BulkMailerSmtpTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sink = SmtpSink()
+        cls.sink.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sink.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.sink.reset()
+
+    def test_connections_are_reused(self):
+        mailer = BulkMailer(num_workers=3, rate=0, connection_kwargs=self.sink.connection_kwargs())
+
+        progress = mailer.send(build_mails(30))
+
+        self.assertEqual(progress.num_sent, 30)
+        self.assertEqual(len(self.sink.recipients), 30)
+        self.assertEqual(self.sink.num_connections, 3)
+
+
+class ThrottleTests(SimpleTestCase):
+    def test_no_limit(self):
+        throttle = Throttle(0)
+        start = time.monotonic()
+        for _ in range(100):
+            throttle.wait()
+        self.assertLess(time.monotonic() - start, 0.05)
+
+    def test_limit(self):
+        throttle = Throttle(50)
+        start = time.monotonic()
+        for _ in range(6):
+            throttle.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
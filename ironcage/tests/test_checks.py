@@ -13,6 +13,7 @@ class EnvVarsCheckTest(TestCase):
             Error('Env var "SECRET_KEY" must be set in production.'),
             Error('Env var "STRIPE_API_KEY_PUBLISHABLE" must be set in production.'),
             Error('Env var "STRIPE_API_KEY_SECRET" must be set in production.'),
+            Error('Env var "STRIPE_WEBHOOK_SECRET" must be set in production.'),
         ]
         self.assertEqual(errors, expected)
 
@@ -20,6 +21,7 @@ class EnvVarsCheckTest(TestCase):
         SECRET_KEY='changed',
         STRIPE_API_KEY_PUBLISHABLE='changed',
         STRIPE_API_KEY_SECRET='changed',
+        STRIPE_WEBHOOK_SECRET='changed',
     )
     def test_set_in_prod(self):
         """If all's well in production, no need to return any errors."""
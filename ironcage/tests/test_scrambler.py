@@ -1,6 +1,6 @@
 from django.test import TestCase
 
-from ironcage.utils import Scrambler
+from ironcage.utils import Scrambler, modular_inverse
 
 
 class ScramblerTests(TestCase):
@@ -13,3 +13,42 @@ class ScramblerTests(TestCase):
                 outputs.add(o)
                 self.assertEqual(scrambler.backward(o), i)
             self.assertEqual(len(outputs), 2 ** 16)
+
+    def test_scrambler_matches_lookup_table_implementation(self):
+        # This is how IDs were generated when the mapping was stored in a
+        # lookup table, and existing IDs must not change.
+        m = sum(2 ** i for i in range(16) if i % 3 == 0)
+        for offset in [1000, 2000, 3000, 4000, 5000, 6000, 7000, 8000]:
+            scrambler = Scrambler(offset)
+            for i in range(0, 2 ** 16, 97):
+                expected = format((m * i + offset) % 2 ** 16, '0>4x').upper()
+                self.assertEqual(scrambler.forward(i), expected)
+
+    def test_scrambler_with_32_bits(self):
+        scrambler = Scrambler(1000, bits=32)
+        outputs = set()
+        for i in list(range(1000)) + [2 ** 16, 2 ** 20 + 1, 2 ** 32 - 1]:
+            o = scrambler.forward(i)
+            self.assertEqual(len(o), 8)
+            outputs.add(o)
+            self.assertEqual(scrambler.backward(o), i)
+        self.assertEqual(len(outputs), 1003)
+
+    def test_forward_out_of_range(self):
+        scrambler = Scrambler(1000)
+        with self.assertRaises(ValueError):
+            scrambler.forward(2 ** 16)
+        with self.assertRaises(ValueError):
+            scrambler.forward(-1)
+
+    def test_backward_malformed(self):
+        scrambler = Scrambler(1000)
+        for outp in ['', 'ABC', 'ABCDE', 'abcd', 'XYZW', ' ABC', 1234, None]:
+            with self.assertRaises(ValueError):
+                scrambler.backward(outp)
+
+    def test_modular_inverse(self):
+        for a in [1, 3, 37449, 2 ** 16 - 1]:
+            self.assertEqual((a * modular_inverse(a, 2 ** 16)) % 2 ** 16, 1)
+        with self.assertRaises(ValueError):
+            modular_inverse(2, 2 ** 16)
@@ -0,0 +1,37 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from ironcage.importprofile import ImportProfiler, format_report
+
+
+class StartupProfileTests(TestCase):
+    def test_startupprofile(self):
+        stdout = StringIO()
+        call_command('startupprofile', '--limit=5', stdout=stdout)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertIn('cumulative (ms)', lines[0])
+        self.assertTrue(lines[1].endswith('ironcage.wsgi'))
+        self.assertIn('Max RSS', stdout.getvalue())
+
+
+class ImportProfilerTests(TestCase):
+    def test_self_and_cumulative_times(self):
+        profiler = ImportProfiler()
+        profiler.push()
+        profiler.push()
+        profiler.pop('parent.child', 0.25)
+        profiler.pop('parent', 1.0)
+
+        self.assertEqual(profiler.timings, [
+            ('parent.child', 0.25, 0.25),
+            ('parent', 0.75, 1.0),
+        ])
+
+    def test_format_report(self):
+        report = format_report([('parent.child', 0.25, 0.25), ('parent', 0.75, 1.0)], limit=1)
+        lines = report.splitlines()
+        self.assertTrue(lines[1].endswith('parent'))
+        self.assertNotIn('parent.child', report)
+        self.assertIn('Imported 2 modules in 1000.0 ms', report)
@@ -0,0 +1,121 @@
+import stripe
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from ironcage import stripe_client, stripe_integration
+
+from .stripe_stub import StubStripeServer
+
+
+class StripeClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StubStripeServer()
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        stripe_client.reset()
+        stripe.api_base = 'https://api.stripe.com'
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.reset()
+        stripe_client.stats.reset()
+
+        self.settings_override = override_settings(
+            STRIPE_API_BASE=self.server.url,
+            STRIPE_RETRY_BACKOFF=0,
+            STRIPE_READ_TIMEOUT=0.5,
+        )
+        self.settings_override.enable()
+        stripe_client.reset()
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def create_charge(self, token='tok_visa', idempotency_key=None):
+        return stripe_integration.create_charge(9000, 'PyCon UK order', 'PyCon UK', token, idempotency_key=idempotency_key)
+
+    def test_create_charge(self):
+        charge = self.create_charge(idempotency_key='abc')
+
+        self.assertEqual(charge.id, 'ch_stub1')
+        self.assertEqual(charge.amount, 9000)
+
+        [request] = self.server.requests
+        self.assertEqual(request['headers']['Authorization'], f'Bearer {settings.STRIPE_API_KEY_SECRET}')
+        self.assertEqual(request['headers']['Idempotency-Key'], 'abc')
+
+    def test_create_charge_declined(self):
+        with self.assertRaises(stripe.error.CardError):
+            self.create_charge(token='tok_chargeDeclined')
+
+    def test_refund_charge(self):
+        stripe_integration.refund_charge('ch_abc')
+
+        [request] = self.server.requests
+        self.assertEqual(request['path'], '/v1/refunds')
+        self.assertEqual(request['params'], {'charge': 'ch_abc'})
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.create_charge()
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_call_with_idempotency_key_is_retried(self):
+        self.server.failures.extend([503, 500])
+
+        charge = self.create_charge(idempotency_key='abc')
+
+        self.assertEqual(charge.id, 'ch_stub1')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_call_with_idempotency_key_gives_up_after_max_retries(self):
+        self.server.failures.extend([500, 500, 500, 500])
+
+        with self.assertRaises(stripe.error.APIError):
+            self.create_charge(idempotency_key='abc')
+
+        self.assertEqual(len(self.server.requests), settings.STRIPE_MAX_RETRIES + 1)
+
+    def test_call_without_idempotency_key_is_not_retried(self):
+        self.server.failures.append(500)
+
+        with self.assertRaises(stripe.error.APIError):
+            self.create_charge()
+
+        self.assertEqual(len(self.server.requests), 1)
+
+    @override_settings(STRIPE_MAX_RETRIES=0)
+    def test_read_timeout(self):
+        stripe_client.reset()
+        self.server.delay = 1
+
+        with self.assertRaises(stripe.error.APIConnectionError):
+            self.create_charge(idempotency_key='abc')
+
+    def test_stats(self):
+        self.create_charge()
+        self.server.failures.append(500)
+        with self.assertRaises(stripe.error.APIError):
+            self.create_charge()
+        stripe_integration.refund_charge('ch_abc')
+
+        stats = stripe_client.stats.snapshot()
+
+        self.assertEqual(stats['POST /v1/charges']['outcomes'], {'200': 1, '500': 1})
+        self.assertEqual(sum(stats['POST /v1/charges']['latency_ms'].values()), 2)
+        self.assertEqual(stats['POST /v1/refunds']['outcomes'], {'200': 1})
+
+    def test_endpoint_for(self):
+        self.assertEqual(stripe_client.endpoint_for('post', 'https://api.stripe.com/v1/charges'), 'POST /v1/charges')
+        self.assertEqual(
+            stripe_client.endpoint_for('get', 'https://api.stripe.com/v1/charges/ch_123abc/refunds?limit=3'),
+            'GET /v1/charges/{id}/refunds',
+        )
@@ -1,5 +1,6 @@
 import stripe
 
+from django.conf import settings
 from django.test import TestCase
 
 from tickets.tests import factories
@@ -31,4 +32,8 @@ class StripeIntegrationTests(TestCase):
     def test_refund_charge(self):
         with utils.patched_refund_creation_expected() as mock:
             stripe_integration.refund_charge('ch_abcdefghijklmnopqurstuvw')
-        mock.assert_called_with(charge='ch_abcdefghijklmnopqurstuvw')
+        mock.assert_called_with(
+            api_key=settings.STRIPE_API_KEY_SECRET,
+            charge='ch_abcdefghijklmnopqurstuvw',
+            idempotency_key='refund-ch_abcdefghijklmnopqurstuvw',
+        )
@@ -27,6 +27,13 @@ def patched_charge_creation_failure():
         yield
 
 
+@contextmanager
+def patched_charge_creation_error(error):
+    with patch('stripe.Charge.create') as mock:
+        mock.side_effect = error
+        yield
+
+
 @contextmanager
 def patched_refund_creation_expected():
     with patch('stripe.Refund.create') as mock:
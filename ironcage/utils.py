@@ -1,9 +1,20 @@
+import re
+
+
 class Scrambler:
     '''This class provides a reversible bijective mapping between the numbers
-    in range(2**16) and strings representing hex values of the numbers in the
+    in range(2**bits) and strings representing hex values of the numbers in the
     same range.
 
-    This allows us to give a unique non-sequential ID to 2**16 model instances.
+    This allows us to give a unique non-sequential ID to 2**bits model
+    instances.
+
+    The mapping is x -> (m * x + offset) % 2**bits, where m is odd and so has
+    an inverse modulo 2**bits.  This means that both directions can be computed
+    on demand, rather than being looked up in a table.
+
+    IDs generated with the default of 16 bits are four hex digits long, and
+    are the same as those generated by earlier versions of this class.
 
     >>> scrambler = Scrambler(100)
     >>> scrambler.forward(1)
@@ -11,27 +22,101 @@ class Scrambler:
     >>> scrambler.backward('92AD')
     1
     '''
-    def __init__(self, offset):
-        n = 16
-        N = 2 ** n
-        m = sum(2 ** i for i in range(n) if i % 3 == 0)
-        s = (n - 1) // 4 + 1
+    def __init__(self, offset, bits=16):
+        N = 2 ** bits
+        m = sum(2 ** i for i in range(bits) if i % 3 == 0)
+        s = (bits - 1) // 4 + 1
 
         assert N % m != 0
+        assert 0 <= offset < N
 
-        self.inp_to_outp = {}
-        self.outp_to_inp = {}
-
-        for inp in range(N):
-            outp = format((m * inp + offset) % N, f'0>{s}x').upper()
-            self.inp_to_outp[inp] = outp
-            self.outp_to_inp[outp] = inp
-
-        assert len(self.inp_to_outp) == N
-        assert len(self.outp_to_inp) == N
+        self.N = N
+        self.m = m
+        self.m_inv = modular_inverse(m, N)
+        self.offset = offset
+        self.format_spec = f'0>{s}X'
+        self.pattern = re.compile(f'[0-9A-F]{{{s}}}')
 
     def forward(self, inp):
-        return self.inp_to_outp[inp]
+        if not 0 <= inp < self.N:
+            raise ValueError(f'{inp} is out of range')
+        return format((self.m * inp + self.offset) % self.N, self.format_spec)
 
     def backward(self, outp):
-        return self.outp_to_inp[outp]
+        if not isinstance(outp, str) or not self.pattern.fullmatch(outp):
+            raise ValueError(f'{outp!r} is not a valid scrambled ID')
+        return (self.m_inv * (int(outp, 16) - self.offset)) % self.N
+
+
+def modular_inverse(a, n):
+    '''Return x such that (a * x) % n == 1, using the extended Euclidean
+    algorithm.
+
+    >>> modular_inverse(3, 16)
+    11
+    '''
+    old_r, r = a, n
+    old_s, s = 1, 0
+
+    while r:
+        q = old_r // r
+        old_r, r = r, old_r - q * r
+        old_s, s = s, old_s - q * s
+
+    if old_r != 1:
+        raise ValueError(f'{a} has no inverse modulo {n}')
+
+    return old_s % n
+
+
+class LazyChoices:
+    '''An iterable of choices for a model or form field, which is only built
+    (by calling fn) the first time it is needed, and is then memoised.
+
+    Django only copies choices into a list at import time if they are given as
+    an iterator, so an instance of this class defers the cost of building large
+    lists of choices until a form is rendered or a value is validated.
+
+    >>> choices = LazyChoices(lambda: [['a', 'A'], ['b', 'B']])
+    >>> list(choices)
+    [['a', 'A'], ['b', 'B']]
+    '''
+    def __init__(self, fn):
+        self.fn = fn
+        self._choices = None
+
+    def choices(self):
+        if self._choices is None:
+            self._choices = list(self.fn())
+        return self._choices
+
+    def __bool__(self):
+        # Django checks whether a field has choices when the field is
+        # constructed, and we don't want that to cause the choices to be built.
+        return True
+
+    def __iter__(self):
+        return iter(self.choices())
+
+    def __len__(self):
+        return len(self.choices())
+
+    def __getitem__(self, ix):
+        return self.choices()[ix]
+
+    def __eq__(self, other):
+        return self.choices() == list(other)
+
+
+def is_prefetched(instance, related_name):
+    '''Return whether the objects for the given relation of a model instance
+    have been loaded with prefetch_related(), in which case they can be read
+    without a query.'''
+    return related_name in getattr(instance, '_prefetched_objects_cache', {})
+
+
+def clear_prefetched(instance, related_name):
+    '''Discard the objects for the given relation of a model instance that were
+    loaded with prefetch_related(), so that they are reloaded when they are next
+    needed.'''
+    getattr(instance, '_prefetched_objects_cache', {}).pop(related_name, None)
@@ -10,7 +10,14 @@ https://docs.djangoproject.com/en/1.11/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ironcage.settings")
 
 application = get_wsgi_application()
+
+# Import the URLconf (and so every app's views and forms) now, rather than when
+# the first request is handled.  Since gunicorn is run with --preload (see the
+# Procfile) this happens once in the master process before any workers are
+# forked, and the workers share the resulting heap copy-on-write.
+get_resolver().url_patterns
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsConfig(AppConfig):
+    name = 'jobs'
+
+    def ready(self):
+        # Import each app's jobs module, so that its jobs are registered before
+        # the worker looks for them.
+        autodiscover_modules('jobs')
@@ -0,0 +1,20 @@
+from django.core.management import BaseCommand
+
+from ...queue import requeue_dead_jobs, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Runs queued jobs as they become due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when no job is due')
+        parser.add_argument('--poll-interval', type=float, default=1, help='Seconds to wait when no job is due')
+        parser.add_argument('--requeue-dead', action='store_true', help='Requeue jobs that have failed too often, and exit')
+
+    def handle(self, *args, once, poll_interval, requeue_dead, **kwargs):
+        if requeue_dead:
+            num_requeued = requeue_dead_jobs()
+            self.stdout.write(f'Requeued {num_requeued} job(s)')
+            return
+
+        run_worker(poll_interval=poll_interval, once=once)
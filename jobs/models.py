@@ -0,0 +1,31 @@
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    '''A call to a function registered with jobs.queue.job, to be made by the
+    worker after the transaction that enqueued it has been committed.
+
+    A job is queued until it is claimed by a worker, when it is running.  It
+    is then queued again if it fails, until it succeeds, when it is done, or
+    until it has failed max_attempts times, when it is dead.  Dead jobs are kept for inspection,
+    and can be requeued with `manage.py runjobs --requeue-dead`.
+    '''
+
+    name = models.CharField(max_length=200)
+    kwargs = JSONField(default=dict)
+    status = models.CharField(max_length=10, default='queued')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = [['status', 'run_after']]
+
+    def __str__(self):
+        return f'{self.name} ({self.id})'
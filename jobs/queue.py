@@ -0,0 +1,188 @@
+'''A job queue, backed by a table in the database.
+
+Side effects that shouldn't hold up a request, such as sending mail and Slack
+messages, are wrapped up as jobs:
+
+    @job
+    def send_receipt(order_id):
+        ...
+
+and are enqueued in the same transaction as the change that causes them:
+
+    with transaction.atomic():
+        order.confirm(charge_id, charge_created)
+        enqueue(send_receipt, order_id=order.id)
+
+so that a job is only run if the change is committed.  Arguments must be JSON
+serializable, so jobs are passed the ids of model instances, not instances.
+
+Jobs are run by `manage.py runjobs`.  Several workers can run at once, since
+each claims a job with SELECT ... FOR UPDATE SKIP LOCKED, and marks it as
+running in a transaction that is committed before the job is run, so that no
+locks are held while a job talks to Stripe or to the mail server.  A job that
+is still running after RUNNING_TIMEOUT_SECONDS is assumed to belong to a
+worker that has died, and can be claimed again.  A job that raises an
+exception is retried with exponential backoff.
+
+If settings.JOBS_RUN_INLINE is set (as it is in tests and when running
+locally) jobs are run in the same process once the transaction that enqueued
+them is committed, and nothing is written to the database.  As with the
+worker, a job that fails is logged, and doesn't affect the code that
+enqueued it.
+'''
+
+from datetime import timedelta
+import time
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Job
+
+import structlog
+logger = structlog.get_logger()
+
+
+# Delay before the first retry of a failed job, which doubles with each
+# subsequent failure.
+BACKOFF_SECONDS = 30
+
+# How long a job can be running before another worker may claim it
+RUNNING_TIMEOUT_SECONDS = 600
+
+_registry = {}
+
+
+def job(fn=None, *, on_dead=None):
+    '''Register fn so that it can be enqueued and run by the worker.
+
+    If on_dead is given, it is called with the job's arguments when the job
+    fails for the last time, so that whatever was waiting for the job isn't
+    left waiting for good:
+
+        @job(on_dead=give_up_charge)
+        def process_stripe_charge(order_id, token):
+            ...
+    '''
+
+    if fn is None:
+        return lambda fn: job(fn, on_dead=on_dead)
+
+    fn.job_name = f'{fn.__module__}.{fn.__name__}'
+    fn.on_dead = on_dead
+    _registry[fn.job_name] = fn
+    return fn
+
+
+def enqueue(fn, **kwargs):
+    '''Enqueue a call to fn, which must have been registered with @job.
+
+    This should be called inside the transaction that makes the change that
+    the job is a side effect of.
+    '''
+
+    assert _registry.get(getattr(fn, 'job_name', None)) is fn, f'{fn} is not a registered job'
+
+    if settings.JOBS_RUN_INLINE:
+        transaction.on_commit(lambda: _run_inline(fn, kwargs))
+        return None
+
+    job = Job.objects.create(name=fn.job_name, kwargs=kwargs)
+    logger.info('enqueue_job', name=job.name, job=job.id)
+    return job
+
+
+def run_next_job():
+    '''Claim and run the next job that is due, returning it, or return None if
+    no job is due.'''
+
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            status__in=['queued', 'running'],
+            run_after__lte=timezone.now(),
+        ).order_by('run_after', 'id').first()
+
+        if job is None:
+            return None
+
+        job.status = 'running'
+        job.attempts += 1
+        job.run_after = timezone.now() + timedelta(seconds=RUNNING_TIMEOUT_SECONDS)
+        job.save()
+
+    fn = _registry[job.name]
+    start = time.perf_counter()
+
+    try:
+        # Any changes that the job makes are rolled back if it fails, but
+        # the failure is still recorded.
+        with transaction.atomic():
+            fn(**job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = 'dead'
+        else:
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=BACKOFF_SECONDS * 2 ** (job.attempts - 1))
+        logger.exception('job_failed', name=job.name, job=job.id, attempts=job.attempts, status=job.status)
+        if job.status == 'dead':
+            _run_on_dead(fn, job.kwargs)
+    else:
+        job.status = 'done'
+        logger.info('job_done', name=job.name, job=job.id, elapsed=round(time.perf_counter() - start, 3))
+
+    job.save()
+
+    return job
+
+
+def run_worker(poll_interval=1, once=False):
+    '''Run jobs as they become due.  If once is set, return when no job is
+    due.'''
+
+    while True:
+        job = run_next_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+
+
+def _run_inline(fn, kwargs):
+    logger.info('run_job_inline', name=fn.job_name)
+    start = time.perf_counter()
+
+    try:
+        with transaction.atomic():
+            fn(**kwargs)
+    except Exception:
+        # Inline jobs aren't retried, so this is the job's last attempt
+        logger.exception('job_failed', name=fn.job_name)
+        _run_on_dead(fn, kwargs)
+    else:
+        logger.info('job_done', name=fn.job_name, elapsed=round(time.perf_counter() - start, 3))
+
+
+def _run_on_dead(fn, kwargs):
+    if fn.on_dead is None:
+        return
+
+    try:
+        with transaction.atomic():
+            fn.on_dead(**kwargs)
+    except Exception:
+        logger.exception('job_on_dead_failed', name=fn.job_name)
+
+
+def requeue_dead_jobs():
+    '''Give each dead job another set of attempts, returning how many were
+    requeued.'''
+
+    return Job.objects.filter(status='dead').update(
+        status='queued',
+        attempts=0,
+        run_after=timezone.now(),
+    )
@@ -0,0 +1,273 @@
+from datetime import timedelta
+from io import StringIO
+import threading
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from accounts.tests.factories import create_user
+from accounts.models import User
+
+from jobs.models import Job
+from jobs.queue import BACKOFF_SECONDS, enqueue, job, requeue_dead_jobs, run_next_job
+
+
+calls = []
+
+
+@job
+def record_call(value):
+    calls.append(value)
+
+
+@job
+def rename_user_and_fail(user_id):
+    User.objects.filter(pk=user_id).update(name='Zaphod')
+    raise ValueError('Something went wrong')
+
+
+def record_death(value):
+    calls.append(('dead', value))
+
+
+@job(on_dead=record_death)
+def fail_and_record_death(value):
+    raise ValueError('Something went wrong')
+
+
+@job
+def record_status_seen_by_other_worker():
+    # Another worker must be able to lock the job while it is running
+    def check():
+        try:
+            with transaction.atomic():
+                calls.append(Job.objects.select_for_update(nowait=True).get(status='running').status)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=check)
+    thread.start()
+    thread.join()
+
+
+@override_settings(JOBS_RUN_INLINE=False)
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue(self):
+        with transaction.atomic():
+            job = enqueue(record_call, value=1)
+
+        self.assertEqual(job.name, 'jobs.tests.test_queue.record_call')
+        self.assertEqual(job.kwargs, {'value': 1})
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(calls, [])
+
+    def test_enqueue_unregistered_function(self):
+        with self.assertRaises(AssertionError):
+            enqueue(print, value=1)
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_enqueue_inline(self):
+        self.assertIsNone(enqueue(record_call, value=1))
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(Job.objects.count(), 0)
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_enqueue_inline_runs_job_once_transaction_is_committed(self):
+        with transaction.atomic():
+            enqueue(record_call, value=1)
+            self.assertEqual(calls, [])
+
+        self.assertEqual(calls, [1])
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_enqueue_inline_does_not_run_job_if_transaction_is_rolled_back(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                enqueue(record_call, value=1)
+                raise ValueError
+
+        self.assertEqual(calls, [])
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_enqueue_inline_failure_is_not_raised(self):
+        user = create_user(name='Alice')
+
+        with transaction.atomic():
+            enqueue(rename_user_and_fail, user_id=user.id)
+
+        # The job's changes were rolled back
+        user.refresh_from_db()
+        self.assertEqual(user.name, 'Alice')
+
+    def test_run_next_job(self):
+        job = enqueue(record_call, value=1)
+
+        self.assertEqual(run_next_job(), job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(calls, [1])
+
+    def test_run_next_job_runs_jobs_in_order(self):
+        enqueue(record_call, value=1)
+        enqueue(record_call, value=2)
+
+        run_next_job()
+        run_next_job()
+
+        self.assertEqual(calls, [1, 2])
+        self.assertIsNone(run_next_job())
+
+    def test_run_next_job_skips_jobs_not_yet_due(self):
+        job = enqueue(record_call, value=1)
+        job.run_after = timezone.now() + timedelta(minutes=1)
+        job.save()
+
+        self.assertIsNone(run_next_job())
+        self.assertEqual(calls, [])
+
+    def test_failed_job_is_retried_with_backoff(self):
+        user = create_user(name='Alice')
+        job = enqueue(rename_user_and_fail, user_id=user.id)
+
+        before = timezone.now()
+        run_next_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('Something went wrong', job.last_error)
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=BACKOFF_SECONDS))
+
+        # The job's changes were rolled back
+        user.refresh_from_db()
+        self.assertEqual(user.name, 'Alice')
+
+        job.run_after = timezone.now()
+        job.save()
+        before = timezone.now()
+        run_next_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=2 * BACKOFF_SECONDS))
+
+    def test_job_is_dead_after_max_attempts(self):
+        user = create_user()
+        job = enqueue(rename_user_and_fail, user_id=user.id)
+        Job.objects.filter(pk=job.pk).update(attempts=job.max_attempts - 1)
+
+        run_next_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'dead')
+        self.assertEqual(job.attempts, job.max_attempts)
+        self.assertIsNone(run_next_job())
+
+    def test_on_dead_is_called_when_job_dies(self):
+        job = enqueue(fail_and_record_death, value=1)
+
+        run_next_job()
+        self.assertEqual(calls, [])
+
+        Job.objects.filter(pk=job.pk).update(attempts=job.max_attempts - 1, run_after=timezone.now())
+        run_next_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'dead')
+        self.assertEqual(calls, [('dead', 1)])
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_on_dead_is_called_when_inline_job_fails(self):
+        with transaction.atomic():
+            enqueue(fail_and_record_death, value=1)
+
+        self.assertEqual(calls, [('dead', 1)])
+
+    def test_running_job_is_claimed_again_after_timeout(self):
+        job = enqueue(record_call, value=1)
+        Job.objects.filter(pk=job.pk).update(status='running', attempts=1, run_after=timezone.now() + timedelta(minutes=1))
+
+        self.assertIsNone(run_next_job())
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_next_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(calls, [1])
+
+    def test_requeue_dead_jobs(self):
+        job = enqueue(record_call, value=1)
+        Job.objects.filter(pk=job.pk).update(status='dead', attempts=job.max_attempts)
+
+        self.assertEqual(requeue_dead_jobs(), 1)
+
+        run_next_job()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(calls, [1])
+
+    def test_runjobs_once(self):
+        enqueue(record_call, value=1)
+        enqueue(record_call, value=2)
+
+        call_command('runjobs', once=True, stdout=StringIO())
+
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(Job.objects.filter(status='done').count(), 2)
+
+
+@override_settings(JOBS_RUN_INLINE=False)
+class ConcurrentWorkerTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_locked_job_is_skipped(self):
+        locked_job = enqueue(record_call, value=1)
+        enqueue(record_call, value=2)
+
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            # Stands in for another worker that is running the first job
+            try:
+                with transaction.atomic():
+                    Job.objects.select_for_update().get(pk=locked_job.pk)
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        locked.wait(5)
+
+        try:
+            run_next_job()
+            self.assertIsNone(run_next_job())
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(calls, [2])
+        run_next_job()
+        self.assertEqual(calls, [2, 1])
+
+    def test_job_is_not_locked_while_running(self):
+        job = enqueue(record_status_seen_by_other_worker)
+
+        run_next_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(calls, ['running'])
@@ -0,0 +1,37 @@
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cache as report_cache
+from .models import MATERIALIZED_VIEWS, MaterializedViewRefresh
+
+import structlog
+logger = structlog.get_logger()
+
+
+def refresh_materialized_views(concurrently=False):
+    '''Refresh each materialized view that backs a report, yielding the name of
+    each view and how long it took to refresh.
+
+    A concurrent refresh doesn't block reads of the view, but takes longer.
+    '''
+    for model in MATERIALIZED_VIEWS:
+        view_name = model._meta.db_table
+        logger.info('refresh_materialized_view', view_name=view_name, concurrently=concurrently)
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                if concurrently:
+                    cursor.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name}')
+                else:
+                    cursor.execute(f'REFRESH MATERIALIZED VIEW {view_name}')
+
+            MaterializedViewRefresh.objects.update_or_create(
+                view_name=view_name,
+                defaults={'refreshed_at': timezone.now()},
+            )
+            report_cache.invalidate(model)
+
+        yield view_name, time.perf_counter() - start
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class ReportsConfig(AppConfig):
     name = 'reports'
+
+    def ready(self):
+        from . import cache, pivot, reports
+        models = {model for report in reports.reports for model in report.depends_on}
+        models.update(pivot.TicketCube.depends_on)
+        cache.connect_signals(models)
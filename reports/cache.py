@@ -0,0 +1,157 @@
+'''Caching of the contexts of reports.
+
+A report declares the models that it is built from.  Each of these models has a
+generation, which changes whenever an instance of the model is saved or
+deleted, and a cached context is stored under a key that includes the
+generations of all the report's models.  So when a model changes, every report
+that depends on it will be rebuilt the next time it is requested.
+
+Note that saving instances with QuerySet.update() or bulk_create() doesn't send
+post_save, so code that does that must send tickets.signals.bulk_created, or
+call invalidate() itself.
+'''
+
+from collections import Counter, defaultdict
+import hashlib
+from threading import Lock
+import time
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from tickets.signals import bulk_created
+
+from .models import CacheCounts
+
+
+# Hits and misses are counted in memory, and added to the counts in the
+# database in batches, so that serving a report from the cache doesn't write
+# to the database, and requests for the same report don't contend for its row.
+# The counts are written once FLUSH_EVERY have been made, or FLUSH_SECONDS
+# after they were last written, whichever comes first.
+FLUSH_EVERY = 100
+FLUSH_SECONDS = 60
+
+_pending_counts = Counter()
+_pending_lock = Lock()
+_last_flushed_at = time.monotonic()
+
+
+def get_cache():
+    return caches['reports']
+
+
+def generation_key(model):
+    return f'reports:generation:{model._meta.label_lower}'
+
+
+def get_generations(models):
+    cache = get_cache()
+    keys = [generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+
+    for key in keys:
+        if key not in generations:
+            generations[key] = uuid4().hex
+            cache.set(key, generations[key], None)
+
+    return [generations[key] for key in keys]
+
+
+def entry_key(name, models, params):
+    parts = [name] + get_generations(models) + [f'{k}={v}' for k, v in sorted(params.items())]
+    digest = hashlib.md5('|'.join(parts).encode('utf8')).hexdigest()
+    return f'reports:entry:{name}:{digest}'
+
+
+def get_or_build(name, models, params, build):
+    '''Return the value cached for the named report with the given request
+    parameters, and when it was cached.  If nothing is cached, the value is
+    built by calling build().'''
+
+    cache = get_cache()
+    key = entry_key(name, models, params)
+    entry = cache.get(key)
+
+    if entry is None:
+        increment(name, 'misses')
+        entry = {'value': build(), 'cached_at': timezone.now()}
+        cache.set(key, entry)
+    else:
+        increment(name, 'hits')
+
+    return entry['value'], entry['cached_at']
+
+
+def get_counts(name):
+    '''Return the number of hits and misses for the named report, including
+    those this process hasn't yet written to the database.'''
+
+    counts = CacheCounts.objects.filter(report_name=name).values('hits', 'misses').first()
+    counts = counts or {'hits': 0, 'misses': 0}
+    with _pending_lock:
+        return {outcome: counts[outcome] + _pending_counts[name, outcome] for outcome in ['hits', 'misses']}
+
+
+def increment(name, outcome):
+    '''Add one to the count of hits or misses for the named report.'''
+
+    with _pending_lock:
+        _pending_counts[name, outcome] += 1
+        due = (
+            sum(_pending_counts.values()) >= FLUSH_EVERY or
+            time.monotonic() - _last_flushed_at >= FLUSH_SECONDS
+        )
+
+    if due:
+        flush_counts()
+
+
+def flush_counts():
+    '''Add the hits and misses counted by this process to the counts in the
+    database.'''
+
+    global _last_flushed_at
+
+    with _pending_lock:
+        pending = dict(_pending_counts)
+        _pending_counts.clear()
+        _last_flushed_at = time.monotonic()
+
+    updates_by_name = defaultdict(dict)
+    for (name, outcome), n in pending.items():
+        updates_by_name[name][outcome] = F(outcome) + n
+
+    for name, updates in sorted(updates_by_name.items()):
+        if not CacheCounts.objects.filter(report_name=name).update(**updates):
+            CacheCounts.objects.get_or_create(report_name=name)
+            CacheCounts.objects.filter(report_name=name).update(**updates)
+
+
+def invalidate(model):
+    '''Start a new generation for the given model, so that reports that depend
+    on it are rebuilt.'''
+
+    cache = get_cache()
+    key = generation_key(model)
+    cache.delete(key)
+
+    # Another process might cache a report built from data that is about to be
+    # changed before the current transaction is committed, so start another
+    # generation once it is.
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def invalidate_sender(sender, **kwargs):
+    invalidate(sender)
+
+
+def connect_signals(models):
+    for model in models:
+        post_save.connect(invalidate_sender, sender=model, dispatch_uid=f'reports:post_save:{model._meta.label_lower}')
+        post_delete.connect(invalidate_sender, sender=model, dispatch_uid=f'reports:post_delete:{model._meta.label_lower}')
+        bulk_created.connect(invalidate_sender, sender=model, dispatch_uid=f'reports:bulk_created:{model._meta.label_lower}')
@@ -0,0 +1,18 @@
+from django.core.management import BaseCommand
+
+from ...actions import refresh_materialized_views
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the materialized views that back the heaviest reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrently',
+            action='store_true',
+            help="Don't lock out reads while refreshing (slower, but reports can be viewed meanwhile)",
+        )
+
+    def handle(self, *args, concurrently, **kwargs):
+        for view_name, elapsed in refresh_materialized_views(concurrently):
+            self.stdout.write(f'Refreshed {view_name} in {elapsed * 1000:.1f} ms')
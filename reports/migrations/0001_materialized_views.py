@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-17 17:53
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Each view has a unique index, which REFRESH MATERIALIZED VIEW CONCURRENTLY
+# requires.
+
+TALK_VOTES_SQL = '''
+CREATE MATERIALIZED VIEW reports_talkvotes AS
+SELECT
+    p.id AS proposal_id,
+    COUNT(v.id)::int AS num_votes,
+    COUNT(v.id) FILTER (WHERE v.is_interested)::int AS num_interested
+FROM cfp_proposal p
+LEFT JOIN cfp_vote v ON v.proposal_id = p.id
+GROUP BY p.id;
+
+CREATE UNIQUE INDEX reports_talkvotes_pkey ON reports_talkvotes (proposal_id);
+CREATE INDEX reports_talkvotes_ranking ON reports_talkvotes (num_interested DESC, num_votes DESC);
+'''
+
+USER_VOTES_SQL = '''
+CREATE MATERIALIZED VIEW reports_uservotes AS
+SELECT
+    u.id AS user_id,
+    COUNT(v.id)::int AS num_votes,
+    COUNT(v.id) FILTER (WHERE v.is_interested)::int AS num_interested
+FROM accounts_user u
+LEFT JOIN cfp_vote v ON v.user_id = u.id
+GROUP BY u.id;
+
+CREATE UNIQUE INDEX reports_uservotes_pkey ON reports_uservotes (user_id);
+CREATE INDEX reports_uservotes_ranking ON reports_uservotes (num_votes DESC, num_interested DESC);
+'''
+
+TICKET_COUNTS_SQL = '''
+CREATE MATERIALIZED VIEW reports_ticketcounts AS
+SELECT
+    rate || ':' || num_days AS id,
+    rate,
+    num_days,
+    COUNT(*)::int AS num_tickets,
+    COUNT(*) FILTER (WHERE thu)::int AS num_thu,
+    COUNT(*) FILTER (WHERE fri)::int AS num_fri,
+    COUNT(*) FILTER (WHERE sat)::int AS num_sat,
+    COUNT(*) FILTER (WHERE sun)::int AS num_sun,
+    COUNT(*) FILTER (WHERE mon)::int AS num_mon
+FROM (
+    SELECT
+        COALESCE(o.rate, 'free') AS rate,
+        t.thu::int + t.fri::int + t.sat::int + t.sun::int + t.mon::int AS num_days,
+        t.thu, t.fri, t.sat, t.sun, t.mon
+    FROM tickets_ticket t
+    LEFT JOIN tickets_order o ON o.id = t.order_id
+) t
+GROUP BY rate, num_days;
+
+CREATE UNIQUE INDEX reports_ticketcounts_pkey ON reports_ticketcounts (id);
+'''
+
+DINNER_COURSE_COUNTS_SQL = '''
+CREATE MATERIALIZED VIEW reports_dinnercoursecounts AS
+SELECT
+    venue || ':' || course || ':' || COALESCE('=' || choice, '-') AS id,
+    venue,
+    course,
+    choice,
+    COUNT(*)::int AS total
+FROM (
+    SELECT venue, 'starter' AS course, starter AS choice FROM dinners_booking
+    UNION ALL
+    SELECT venue, 'main' AS course, main AS choice FROM dinners_booking
+    UNION ALL
+    SELECT venue, 'pudding' AS course, pudding AS choice FROM dinners_booking
+) courses
+GROUP BY venue, course, choice;
+
+CREATE UNIQUE INDEX reports_dinnercoursecounts_pkey ON reports_dinnercoursecounts (id);
+'''
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('cfp', '0007_auto_20171011_2236'),
+        ('accounts', '0011_auto_20171023_1342'),
+        ('dinners', '0001_initial'),
+        ('tickets', '0010_auto_20170903_1701'),
+    ]
+
+    operations = [
+        migrations.RunSQL(TALK_VOTES_SQL, 'DROP MATERIALIZED VIEW reports_talkvotes'),
+        migrations.RunSQL(USER_VOTES_SQL, 'DROP MATERIALIZED VIEW reports_uservotes'),
+        migrations.RunSQL(TICKET_COUNTS_SQL, 'DROP MATERIALIZED VIEW reports_ticketcounts'),
+        migrations.RunSQL(DINNER_COURSE_COUNTS_SQL, 'DROP MATERIALIZED VIEW reports_dinnercoursecounts'),
+        migrations.CreateModel(
+            name='DinnerCourseCounts',
+            fields=[
+                ('id', models.CharField(max_length=250, primary_key=True, serialize=False)),
+                ('venue', models.CharField(max_length=20)),
+                ('course', models.CharField(max_length=10)),
+                ('choice', models.CharField(max_length=100, null=True)),
+                ('total', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'reports_dinnercoursecounts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TalkVotes',
+            fields=[
+                ('proposal', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='votes_summary', serialize=False, to='cfp.Proposal')),
+                ('num_votes', models.IntegerField()),
+                ('num_interested', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'reports_talkvotes',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TicketCounts',
+            fields=[
+                ('id', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('rate', models.CharField(max_length=40)),
+                ('num_days', models.IntegerField()),
+                ('num_tickets', models.IntegerField()),
+                ('num_thu', models.IntegerField()),
+                ('num_fri', models.IntegerField()),
+                ('num_sat', models.IntegerField()),
+                ('num_sun', models.IntegerField()),
+                ('num_mon', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'reports_ticketcounts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UserVotes',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='votes_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('num_votes', models.IntegerField()),
+                ('num_interested', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'reports_uservotes',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='MaterializedViewRefresh',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=100, unique=True)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
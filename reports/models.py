@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db import models
+
+from cfp.models import Proposal
+
+
+class MaterializedViewRefresh(models.Model):
+    '''Records when each materialized view was last refreshed.'''
+
+    view_name = models.CharField(max_length=100, unique=True)
+    refreshed_at = models.DateTimeField()
+
+
+class CacheCounts(models.Model):
+    '''The number of times each report has been served from, and built for,
+    the report cache.'''
+
+    report_name = models.CharField(max_length=100, unique=True)
+    hits = models.IntegerField(default=0)
+    misses = models.IntegerField(default=0)
+
+
+# The models below are backed by materialized views, which are created in this
+# app's migrations and are refreshed by the refreshreports management command.
+# Reports only read from them if settings.REPORTS_USE_MATERIALIZED_VIEWS is set.
+
+
+class TalkVotes(models.Model):
+    '''The number of votes for, and the number of votes of interest in, each
+    proposal.'''
+
+    proposal = models.OneToOneField(Proposal, primary_key=True, related_name='votes_summary', on_delete=models.DO_NOTHING)
+    num_votes = models.IntegerField()
+    num_interested = models.IntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'reports_talkvotes'
+
+
+class UserVotes(models.Model):
+    '''The number of votes cast by, and the number of votes of interest cast
+    by, each user.'''
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, related_name='votes_summary', on_delete=models.DO_NOTHING)
+    num_votes = models.IntegerField()
+    num_interested = models.IntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'reports_uservotes'
+
+
+class TicketCounts(models.Model):
+    '''The same counts as Ticket.objects.counts_by_rate_and_num_days().'''
+
+    id = models.CharField(max_length=50, primary_key=True)
+    rate = models.CharField(max_length=40)
+    num_days = models.IntegerField()
+    num_tickets = models.IntegerField()
+    num_thu = models.IntegerField()
+    num_fri = models.IntegerField()
+    num_sat = models.IntegerField()
+    num_sun = models.IntegerField()
+    num_mon = models.IntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'reports_ticketcounts'
+
+
+class DinnerCourseCounts(models.Model):
+    '''The number of dinner bookings for each choice of each course at each
+    venue.'''
+
+    id = models.CharField(max_length=250, primary_key=True)
+    venue = models.CharField(max_length=20)
+    course = models.CharField(max_length=10)
+    choice = models.CharField(max_length=100, null=True)
+    total = models.IntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'reports_dinnercoursecounts'
+
+
+MATERIALIZED_VIEWS = [TalkVotes, UserVotes, TicketCounts, DinnerCourseCounts]
@@ -0,0 +1,183 @@
+'''A compact in-memory snapshot of tickets, for answering ad-hoc questions with
+crosstabs.
+
+Each ticket is reduced to a small integer code for each dimension, and codes
+are stored column by column in arrays, so that a crosstab over a few thousand
+tickets takes a few milliseconds.  The snapshot is rebuilt when any of the
+models that it is built from changes.
+'''
+
+from array import array
+from collections import Counter, OrderedDict
+from threading import Lock
+
+from django.db.models import Exists, OuterRef
+
+from accounts.models import User
+from dinners.models import Booking as DinnerBooking
+from tickets.constants import DAYS
+from tickets.days import day_mask_expression, num_days_expression
+from tickets.models import Order, Ticket
+from tickets.prices import PRICES_EXCL_VAT
+
+from . import cache as report_cache
+
+
+YES_NO_UNKNOWN = ['Yes', 'No', 'Unknown']
+
+
+def yes_no_unknown(value):
+    if value is None:
+        return 2
+    return 0 if value else 1
+
+
+class Dimension:
+    '''A way of classifying tickets.  A dimension is multi-valued if a ticket
+    can have more than one value, in which case its codes are bitmasks.'''
+
+    def __init__(self, name, label, values, multi=False):
+        self.name = name
+        self.label = label
+        self.values = values
+        self.multi = multi
+        self.codes = {value: code for code, value in enumerate(values)}
+
+    def code_for(self, value):
+        return self.codes[value]
+
+
+class TicketCube:
+    depends_on = [DinnerBooking, Order, Ticket, User]
+
+    def __init__(self, tickets):
+        '''tickets is an iterable of dicts like those returned by
+        load_tickets().'''
+
+        tickets = list(tickets)
+        pots = sorted({t['pot'] for t in tickets if t['pot'] is not None})
+        num_days_values = sorted({t['num_days'] for t in tickets})
+
+        self.dimensions = OrderedDict((d.name, d) for d in [
+            Dimension('rate', 'Rate', list(PRICES_EXCL_VAT)),
+            Dimension('day', 'Day', list(DAYS.values()), multi=True),
+            Dimension('num_days', 'Number of days', [str(n) for n in num_days_values]),
+            Dimension('pot', 'Pot', ['None'] + pots),
+            Dimension('claimed', 'Claimed', ['Yes', 'No']),
+            Dimension('contributor', 'Contributor', YES_NO_UNKNOWN),
+            Dimension('booked_hotel', 'Booked hotel', YES_NO_UNKNOWN),
+            Dimension('ukpa_member', 'UKPA member', YES_NO_UNKNOWN),
+            Dimension('dinner', 'Dinner', ['None', 'Conference', 'Contributors', 'Both']),
+        ])
+
+        # Codes are unsigned shorts, since there may be more than 255 pots
+        self.columns = {name: array('H') for name in self.dimensions}
+
+        rate_codes = self.dimensions['rate'].codes
+        num_days_codes = {n: code for code, n in enumerate(num_days_values)}
+        pot_codes = {pot: code for code, pot in enumerate(pots, 1)}
+
+        for t in tickets:
+            self.columns['rate'].append(rate_codes[t['rate']])
+            # The code for the day dimension is the ticket's DaySet bitmask
+            self.columns['day'].append(t['day_mask'])
+            self.columns['num_days'].append(num_days_codes[t['num_days']])
+            self.columns['pot'].append(0 if t['pot'] is None else pot_codes[t['pot']])
+            self.columns['claimed'].append(0 if t['owner_id'] else 1)
+            self.columns['contributor'].append(yes_no_unknown(t['is_contributor']))
+            self.columns['booked_hotel'].append(yes_no_unknown(t['has_booked_hotel']))
+            self.columns['ukpa_member'].append(yes_no_unknown(t['is_ukpa_member']))
+            self.columns['dinner'].append(t['conference_dinner'] + 2 * t['contributors_dinner'])
+
+        self.size = len(tickets)
+
+    def codes(self, name, ix):
+        code = self.columns[name][ix]
+        if self.dimensions[name].multi:
+            return [bit for bit in range(len(self.dimensions[name].values)) if code & (1 << bit)]
+        return [code]
+
+    def select(self, filters):
+        '''Return the indices of tickets that match all the filters, which map
+        dimension names to value labels.'''
+
+        selected = range(self.size)
+
+        for name, value in filters.items():
+            dimension = self.dimensions[name]
+            code = dimension.code_for(value)
+            column = self.columns[name]
+            if dimension.multi:
+                bit = 1 << code
+                selected = [ix for ix in selected if column[ix] & bit]
+            else:
+                selected = [ix for ix in selected if column[ix] == code]
+
+        return selected
+
+    def crosstab(self, row_name, column_name, filters=None):
+        '''Return a dict mapping (row value, column value) pairs to the number
+        of matching tickets.  If a dimension is multi-valued, a ticket is
+        counted once for each of its values.'''
+
+        counts = Counter()
+        for ix in self.select(filters or {}):
+            for row_code in self.codes(row_name, ix):
+                for column_code in self.codes(column_name, ix):
+                    counts[row_code, column_code] += 1
+
+        row_values = self.dimensions[row_name].values
+        column_values = self.dimensions[column_name].values
+        return {
+            (row_values[row_code], column_values[column_code]): count
+            for (row_code, column_code), count in counts.items()
+        }
+
+
+def load_tickets():
+    '''Return a dict of the attributes of each ticket that the cube needs,
+    loaded in a single query.'''
+
+    def has_dinner(venue):
+        return Exists(DinnerBooking.objects.filter(guest=OuterRef('owner'), venue=venue))
+
+    fields = ['order__rate', 'pot', 'owner_id', 'owner__is_contributor', 'owner__has_booked_hotel', 'owner__is_ukpa_member']
+
+    for t in Ticket.objects.annotate(
+        conference_dinner=has_dinner('conference'),
+        contributors_dinner=has_dinner('contributors'),
+        day_mask=day_mask_expression(),
+        num_days=num_days_expression(),
+    ).values(*fields, 'conference_dinner', 'contributors_dinner', 'day_mask', 'num_days'):
+        yield {
+            'rate': t['order__rate'] or 'free',
+            'num_days': t['num_days'],
+            'day_mask': t['day_mask'],
+            'pot': t['pot'],
+            'owner_id': t['owner_id'],
+            'is_contributor': t['owner__is_contributor'],
+            'has_booked_hotel': t['owner__has_booked_hotel'],
+            'is_ukpa_member': t['owner__is_ukpa_member'],
+            'conference_dinner': t['conference_dinner'],
+            'contributors_dinner': t['contributors_dinner'],
+        }
+
+
+_cube = None
+_cube_generations = None
+_lock = Lock()
+
+
+def get_cube():
+    '''Return the snapshot of tickets, rebuilding it if any of the models that
+    it is built from have changed since it was built.'''
+
+    global _cube, _cube_generations
+
+    generations = report_cache.get_generations(TicketCube.depends_on)
+
+    with _lock:
+        if _cube is None or generations != _cube_generations:
+            _cube = TicketCube(load_tickets())
+            _cube_generations = generations
+        return _cube
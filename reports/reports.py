@@ -1,8 +1,14 @@
+import csv
 from datetime import date
+from itertools import islice
 
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Count, IntegerField, Sum, Value
+from django.core import signing
+from django.db.models import Count, F, IntegerField, Q, QuerySet, Sum, Value, prefetch_related_objects
 from django.db.models.expressions import Case, When
+from django.db.models.functions import Coalesce
+from django.http import Http404, QueryDict, StreamingHttpResponse
 from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.utils.text import slugify
@@ -11,21 +17,177 @@ from avatar.templatetags.avatar_tags import avatar_url
 
 from accommodation.models import Booking as AccommodationBooking
 from accounts.models import User
-from cfp.models import Proposal
-from children.models import Ticket as ChildTicket
+from cfp.models import Proposal, Vote
+from children.models import Order as ChildOrder, Ticket as ChildTicket
 from dinners.models import Booking as DinnerBooking
 from dinners.menus import MENUS
 from grants.models import Application
 from tickets.constants import DAYS
-from tickets.models import Order, Ticket
-from tickets.prices import PRICES_EXCL_VAT, cost_incl_vat
+from tickets.models import Order, Ticket, TicketInvitation
+from tickets.prices import PRICES_EXCL_VAT, cost_excl_vat, cost_incl_vat
 from ukpa.models import Nomination
 
+from . import cache as report_cache, pivot
+from .models import DinnerCourseCounts, MaterializedViewRefresh, TicketCounts, TalkVotes, UserVotes
+
 
 @method_decorator(staff_member_required(login_url='login'), name='dispatch')
 class ReportView(TemplateView):
     template_name = 'reports/report.html'
 
+    # Relations that presenter() follows for each item, which are loaded up
+    # front so that a report runs a fixed number of queries however many rows
+    # it has.
+    select_related = []
+    prefetch_related = []
+
+    # A report that is built from a queryset can be sorted by passing
+    # ?sort=<key> (or ?sort=-<key> for descending order), filtered by passing
+    # ?q=, and is shown a page at a time.  Pages are found by keyset pagination:
+    # ?after= holds the sort value and id of the last row of the previous page,
+    # so that any page can be found with an index scan however far through the
+    # report it is.
+    #
+    # sort_fields maps the keys that can be passed to ?sort= to the fields that
+    # they sort by, and rows with the same value are then sorted by id.  Reports
+    # whose querysets don't return model instances set paginated to False.
+    paginated = True
+    page_size = 200
+    sort_fields = {'id': 'pk'}
+    default_sort = 'id'
+    search_fields = []
+
+    # Set by get_rows() if there are more rows after the page that it returns.
+    next_page_after = None
+
+    # Models that a report is built from.  The HTML page of a report that
+    # declares its models is cached until an instance of one of them is saved or
+    # deleted.
+    depends_on = []
+
+    # Materialized views that a report reads from, instead of the models it
+    # depends on, when settings.REPORTS_USE_MATERIALIZED_VIEWS is set.
+    materialized_views = []
+
+    # Formats that a report can be downloaded in (by adding ?format=csv to its
+    # URL, for instance) mapped to their delimiter and content type.
+    export_formats = {
+        'csv': (',', 'text/csv'),
+        'tsv': ('\t', 'text/tab-separated-values'),
+    }
+
+    # Number of items read from the database at a time when a report is being
+    # downloaded.
+    export_chunk_size = 1000
+
+    def get(self, request, *args, **kwargs):
+        format = request.GET.get('format')
+        if format in self.export_formats:
+            return self.export(format)
+
+        context = self.get_cached_context_data()
+        context.update(self.get_navigation_context())
+        if settings.REPORTS_USE_MATERIALIZED_VIEWS and self.materialized_views:
+            context['uses_materialized_views'] = True
+            context['views_refreshed_at'] = self.get_views_refreshed_at()
+        return self.render_to_response(context)
+
+    def get_views_refreshed_at(self):
+        '''Return when the least recently refreshed of the report's materialized
+        views was refreshed, or None if any of them has never been refreshed.'''
+        view_names = [model._meta.db_table for model in self.materialized_views]
+        refreshes = MaterializedViewRefresh.objects.filter(view_name__in=view_names)
+        refreshed_at = [refresh.refreshed_at for refresh in refreshes]
+        if len(refreshed_at) < len(view_names):
+            return None
+        return min(refreshed_at)
+
+    def get_cached_context_data(self):
+        if not self.depends_on:
+            return self.get_context_data()
+
+        def build():
+            return {
+                'context': self.get_context_data(),
+                'next_page_after': self.next_page_after,
+            }
+
+        name = self.url_name()
+        value, cached_at = report_cache.get_or_build(name, self.depends_on, self.get_params(), build)
+        self.next_page_after = value['next_page_after']
+
+        context = dict(value['context'])
+        context['cached_at'] = cached_at
+        context['cache_counts'] = report_cache.get_counts(name)
+        return context
+
+    def get_navigation_context(self):
+        params = self.get_params().copy()
+        params.pop('after', None)
+
+        def url(**kwargs):
+            query = params.copy()
+            for key, value in kwargs.items():
+                query[key] = value
+            return f'?{query.urlencode()}'
+
+        context = {
+            'download_links': [(format.upper(), url(format=format)) for format in self.export_formats],
+        }
+
+        if not (self.paginated and hasattr(self, 'get_queryset')):
+            return context
+
+        sort_key, descending = self.get_sort()
+        sort_links = []
+        for key in self.sort_fields:
+            if key == sort_key:
+                sort = key if descending else f'-{key}'
+                text = f'{key} {"▼" if descending else "▲"}'
+            else:
+                sort = key
+                text = key
+            sort_links.append({'href': url(sort=sort), 'text': text})
+
+        context.update({
+            'sort_links': sort_links,
+            'sort': params.get('sort', ''),
+            'search': bool(self.search_fields),
+            'q': params.get('q', ''),
+        })
+
+        if self.next_page_after is not None:
+            context['next_page_url'] = url(after=self.next_page_after)
+
+        return context
+
+    def export(self, format):
+        delimiter, content_type = self.export_formats[format]
+        writer = csv.writer(Echo(), delimiter=delimiter)
+        rsp = StreamingHttpResponse(
+            (writer.writerow([flatten_cell(cell) for cell in row]) for row in self.get_export_rows()),
+            content_type=f'{content_type}; charset=utf-8',
+        )
+        rsp['Content-Disposition'] = f'attachment; filename="{self.url_name()}.{format}"'
+        return rsp
+
+    def get_export_rows(self):
+        '''Yield the report's headings, and then its rows.
+
+        The rows of a report that is built from a queryset are streamed from the
+        database, so that the memory needed doesn't grow with the size of the
+        report.  Other reports are built as they are for the HTML page.
+        '''
+        if hasattr(self, 'get_queryset'):
+            yield self.headings
+            for item in self.iter_queryset_with_related():
+                yield self.presenter(item)
+        else:
+            context = self.get_context_data()
+            if context['headings']:
+                yield context['headings']
+            yield from context['rows']
+
     def get_context_data(self):
         return {
             'title': self.title,
@@ -34,7 +196,98 @@ class ReportView(TemplateView):
         }
 
     def get_rows(self):
-        return [self.presenter(item) for item in self.get_queryset()]
+        queryset = self.get_queryset_with_related()
+        if not self.paginated:
+            return [self.presenter(item) for item in queryset]
+
+        # Fetch one more item than is needed, to find out whether there is
+        # another page
+        items = list(self.seek(queryset)[:self.page_size + 1])
+        if len(items) > self.page_size:
+            items = items[:self.page_size]
+            self.next_page_after = signing.dumps([items[-1].keyset_value, items[-1].pk], salt='reports.after')
+
+        return [self.presenter(item) for item in items]
+
+    def get_params(self):
+        request = getattr(self, 'request', None)
+        if request is None:
+            return QueryDict()
+        return request.GET
+
+    def get_sort(self):
+        '''Return the key of the field that the report is sorted by, and whether
+        the sort is descending.'''
+        sort = self.get_params().get('sort', '')
+        descending = sort.startswith('-')
+        key = sort[1:] if descending else sort
+        if key not in self.sort_fields:
+            return self.default_sort, False
+        return key, descending
+
+    def get_sorted_queryset(self):
+        queryset = self.get_queryset()
+        if not self.paginated:
+            return queryset
+
+        for term in self.get_params().get('q', '').split():
+            query = Q()
+            for field in self.search_fields:
+                query |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(query)
+
+        key, descending = self.get_sort()
+        prefix = '-' if descending else ''
+        return queryset.annotate(
+            keyset_value=F(self.sort_fields[key]),
+        ).order_by(f'{prefix}keyset_value', f'{prefix}pk')
+
+    def seek(self, queryset):
+        '''Return the items of the sorted queryset that come after the item
+        identified by ?after=.'''
+        after = self.get_params().get('after')
+        if not after:
+            return queryset
+
+        try:
+            value, pk = signing.loads(after, salt='reports.after')
+        except (signing.BadSignature, TypeError, ValueError):
+            raise Http404
+
+        _, descending = self.get_sort()
+        return queryset.filter(keyset_after(value, pk, descending))
+
+    def get_queryset_with_related(self):
+        queryset = self.get_sorted_queryset()
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
+    def iter_queryset_with_related(self):
+        '''Like get_queryset_with_related(), but reads items from a server-side
+        cursor rather than loading them all at once.
+
+        iterator() ignores prefetch_related(), so related objects are instead
+        prefetched for each chunk of items as it is read.
+        '''
+        queryset = self.get_sorted_queryset()
+        if not isinstance(queryset, QuerySet):
+            yield from queryset
+            return
+
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+
+        items = queryset.iterator()
+        while True:
+            chunk = list(islice(items, self.export_chunk_size))
+            if not chunk:
+                break
+            if self.prefetch_related:
+                prefetch_related_objects(chunk, *self.prefetch_related)
+            yield from chunk
 
     @classmethod
     def path(cls):
@@ -49,16 +302,79 @@ class ReportView(TemplateView):
         return f'reports:{cls.url_name()}'
 
 
+class Echo:
+    '''A file-like object that returns what is written to it, so that each row
+    written by a csv.writer can be passed straight to a streaming response.'''
+
+    def write(self, value):
+        return value
+
+
+def ticket_counts():
+    '''Return the number of tickets for each combination of rate and number of
+    days, as returned by Ticket.objects.counts_by_rate_and_num_days().'''
+    if settings.REPORTS_USE_MATERIALIZED_VIEWS:
+        return list(TicketCounts.objects.values('rate', 'num_days', 'num_tickets', *[f'num_{day}' for day in DAYS]))
+    return Ticket.objects.counts_by_rate_and_num_days()
+
+
+def dinner_course_totals(venue):
+    '''Return a dict mapping each course to a dict mapping each choice for that
+    course to the number of bookings at the given venue with that choice.'''
+    courses = ['starter', 'main', 'pudding']
+    totals = {course: {} for course in courses}
+
+    if settings.REPORTS_USE_MATERIALIZED_VIEWS:
+        for counts in DinnerCourseCounts.objects.filter(venue=venue):
+            totals[counts.course][counts.choice] = counts.total
+    else:
+        for course in courses:
+            counts = DinnerBooking.objects.filter(venue=venue).values(course).annotate(total=Count(course)).order_by(course)
+            totals[course] = {count[course]: count['total'] for count in counts}
+
+    return totals
+
+
+def keyset_after(value, pk, descending):
+    '''Return a filter matching the items of a queryset that is sorted by
+    keyset_value and then by pk that come after the item with the given value
+    and pk.
+
+    Postgres sorts nulls after other values in ascending order, and before them
+    in descending order.
+    '''
+    if descending:
+        if value is None:
+            return Q(keyset_value__isnull=True, pk__lt=pk) | Q(keyset_value__isnull=False)
+        return Q(keyset_value__lt=value) | Q(keyset_value=value, pk__lt=pk)
+    else:
+        if value is None:
+            return Q(keyset_value__isnull=True, pk__gt=pk)
+        return Q(keyset_value__gt=value) | Q(keyset_value=value, pk__gt=pk) | Q(keyset_value__isnull=True)
+
+
+def flatten_cell(cell):
+    '''Return the value of a cell as it should appear in a downloaded report.'''
+    if isinstance(cell, dict):
+        # Links are downloaded as their text
+        return cell['text']
+    if isinstance(cell, list):
+        return ', '.join(cell)
+    return cell
+
+
 class TicketSummaryReport(ReportView):
     title = 'Ticket summary'
+    depends_on = [Order, Ticket, TicketCounts]
+    materialized_views = [TicketCounts]
 
     def get_context_data(self):
-        tickets = Ticket.objects.all()
+        counts = ticket_counts()
 
         rows = [
-            ['Tickets', len(tickets)],
-            ['Days', sum(t.num_days() for t in tickets)],
-            ['Cost (excl. VAT)', f'£{sum(t.cost_excl_vat() for t in tickets)}'],
+            ['Tickets', sum(c['num_tickets'] for c in counts)],
+            ['Days', sum(c['num_days'] * c['num_tickets'] for c in counts)],
+            ['Cost (excl. VAT)', f'£{sum(cost_excl_vat(c["rate"], c["num_days"]) * c["num_tickets"] for c in counts)}'],
         ]
 
         return {
@@ -70,18 +386,19 @@ class TicketSummaryReport(ReportView):
 
 class AttendanceByDayReport(ReportView):
     title = 'Attendance by day'
+    depends_on = [Order, Ticket, TicketCounts]
+    materialized_views = [TicketCounts]
 
     def get_context_data(self):
-        tickets = Ticket.objects.all()
+        counts = ticket_counts()
 
         rows = []
 
         for day in DAYS:
             num_tickets = {rate: 0 for rate in PRICES_EXCL_VAT}
 
-            for ticket in tickets:
-                if getattr(ticket, day):
-                    num_tickets[ticket.rate()] += 1
+            for c in counts:
+                num_tickets[c['rate']] += c[f'num_{day}']
 
             rows.append([
                 DAYS[day],
@@ -101,6 +418,7 @@ class AttendanceByDayReport(ReportView):
 
 class UKPAReport(ReportView):
     title = 'UKPA Membership'
+    depends_on = [User]
 
     def get_context_data(self):
         members = User.objects.filter(is_ukpa_member=True)
@@ -115,9 +433,10 @@ class UKPAReport(ReportView):
 
 class CandidateReport(ReportView):
     title = 'Candidates for UKPA Trustee Election'
+    depends_on = [Nomination, User]
 
     def get_context_data(self):
-        candidates = Nomination.objects.all()
+        candidates = Nomination.objects.select_related('nominee')
         rows = [
             [
                 candidate.nominee.name,
@@ -136,10 +455,12 @@ class CandidateReport(ReportView):
 
 class TicketSalesReport(ReportView):
     title = 'Ticket sales'
+    depends_on = [Order, Ticket, TicketCounts]
+    materialized_views = [TicketCounts]
     template_name = 'reports/ticket_sales_report.html'
 
     def get_context_data(self):
-        tickets = Ticket.objects.all()
+        counts = ticket_counts()
 
         num_tickets_rows = []
         ticket_cost_rows = []
@@ -152,9 +473,9 @@ class TicketSalesReport(ReportView):
 
             num_tickets = {rate: 0 for rate in PRICES_EXCL_VAT}
 
-            for ticket in tickets:
-                if sum(getattr(ticket, day) for day in DAYS) == num_days:
-                    num_tickets[ticket.rate()] += 1
+            for c in counts:
+                if c['num_days'] == num_days:
+                    num_tickets[c['rate']] += c['num_tickets']
 
             num_tickets_rows.append([
                 num_days,
@@ -181,9 +502,172 @@ class TicketSalesReport(ReportView):
             'ticket_cost_rows': ticket_cost_rows,
         }
 
+    def get_export_rows(self):
+        context = self.get_context_data()
+
+        yield ['Tickets sold']
+        yield context['headings']
+        yield from context['num_tickets_rows']
+        yield []
+        yield ['Ticket income']
+        yield context['headings']
+        yield from context['ticket_cost_rows']
+
+
+class TicketSalesOverTimeReport(ReportView):
+    title = 'Ticket sales over time'
+    template_name = 'reports/ticket_sales_over_time_report.html'
+    depends_on = [Order, Ticket]
+
+    periods = {
+        'hour': '%Y-%m-%d %H:00',
+        'day': '%Y-%m-%d',
+        'week': 'w/c %Y-%m-%d',
+    }
+    default_period = 'day'
+
+    chart_width = 800
+    chart_height = 200
+
+    def get_period(self):
+        period = self.get_params().get('period')
+        if period not in self.periods:
+            return self.default_period
+        return period
+
+    def get_context_data(self):
+        period = self.get_period()
+        sales = Order.objects.sales_by_period(period)
+
+        rows = [
+            [
+                s['period'].strftime(self.periods[period]),
+                s['num_tickets'],
+                s['num_days'],
+                f'£{s["revenue"]}',
+                s['cumulative_num_tickets'],
+                s['cumulative_num_days'],
+                f'£{s["cumulative_revenue"]}',
+            ]
+            for s in sales
+        ]
+
+        return {
+            'title': self.title,
+            'headings': [
+                'Period',
+                'Tickets',
+                'Days',
+                'Revenue (incl. VAT)',
+                'Cumulative tickets',
+                'Cumulative days',
+                'Cumulative revenue',
+            ],
+            'rows': rows,
+            'period': period,
+            'periods': list(self.periods),
+            'chart': self.get_chart(sales),
+        }
+
+    def get_chart(self, sales):
+        '''Return the geometry of an SVG chart with a bar for the number of
+        tickets sold in each period, and a line for the cumulative revenue.'''
+        if not sales:
+            return None
+
+        width = self.chart_width
+        height = self.chart_height
+        bar_width = width / len(sales)
+        max_num_tickets = max(s['num_tickets'] for s in sales)
+        max_revenue = sales[-1]['cumulative_revenue'] or 1
+
+        bars = []
+        points = []
+
+        for ix, s in enumerate(sales):
+            bar_height = height * s['num_tickets'] / max_num_tickets
+            bars.append({
+                'x': f'{ix * bar_width:.1f}',
+                'y': f'{height - bar_height:.1f}',
+                'width': f'{bar_width * 0.8:.1f}',
+                'height': f'{bar_height:.1f}',
+                'title': f'{s["period"]:%Y-%m-%d %H:%M}: {s["num_tickets"]} tickets',
+            })
+            x = (ix + 0.4) * bar_width
+            y = height - height * s['cumulative_revenue'] / max_revenue
+            points.append(f'{x:.1f},{y:.1f}')
+
+        return {
+            'width': width,
+            'height': height,
+            'bars': bars,
+            'points': ' '.join(points),
+        }
+
+
+class TicketExplorerReport(ReportView):
+    title = 'Ticket explorer'
+    template_name = 'reports/ticket_explorer_report.html'
+
+    default_rows = 'rate'
+    default_columns = 'day'
+
+    def get_context_data(self):
+        cube = pivot.get_cube()
+        dimensions = cube.dimensions
+        params = self.get_params()
+
+        row_name = params.get('rows')
+        if row_name not in dimensions:
+            row_name = self.default_rows
+
+        column_name = params.get('columns')
+        if column_name not in dimensions:
+            column_name = self.default_columns
+
+        filters = {
+            name: params[name]
+            for name, dimension in dimensions.items()
+            if params.get(name) in dimension.values
+        }
+
+        counts = cube.crosstab(row_name, column_name, filters)
+        row_values = dimensions[row_name].values
+        column_values = dimensions[column_name].values
+
+        rows = []
+        for row_value in row_values:
+            cells = [counts.get((row_value, column_value), 0) for column_value in column_values]
+            rows.append([row_value] + cells + [sum(cells)])
+
+        totals = [sum(row[ix + 1] for row in rows) for ix in range(len(column_values))]
+        rows.append(['Total'] + totals + [sum(totals)])
+
+        return {
+            'title': self.title,
+            'headings': [f'{dimensions[row_name].label} / {dimensions[column_name].label}'] + column_values + ['Total'],
+            'rows': rows,
+            'row_name': row_name,
+            'column_name': column_name,
+            'dimensions': [
+                {
+                    'name': name,
+                    'label': dimension.label,
+                    'values': dimension.values,
+                    'selected': filters.get(name, ''),
+                }
+                for name, dimension in dimensions.items()
+            ],
+        }
+
 
 class OrdersMixin:
     headings = ['ID', 'Rate', 'Purchaser', 'Email', 'Tickets', 'Cost (incl. VAT)', 'Status']
+    select_related = ['purchaser']
+    prefetch_related = ['tickets']
+    depends_on = [Order, Ticket, User]
+    sort_fields = {'id': 'pk', 'rate': 'rate', 'purchaser': 'purchaser__name', 'status': 'status'}
+    search_fields = ['purchaser__name', 'purchaser__email_addr']
 
     def presenter(self, order):
         link = {
@@ -201,22 +685,27 @@ class OrdersMixin:
         ]
 
 
-class OrdersReport(ReportView, OrdersMixin):
+class OrdersReport(OrdersMixin, ReportView):
     title = 'All orders'
 
     def get_queryset(self):
-        return Order.objects.all()
+        return Order.objects.order_by('id')
 
 
-class UnpaidOrdersReport(ReportView, OrdersMixin):
+class UnpaidOrdersReport(OrdersMixin, ReportView):
     title = 'Unpaid orders'
 
     def get_queryset(self):
-        return Order.objects.exclude(status='successful')
+        return Order.objects.exclude(status='successful').order_by('id')
 
 
 class TicketsMixin:
     headings = ['ID', 'Rate', 'Ticket holder', 'Days', 'Cost (incl. VAT)', 'Status']
+    select_related = ['order', 'owner']
+    prefetch_related = ['invitations']
+    depends_on = [Order, Ticket, TicketInvitation, User]
+    sort_fields = {'id': 'pk', 'holder': 'owner__name'}
+    search_fields = ['owner__name', 'owner__email_addr']
 
     def presenter(self, ticket):
         link = {
@@ -233,14 +722,14 @@ class TicketsMixin:
         ]
 
 
-class TicketsReport(ReportView, TicketsMixin):
+class TicketsReport(TicketsMixin, ReportView):
     title = 'All tickets'
 
     def get_queryset(self):
-        return Ticket.objects.all()
+        return Ticket.objects.order_by('id')
 
 
-class UnclaimedTicketsReport(ReportView, TicketsMixin):
+class UnclaimedTicketsReport(TicketsMixin, ReportView):
     title = 'Unclaimed tickets'
 
     def get_queryset(self):
@@ -249,7 +738,13 @@ class UnclaimedTicketsReport(ReportView, TicketsMixin):
 
 class FreeTicketsReport(ReportView):
     title = 'Free tickets'
+    depends_on = [Ticket, TicketInvitation, User]
     headings = ['ID', 'Ticket holder', 'Days', 'Pot', 'Status']
+    select_related = ['owner']
+    prefetch_related = ['invitations']
+    sort_fields = {'id': 'pk', 'holder': 'owner__name', 'pot': 'pot'}
+    default_sort = 'pot'
+    search_fields = ['owner__name', 'owner__email_addr', 'pot']
 
     def get_queryset(self,):
         return Ticket.objects.filter(pot__isnull=False).order_by('pot')
@@ -270,7 +765,12 @@ class FreeTicketsReport(ReportView):
 
 class DjangoGirlsTicketsReport(ReportView):
     title = 'Django Girls tickets'
+    depends_on = [Ticket, TicketInvitation, User]
     headings = ['ID', 'Ticket holder', 'Days', 'Status']
+    select_related = ['owner']
+    prefetch_related = ['invitations']
+    sort_fields = {'id': 'pk', 'holder': 'owner__name'}
+    search_fields = ['owner__name', 'owner__email_addr']
 
     def get_queryset(self,):
         return Ticket.objects.filter(pot='Django Girls').order_by('id')
@@ -290,6 +790,7 @@ class DjangoGirlsTicketsReport(ReportView):
 
 class ChildrensDayTicketsReport(ReportView):
     title = "Children's day tickets"
+    depends_on = [ChildOrder, ChildTicket]
     headings = [
         'ID',
         'Name',
@@ -298,6 +799,10 @@ class ChildrensDayTicketsReport(ReportView):
         'Adult phone number',
         'Age',
     ]
+    select_related = ['order']
+    sort_fields = {'id': 'pk', 'name': 'name', 'adult': 'order__adult_name'}
+    default_sort = 'name'
+    search_fields = ['name', 'order__adult_name', 'order__adult_email_addr']
 
     def presenter(self, ticket):
         if ticket.date_of_birth is not None:
@@ -320,6 +825,7 @@ class ChildrensDayTicketsReport(ReportView):
 
 class ChildrensDaySummaryReport(ReportView):
     title = "Children's day summary"
+    depends_on = [ChildTicket]
 
     def get_context_data(self):
         rows = [
@@ -348,6 +854,9 @@ class CFPPropsalsMixin:
         'Room',
         'Time',
     ]
+    sort_fields = {'id': 'pk', 'title': 'title', 'proposer': 'proposer__name', 'state': 'state', 'track': 'track'}
+    depends_on = [Application, Proposal, User]
+    search_fields = ['title', 'proposer__name']
 
     def presenter(self, proposal):
         link = {
@@ -377,70 +886,72 @@ class CFPPropsalsMixin:
         ]
 
 
-class CFPPropsals(ReportView, CFPPropsalsMixin):
+class CFPPropsals(CFPPropsalsMixin, ReportView):
     title = 'CFP Proposals'
 
     def get_queryset(self):
         return Proposal.objects.select_related('proposer', 'proposer__grant_application').all()
 
 
-class CFPPropsalsForEducationTrack(ReportView, CFPPropsalsMixin):
+class CFPPropsalsForEducationTrack(CFPPropsalsMixin, ReportView):
     title = 'CFP Proposals to be scheduled in education track'
 
     def get_queryset(self):
         return Proposal.objects.select_related('proposer', 'proposer__grant_application').filter(state='accepted', track='education')
 
 
-class CFPPropsalsPlanToAccept(ReportView, CFPPropsalsMixin):
+class CFPPropsalsPlanToAccept(CFPPropsalsMixin, ReportView):
     title = 'CFP Proposals we accepted'
 
     def get_queryset(self):
         return Proposal.objects.select_related('proposer', 'proposer__grant_application').filter(state='accepted')
 
 
-class CFPPropsalsPlanToAcceptOfTypeOther(ReportView, CFPPropsalsMixin):
+class CFPPropsalsPlanToAcceptOfTypeOther(CFPPropsalsMixin, ReportView):
     title = 'CFP Proposals we accepted with type "other"'
 
     def get_queryset(self):
         return Proposal.objects.select_related('proposer', 'proposer__grant_application').filter(state='accepted', session_type='other')
 
 
-class CFPPropsalsPlanToAcceptWithGrantApplications(ReportView, CFPPropsalsMixin):
+class CFPPropsalsPlanToAcceptWithGrantApplications(CFPPropsalsMixin, ReportView):
     title = "CFP Proposals we accepted from people who've applied for a grant"
+    sort_fields = dict(CFPPropsalsMixin.sort_fields, amount_requested='proposer__grant_application__amount_requested')
+    default_sort = 'amount_requested'
 
     def get_queryset(self):
         return Proposal.objects.select_related('proposer', 'proposer__grant_application').filter(state='accepted', proposer__grant_application__isnull=False).order_by('proposer__grant_application__amount_requested')
 
 
-class CFPPropsalsPlanToReject(ReportView, CFPPropsalsMixin):
+class CFPPropsalsPlanToReject(CFPPropsalsMixin, ReportView):
     title = 'CFP Proposals we plan to reject'
 
     def get_queryset(self):
         return Proposal.objects.select_related('proposer', 'proposer__grant_application').filter(state='plan to reject')
 
 
-class CFPPropsalsNoDecision(ReportView, CFPPropsalsMixin):
+class CFPPropsalsNoDecision(CFPPropsalsMixin, ReportView):
     title = 'CFP Proposals we with no decision'
 
     def get_queryset(self):
         return Proposal.objects.select_related('proposer', 'proposer__grant_application').filter(state='')
 
 
-class CFPPropsalsAimedAtNewProgrammers(ReportView, CFPPropsalsMixin):
+class CFPPropsalsAimedAtNewProgrammers(CFPPropsalsMixin, ReportView):
     title = 'CFP Proposals aimed at new programmers'
 
     def get_queryset(self):
         return Proposal.objects.select_related('proposer', 'proposer__grant_application').filter(aimed_at_new_programmers=True)
 
 
-class CFPPropsalsAimedAtTeachers(ReportView, CFPPropsalsMixin):
+class CFPPropsalsAimedAtTeachers(CFPPropsalsMixin, ReportView):
     title = 'CFP Proposals aimed at teachers'
 
     def get_queryset(self):
         return Proposal.objects.select_related('proposer', 'proposer__grant_application').filter(aimed_at_teachers=True)
 
 
-class CFPPropsalsAimedAtDataScientists(ReportView, CFPPropsalsMixin):
+class CFPPropsalsAimedAtDataScientists(CFPPropsalsMixin, ReportView):
     title = 'CFP Proposals aimed at data scientists'
 
     def get_queryset(self):
@@ -449,11 +960,15 @@ class CFPPropsalsAimedAtDataScientists(ReportView, CFPPropsalsMixin):
 
 class SpeakersSeekingMentorReport(ReportView):
     title = 'Speakers Seeking Mentors'
+    depends_on = [Proposal, User]
 
     headings = [
         'Speaker',
         'Title'
     ]
+    select_related = ['proposer']
+    sort_fields = {'id': 'pk', 'speaker': 'proposer__name', 'title': 'title'}
+    search_fields = ['title', 'proposer__name']
 
     def get_queryset(self):
         return Proposal.objects.filter(would_like_mentor=True)
@@ -464,12 +979,15 @@ class SpeakersSeekingMentorReport(ReportView):
 
 class AttendeesWithAccessibilityReqs(ReportView):
     title = 'Attendees with accessibility requirements'
+    depends_on = [User]
 
     headings = [
         'Name',
         'Email',
         'Requirements',
     ]
+    sort_fields = {'id': 'pk', 'name': 'name', 'email': 'email_addr'}
+    search_fields = ['name', 'email_addr']
 
     def get_queryset(self):
         return User.objects.filter(accessibility_reqs_yn=True)
@@ -480,12 +998,15 @@ class AttendeesWithAccessibilityReqs(ReportView):
 
 class AttendeesWithChildcareReqs(ReportView):
     title = 'Attendees with childcare requirements'
+    depends_on = [User]
 
     headings = [
         'Name',
         'Email',
         'Requirements',
     ]
+    sort_fields = {'id': 'pk', 'name': 'name', 'email': 'email_addr'}
+    search_fields = ['name', 'email_addr']
 
     def get_queryset(self):
         return User.objects.filter(childcare_reqs_yn=True)
@@ -496,12 +1017,15 @@ class AttendeesWithChildcareReqs(ReportView):
 
 class AttendeesWithDietaryReqs(ReportView):
     title = 'Attendees with dietary requirements'
+    depends_on = [User]
 
     headings = [
         'Name',
         'Email',
         'Requirements',
     ]
+    sort_fields = {'id': 'pk', 'name': 'name', 'email': 'email_addr'}
+    search_fields = ['name', 'email_addr']
 
     def get_queryset(self):
         return User.objects.filter(dietary_reqs_yn=True)
@@ -519,6 +1043,14 @@ class GrantApplicationsMixin:
         'Requested ticket only',
         'Special reply required',
     ]
+    sort_fields = {
+        'id': 'pk',
+        'name': 'applicant__name',
+        'amount_requested': 'amount_requested',
+        'amount_offered': 'amount_offered',
+    }
+    search_fields = ['applicant__name']
+    depends_on = [Application, User]
 
     def presenter(self, application):
         link = {
@@ -536,15 +1068,17 @@ class GrantApplicationsMixin:
         ]
 
 
-class GrantApplications(ReportView, GrantApplicationsMixin):
+class GrantApplications(GrantApplicationsMixin, ReportView):
     title = 'Grant applications'
+    default_sort = 'amount_requested'
 
     def get_queryset(self):
         return Application.objects.select_related('applicant').order_by('amount_requested').all()
 
 
-class GrantApplicationsWithFundsOffered(ReportView, GrantApplicationsMixin):
+class GrantApplicationsWithFundsOffered(GrantApplicationsMixin, ReportView):
     title = 'Grant applications with funds offered'
+    default_sort = 'amount_offered'
 
     def get_queryset(self):
         return Application.objects.filter(amount_offered__gt=0).select_related('applicant').order_by('amount_offered').all()
@@ -552,6 +1086,9 @@ class GrantApplicationsWithFundsOffered(ReportView, GrantApplicationsMixin):
 
 class PeopleMixin:
     headings = ['ID', 'Name', 'Email address']
+    depends_on = [User]
+    sort_fields = {'id': 'pk', 'name': 'name', 'email': 'email_addr'}
+    search_fields = ['name', 'email_addr']
 
     def presenter(self, user):
         link = {
@@ -566,36 +1103,42 @@ class PeopleMixin:
         ]
 
 
-class PeopleReport(ReportView, PeopleMixin):
+class PeopleReport(PeopleMixin, ReportView):
     title = 'People'
+    default_sort = 'name'
 
     def get_queryset(self):
         return User.objects.order_by('name').all()
 
 
-class ContributorReport(ReportView, PeopleMixin):
+class ContributorReport(PeopleMixin, ReportView):
     title = 'Contributors'
+    default_sort = 'name'
 
     def get_queryset(self):
         return User.objects.filter(is_contributor=True).order_by('name')
 
 
-class ContributorsWithoutDinnerReport(ReportView, PeopleMixin):
+class ContributorsWithoutDinnerReport(PeopleMixin, ReportView):
     title = "Contributors who haven't booked dinner"
+    depends_on = [DinnerBooking, User]
+    default_sort = 'name'
 
     def get_queryset(self):
         return User.objects.filter(is_contributor=True, dinner_bookings__isnull=True).order_by('name')
 
 
-class StaffReport(ReportView, PeopleMixin):
+class StaffReport(PeopleMixin, ReportView):
     title = 'Staff'
+    default_sort = 'name'
 
     def get_queryset(self):
         return User.objects.filter(is_staff=True).order_by('name')
 
 
-class TicketHoldersWithIncompleteNameReport(ReportView, PeopleMixin):
+class TicketHoldersWithIncompleteNameReport(PeopleMixin, ReportView):
     title = 'Ticket holders with incomplete name'
+    depends_on = [Ticket, User]
 
     def get_queryset(self):
         return User.objects.filter(ticket__isnull=False).exclude(name__contains=' ')
@@ -603,7 +1146,9 @@ class TicketHoldersWithIncompleteNameReport(ReportView, PeopleMixin):
 
 class AccommodationReport(ReportView):
     title = 'Accommodation booked'
+    depends_on = [Ticket, User]
     headings = []
+    paginated = False
 
     def get_queryset(self):
         return User.objects.filter(ticket__isnull=False).values('has_booked_hotel').annotate(Count('has_booked_hotel'))
@@ -617,7 +1162,12 @@ class AccommodationReport(ReportView):
 
 class AccommodationBookingsReport(ReportView):
     title = 'Accommodation booked through us'
+    depends_on = [AccommodationBooking, Ticket, User]
     headings = ['Room', 'Name', 'Email address']
+    select_related = ['guest', 'guest__ticket']
+    sort_fields = {'id': 'pk', 'room': 'room_key', 'name': 'guest__name'}
+    default_sort = 'room'
+    search_fields = ['guest__name', 'guest__email_addr']
 
     def get_queryset(self):
         return AccommodationBooking.objects.order_by('room_key')
@@ -640,13 +1190,25 @@ class AccommodationBookingsReport(ReportView):
 
 class TalkVotingReport(ReportView):
     title = 'Talk voting'
+    depends_on = [Proposal, TalkVotes, User, Vote]
+    materialized_views = [TalkVotes]
     headings = ['ID', 'Title', 'Proposer', 'Number of votes', 'Number interested']
+    select_related = ['proposer']
+    paginated = False
 
     def get_queryset(self):
-        return Proposal.objects.accepted_talks().annotate(
-            num_votes=Count('vote'),
-            num_interested=Sum(Case(When(vote__is_interested=True, then=Value(1)), default=Value(0)), output_field=IntegerField())
-        ).order_by('-num_interested', '-num_votes')
+        if settings.REPORTS_USE_MATERIALIZED_VIEWS:
+            votes = {
+                'num_votes': Coalesce('votes_summary__num_votes', Value(0)),
+                'num_interested': Coalesce('votes_summary__num_interested', Value(0)),
+            }
+        else:
+            votes = {
+                'num_votes': Count('vote'),
+                'num_interested': Sum(Case(When(vote__is_interested=True, then=Value(1)), default=Value(0)), output_field=IntegerField()),
+            }
+
+        return Proposal.objects.accepted_talks().annotate(**votes).order_by('-num_interested', '-num_votes', 'id')
 
     def presenter(self, proposal):
         link = {
@@ -665,13 +1227,24 @@ class TalkVotingReport(ReportView):
 
 class TalkVotingByUserReport(ReportView):
     title = 'Talk voting by user'
+    depends_on = [User, UserVotes, Vote]
+    materialized_views = [UserVotes]
     headings = ['Name', 'Number of votes', 'Number interested']
+    paginated = False
 
     def get_queryset(self):
-        return User.objects.annotate(
-            num_votes=Count('vote'),
-            num_interested=Sum(Case(When(vote__is_interested=True, then=Value(1)), default=Value(0)), output_field=IntegerField())
-        ).order_by('-num_votes', '-num_interested')
+        if settings.REPORTS_USE_MATERIALIZED_VIEWS:
+            votes = {
+                'num_votes': Coalesce('votes_summary__num_votes', Value(0)),
+                'num_interested': Coalesce('votes_summary__num_interested', Value(0)),
+            }
+        else:
+            votes = {
+                'num_votes': Count('vote'),
+                'num_interested': Sum(Case(When(vote__is_interested=True, then=Value(1)), default=Value(0)), output_field=IntegerField()),
+            }
+
+        return User.objects.annotate(**votes).order_by('-num_votes', '-num_interested', 'id')
 
     def presenter(self, user):
         return [
@@ -681,28 +1254,28 @@ class TalkVotingByUserReport(ReportView):
         ]
 
 
-class VolunteerSetupReport(ReportView, PeopleMixin):
+class VolunteerSetupReport(PeopleMixin, ReportView):
     title = 'Volunteers to setup'
 
     def get_queryset(self):
         return User.objects.filter(volunteer_setup=True)
 
 
-class VolunteerSessionChairReport(ReportView, PeopleMixin):
+class VolunteerSessionChairReport(PeopleMixin, ReportView):
     title = 'Volunteers to chair sessions'
 
     def get_queryset(self):
         return User.objects.filter(volunteer_session_chair=True)
 
 
-class VolunteerVideorReport(ReportView, PeopleMixin):
+class VolunteerVideorReport(PeopleMixin, ReportView):
     title = 'Volunteers to help with videoing'
 
     def get_queryset(self):
         return User.objects.filter(volunteer_videoer=True)
 
 
-class VolunteerRegDeskReport(ReportView, PeopleMixin):
+class VolunteerRegDeskReport(PeopleMixin, ReportView):
     title = 'Volunteers to staff registration desk'
 
     def get_queryset(self):
@@ -711,6 +1284,10 @@ class VolunteerRegDeskReport(ReportView, PeopleMixin):
 
 class DinnerMixin:
     headings = ['Name', 'Email address', 'Complimentary', 'Starter', 'Main', 'Pudding']
+    depends_on = [DinnerBooking, User]
+    sort_fields = {'id': 'pk', 'name': 'guest__name', 'email': 'guest__email_addr'}
+    default_sort = 'name'
+    search_fields = ['guest__name', 'guest__email_addr']
 
     def presenter(self, booking):
         return [
@@ -730,24 +1307,28 @@ class ConferenceDinnerReport(DinnerMixin, ReportView):
         return DinnerBooking.objects.filter(venue='conference').select_related('guest').order_by('guest__name')
 
 
-class ConferenceDinnerSummary(ReportView):
-    title = 'Conference dinner summary'
+class DinnerSummaryMixin:
     headings = ['Course', 'Option', 'Number']
+    depends_on = [DinnerBooking, DinnerCourseCounts]
+    materialized_views = [DinnerCourseCounts]
 
     def get_rows(self):
-        menu = MENUS['conference']
+        menu = MENUS[self.venue]
+        totals = dinner_course_totals(self.venue)
         rows = []
 
         for course in ['starter', 'main', 'pudding']:
-            counts = DinnerBooking.objects.filter(venue='conference').values(course).annotate(total=Count(course)).order_by(course)
-            key_to_total = {count[course]: count['total'] for count in counts}
-
             for key, description in menu[course]:
-                rows.append([course, description, key_to_total[key]])
+                rows.append([course, description, totals[course].get(key, 0)])
 
         return rows
 
 
+class ConferenceDinnerSummary(DinnerSummaryMixin, ReportView):
+    title = 'Conference dinner summary'
+    venue = 'conference'
+
+
 class ContributorsDinnerReport(DinnerMixin, ReportView):
     title = "Contributors' dinner"
 
@@ -755,27 +1336,16 @@ class ContributorsDinnerReport(DinnerMixin, ReportView):
         return DinnerBooking.objects.filter(venue='contributors').select_related('guest').order_by('guest__name')
 
 
-class ContributorsDinnerSummary(ReportView):
+class ContributorsDinnerSummary(DinnerSummaryMixin, ReportView):
     title = "Contributors' dinner summary"
-    headings = ['Course', 'Option', 'Number']
-
-    def get_rows(self):
-        menu = MENUS['contributors']
-        rows = []
-
-        for course in ['starter', 'main', 'pudding']:
-            counts = DinnerBooking.objects.filter(venue='contributors').values(course).annotate(total=Count(course)).order_by(course)
-            key_to_total = {count[course]: count['total'] for count in counts}
-
-            for key, description in menu[course]:
-                rows.append([course, description, key_to_total[key]])
-
-        return rows
+    venue = 'contributors'
 
 
 class DinnerSummaryReport(ReportView):
     title = 'Dinner summary'
+    depends_on = [DinnerBooking]
     headings = ['Dinner', 'Numbers']
+    paginated = False
 
     def get_queryset(self):
         return DinnerBooking.objects.values('venue').annotate(total=Count('venue')).order_by('venue')
@@ -789,7 +1359,9 @@ class DinnerSummaryReport(ReportView):
 
 class EveningEventSummaryReport(ReportView):
     title = 'Evening event summary'
+    depends_on = [User]
     headings = ['Event', 'Numbers']
+    paginated = False
 
     def get_queryset(self):
         return [
@@ -806,6 +1378,8 @@ reports = [
     TicketSummaryReport,
     ChildrensDaySummaryReport,
     TicketSalesReport,
+    TicketSalesOverTimeReport,
+    TicketExplorerReport,
     OrdersReport,
     UnpaidOrdersReport,
     TicketsReport,
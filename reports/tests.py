@@ -1,9 +1,25 @@
-from django.test import TestCase
+from unittest.mock import patch
 
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.six import StringIO
+
+from accommodation.tests import factories as accommodation_factories
 from accounts.tests import factories as accounts_factories
+from cfp.tests import factories as cfp_factories
+from children.tests import factories as children_factories
+from dinners.tests import factories as dinners_factories
 from tickets.tests import factories as tickets_factories
 
-from reports import reports
+from tickets import actions as tickets_actions
+from tickets.models import Order, Ticket
+
+from reports import cache as report_cache
+from reports import pivot, reports
+from reports.models import CacheCounts, MaterializedViewRefresh
 
 
 class ReportsTestCase(TestCase):
@@ -21,6 +37,11 @@ class ReportsTestCase(TestCase):
     def setUp(self):
         self.client.force_login(self.alice)
 
+    def tearDown(self):
+        # Write the counts this test made to the database, so that they're
+        # rolled back rather than being seen by the next test
+        report_cache.flush_counts()
+
 
 class TestIndex(ReportsTestCase):
     def test_get(self):
@@ -40,6 +61,237 @@ class TestIndex(ReportsTestCase):
         self.assertRedirects(rsp, '/accounts/login/?next=/reports/')
 
 
+class TestAllReports(ReportsTestCase):
+    def test_get_with_sort_and_search(self):
+        for report in reports.reports:
+            if not (report.paginated and hasattr(report, 'get_queryset')):
+                continue
+            url = reverse(report.namespaced_url_name())
+            for sort in report.sort_fields:
+                rsp = self.client.get(url, {'sort': f'-{sort}', 'q': 'x'})
+                self.assertEqual(rsp.status_code, 200, (url, sort))
+
+
+class TestPeopleReport(ReportsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for name in ['Carol', 'Dave', 'Erin', 'Frank', 'Grace']:
+            accounts_factories.create_user(name=name, email_addr=f'{name.lower()}@example.com')
+
+    def names(self, rsp):
+        return [row[1] for row in rsp.context['rows']]
+
+    def test_get_context_data_sorts_by_name(self):
+        report = reports.PeopleReport()
+        rows = report.get_context_data()['rows']
+        self.assertEqual([row[1] for row in rows], ['Alice', 'Bob', 'Carol', 'Dave', 'Erin', 'Frank', 'Grace'])
+
+    def test_sort(self):
+        rsp = self.client.get('/reports/people/?sort=-email')
+        self.assertEqual(self.names(rsp), ['Grace', 'Frank', 'Erin', 'Dave', 'Carol', 'Bob', 'Alice'])
+
+    def test_sort_with_unknown_key(self):
+        rsp = self.client.get('/reports/people/?sort=password')
+        self.assertEqual(self.names(rsp)[:2], ['Alice', 'Bob'])
+
+    def test_search(self):
+        rsp = self.client.get('/reports/people/?q=RA')
+        self.assertEqual(self.names(rsp), ['Frank', 'Grace'])
+
+    def test_search_with_several_terms(self):
+        rsp = self.client.get('/reports/people/?q=ra+gr')
+        self.assertEqual(self.names(rsp), ['Grace'])
+
+    @patch.object(reports.PeopleReport, 'page_size', 3)
+    def test_pagination(self):
+        rsp = self.client.get('/reports/people/?sort=-name&q=example')
+        self.assertEqual(self.names(rsp), ['Grace', 'Frank', 'Erin'])
+
+        rsp = self.client.get('/reports/people/' + rsp.context['next_page_url'])
+        self.assertEqual(self.names(rsp), ['Dave', 'Carol', 'Bob'])
+
+        rsp = self.client.get('/reports/people/' + rsp.context['next_page_url'])
+        self.assertEqual(self.names(rsp), ['Alice'])
+        self.assertNotIn('next_page_url', rsp.context)
+
+    @patch.object(reports.PeopleReport, 'page_size', 3)
+    def test_pagination_with_equal_sort_values(self):
+        for _ in range(3):
+            accounts_factories.create_user(name='Bob')
+
+        emails = []
+        url = '/reports/people/?sort=name'
+        while True:
+            rsp = self.client.get(url)
+            emails.extend(row[2] for row in rsp.context['rows'])
+            if 'next_page_url' not in rsp.context:
+                break
+            url = '/reports/people/' + rsp.context['next_page_url']
+
+        self.assertEqual(len(emails), 10)
+        self.assertEqual(len(set(emails)), 10)
+
+    def test_pagination_with_bad_cursor(self):
+        rsp = self.client.get('/reports/people/?after=xxx')
+        self.assertEqual(rsp.status_code, 404)
+
+    def test_csv_is_sorted_and_filtered_but_not_paginated(self):
+        rsp = self.client.get('/reports/people/?sort=-name&q=ra&format=csv&after=xxx')
+        lines = b''.join(rsp.streaming_content).decode('utf8').splitlines()
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['Grace', 'Frank'])
+
+
+class TestReportCache(ReportsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        tickets_factories.create_ticket(num_days=1)
+
+    def get_rows(self, url='/reports/attendance-by-day/'):
+        rsp = self.client.get(url)
+        return rsp.context['rows']
+
+    def test_second_request_is_served_from_cache(self):
+        rsp = self.client.get('/reports/attendance-by-day/')
+        self.assertEqual(rsp.context['cache_counts'], {'hits': 0, 'misses': 1})
+
+        with patch.object(reports.AttendanceByDayReport, 'get_context_data') as get_context_data:
+            rsp = self.client.get('/reports/attendance-by-day/')
+        get_context_data.assert_not_called()
+
+        self.assertEqual(rsp.context['rows'][0], ['Thursday', 1, 0, 0, 0, 1])
+        self.assertEqual(rsp.context['cache_counts'], {'hits': 1, 'misses': 1})
+        self.assertContains(rsp, '1 cache hit, 1 cache miss')
+
+    def test_saving_dependency_invalidates_cache(self):
+        self.assertEqual(self.get_rows()[0], ['Thursday', 1, 0, 0, 0, 1])
+        tickets_factories.create_ticket(num_days=1)
+        self.assertEqual(self.get_rows()[0], ['Thursday', 2, 0, 0, 0, 2])
+
+    def test_bulk_creating_dependency_invalidates_cache(self):
+        self.assertEqual(self.get_rows()[0], ['Thursday', 1, 0, 0, 0, 1])
+        Ticket.objects.bulk_create_free_with_invitations([('zoe@example.com', 'Financial assistance', ['thu'])])
+        self.assertEqual(self.get_rows()[0], ['Thursday', 1, 0, 0, 1, 2])
+
+    def test_deleting_dependency_invalidates_cache(self):
+        self.assertEqual(self.get_rows()[0], ['Thursday', 1, 0, 0, 0, 1])
+        Ticket.objects.all().delete()
+        self.assertEqual(self.get_rows()[0], ['Thursday', 0, 0, 0, 0, 0])
+
+    def test_saving_other_model_does_not_invalidate_cache(self):
+        self.get_rows()
+        dinners_factories.create_contributors_booking(self.bob)
+        rsp = self.client.get('/reports/attendance-by-day/')
+        self.assertEqual(rsp.context['cache_counts'], {'hits': 1, 'misses': 1})
+
+    def test_cache_hit_does_not_write_counts(self):
+        self.get_rows()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_rows()
+
+        writes = [q['sql'] for q in queries if 'reports_cachecounts' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(writes, [])
+        self.assertFalse(CacheCounts.objects.exists())
+
+    def test_counts_are_written_in_batches(self):
+        for _ in range(report_cache.FLUSH_EVERY - 1):
+            report_cache.increment('attendance-by-day', 'hits')
+        self.assertFalse(CacheCounts.objects.exists())
+
+        report_cache.increment('attendance-by-day', 'misses')
+        counts = CacheCounts.objects.get(report_name='attendance-by-day')
+        self.assertEqual((counts.hits, counts.misses), (report_cache.FLUSH_EVERY - 1, 1))
+
+        report_cache.increment('attendance-by-day', 'hits')
+        report_cache.flush_counts()
+        counts.refresh_from_db()
+        self.assertEqual((counts.hits, counts.misses), (report_cache.FLUSH_EVERY, 1))
+        self.assertEqual(report_cache.get_counts('attendance-by-day'), {'hits': report_cache.FLUSH_EVERY, 'misses': 1})
+
+    def test_request_parameters_are_cached_separately(self):
+        ascending = self.get_rows('/reports/people/?sort=email')
+        descending = self.get_rows('/reports/people/?sort=-email')
+        self.assertEqual(len(ascending), 3)
+        self.assertEqual(descending, ascending[::-1])
+
+
+@override_settings(REPORTS_USE_MATERIALIZED_VIEWS=True)
+class TestMaterializedViews(ReportsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        tickets_factories.create_ticket(num_days=1)
+        tickets_factories.create_ticket(num_days=2, rate='corporate')
+        tickets_factories.create_free_ticket('dave@example.com')
+
+        proposals = [cfp_factories.create_proposal() for _ in range(3)]
+        proposals[0].vote(cls.alice, True)
+        proposals[0].vote(cls.bob, True)
+        proposals[1].vote(cls.alice, False)
+
+        dinners_factories.create_contributors_booking(cls.alice)
+        dinners_factories.create_contributors_booking(cls.bob)
+        dinners_factories.create_paid_booking()
+
+    def refresh(self, *args):
+        out = StringIO()
+        call_command('refreshreports', *args, stdout=out)
+        return out.getvalue()
+
+    def get_live_and_materialized_rows(self, report_class):
+        with override_settings(REPORTS_USE_MATERIALIZED_VIEWS=False):
+            live_rows = report_class().get_context_data()['rows']
+        return live_rows, report_class().get_context_data()['rows']
+
+    def test_refreshreports(self):
+        output = self.refresh()
+        self.assertIn('Refreshed reports_talkvotes in', output)
+        self.assertEqual(MaterializedViewRefresh.objects.count(), 4)
+
+    def test_refreshreports_concurrently(self):
+        output = self.refresh('--concurrently')
+        self.assertIn('Refreshed reports_ticketcounts in', output)
+
+    def test_reports_match_live_reports(self):
+        self.refresh()
+        for report_class in [
+            reports.AttendanceByDayReport,
+            reports.TicketSummaryReport,
+            reports.TalkVotingReport,
+            reports.TalkVotingByUserReport,
+            reports.ConferenceDinnerSummary,
+            reports.ContributorsDinnerSummary,
+        ]:
+            live_rows, materialized_rows = self.get_live_and_materialized_rows(report_class)
+            self.assertEqual(materialized_rows, live_rows, report_class)
+
+    def test_reports_are_only_updated_by_refresh(self):
+        self.refresh()
+        tickets_factories.create_ticket(num_days=1)
+
+        live_rows, materialized_rows = self.get_live_and_materialized_rows(reports.AttendanceByDayReport)
+        self.assertEqual(live_rows[0][1], 2)
+        self.assertEqual(materialized_rows[0][1], 1)
+
+        self.refresh()
+        rsp = self.client.get('/reports/attendance-by-day/')
+        self.assertEqual(rsp.context['rows'][0][1], 2)
+
+    def test_get_shows_refresh_time(self):
+        rsp = self.client.get('/reports/talk-voting/')
+        self.assertContains(rsp, 'Data has not been refreshed yet')
+
+        self.refresh()
+        rsp = self.client.get('/reports/talk-voting/')
+        self.assertContains(rsp, 'Data as of')
+
+    def test_get_for_report_without_materialized_view(self):
+        rsp = self.client.get('/reports/people/')
+        self.assertNotIn('uses_materialized_views', rsp.context)
+
+
 class TestAttendanceByDayReport(ReportsTestCase):
     @classmethod
     def setUpTestData(cls):
@@ -65,6 +317,20 @@ class TestAttendanceByDayReport(ReportsTestCase):
         }
         self.assertEqual(report.get_context_data(), expected)
 
+    def test_num_queries_does_not_depend_on_number_of_tickets(self):
+        report = reports.AttendanceByDayReport()
+        with self.assertNumQueries(1):
+            report.get_context_data()
+
+        tickets_factories.create_ticket(num_days=5, rate='education')
+        tickets_factories.create_completed_free_ticket(self.bob)
+
+        with self.assertNumQueries(1):
+            rows = report.get_context_data()['rows']
+
+        self.assertEqual(rows[0], ['Thursday', 3, 2, 1, 1, 7])
+        self.assertEqual(rows[4], ['Monday', 1, 0, 1, 0, 2])
+
     def test_get(self):
         rsp = self.client.get('/reports/attendance-by-day/')
         self.assertEqual(rsp.status_code, 200)
@@ -113,10 +379,203 @@ class TestTicketSalesReport(ReportsTestCase):
         }
         self.assertEqual(report.get_context_data(), expected)
 
+    def test_num_queries_does_not_depend_on_number_of_tickets(self):
+        report = reports.TicketSalesReport()
+        with self.assertNumQueries(1):
+            report.get_context_data()
+
+        for _ in range(3):
+            tickets_factories.create_ticket(num_days=2, rate='education')
+
+        with self.assertNumQueries(1):
+            context = report.get_context_data()
+
+        self.assertEqual(context['num_tickets_rows'][1], [2, 0, 1, 3, 0, 4])
+        self.assertEqual(context['ticket_cost_rows'][1], [2, '£0', '£180', '£90', '£0', '£270'])
+
     def test_get(self):
         rsp = self.client.get('/reports/ticket-sales/')
         self.assertEqual(rsp.status_code, 200)
 
+    def test_get_csv(self):
+        rsp = self.client.get('/reports/ticket-sales/?format=csv')
+        self.assertEqual(rsp.status_code, 200)
+        lines = b''.join(rsp.streaming_content).decode('utf8').splitlines()
+        self.assertEqual(lines[:3], [
+            'Tickets sold',
+            'Days,Individual rate,Corporate rate,Education rate,Free,Total',
+            '1,1,0,0,0,1',
+        ])
+        self.assertEqual(lines[7:10], [
+            '',
+            'Ticket income',
+            'Days,Individual rate,Corporate rate,Education rate,Free,Total',
+        ])
+        self.assertEqual(lines[-1], '5,£198,£0,£0,£0,£198')
+
+
+class TestTicketSalesOverTimeReport(ReportsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        order = tickets_factories.create_pending_order_for_self(num_days=3)
+        tickets_actions.confirm_order(order, 'ch_1', 1495355163)  # 2017-05-21 08:26
+        order = tickets_factories.create_pending_order_for_self(rate='corporate', num_days=2)
+        tickets_actions.confirm_order(order, 'ch_2', 1495533600)  # 2017-05-23 10:00
+
+    def test_get_context_data(self):
+        report = reports.TicketSalesOverTimeReport()
+        with self.assertNumQueries(1):
+            context = report.get_context_data()
+
+        self.assertEqual(context['headings'], [
+            'Period',
+            'Tickets',
+            'Days',
+            'Revenue (incl. VAT)',
+            'Cumulative tickets',
+            'Cumulative days',
+            'Cumulative revenue',
+        ])
+        self.assertEqual(context['rows'], [
+            ['2017-05-21', 1, 3, '£126', 1, 3, '£126'],
+            ['2017-05-23', 1, 2, '£180', 2, 5, '£306'],
+        ])
+        self.assertEqual(len(context['chart']['bars']), 2)
+
+    def test_get(self):
+        rsp = self.client.get('/reports/ticket-sales-over-time/')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertContains(rsp, '<polyline')
+
+    def test_get_by_hour(self):
+        rsp = self.client.get('/reports/ticket-sales-over-time/?period=hour')
+        self.assertEqual([row[0] for row in rsp.context['rows']], ['2017-05-21 08:00', '2017-05-23 10:00'])
+
+    def test_get_with_no_sales(self):
+        Order.objects.all().delete()
+        rsp = self.client.get('/reports/ticket-sales-over-time/')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertNotContains(rsp, '<svg')
+
+    def test_get_csv(self):
+        rsp = self.client.get('/reports/ticket-sales-over-time/?period=week&format=csv')
+        lines = b''.join(rsp.streaming_content).decode('utf8').splitlines()
+        self.assertEqual(lines[1:], ['w/c 2017-05-15,1,3,£126,1,3,£126', 'w/c 2017-05-22,1,2,£180,2,5,£306'])
+
+
+class TestTicketExplorerReport(ReportsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        carol = accounts_factories.create_user(name='Carol', email_addr='carol@example.com')
+        carol.is_contributor = True
+        carol.save()
+        tickets_factories.create_ticket(carol, rate='corporate', num_days=5)
+        dinners_factories.create_contributors_booking(carol)
+        tickets_factories.create_ticket(cls.bob, rate='corporate', num_days=2)
+        tickets_factories.create_ticket(num_days=3)
+        tickets_factories.create_free_ticket('dave@example.com', pot='Financial assistance')
+
+    def test_crosstab(self):
+        cube = pivot.get_cube()
+        self.assertEqual(cube.crosstab('rate', 'claimed'), {
+            ('corporate', 'Yes'): 2,
+            ('individual', 'Yes'): 1,
+            ('free', 'No'): 1,
+        })
+
+    def test_crosstab_with_multi_valued_dimension(self):
+        cube = pivot.get_cube()
+        counts = cube.crosstab('day', 'rate')
+        self.assertEqual(counts[('Thursday', 'corporate')], 2)
+        self.assertEqual(counts[('Sunday', 'corporate')], 1)
+        self.assertEqual(counts[('Saturday', 'individual')], 1)
+        self.assertNotIn(('Monday', 'individual'), counts)
+
+    def test_crosstab_with_filters(self):
+        cube = pivot.get_cube()
+        filters = {'rate': 'corporate', 'day': 'Sunday', 'contributor': 'Yes'}
+        self.assertEqual(cube.crosstab('dinner', 'pot', filters), {('Contributors', 'None'): 1})
+
+    def test_cube_with_many_pots(self):
+        tickets = [{
+            'rate': 'free',
+            'day_mask': 1,
+            'num_days': 1,
+            'pot': f'Pot {ix}',
+            'owner_id': None,
+            'is_contributor': None,
+            'has_booked_hotel': None,
+            'is_ukpa_member': None,
+            'conference_dinner': False,
+            'contributors_dinner': False,
+        } for ix in range(300)]
+
+        cube = pivot.TicketCube(tickets)
+
+        self.assertEqual(cube.crosstab('pot', 'rate', {'pot': 'Pot 299'}), {('Pot 299', 'free'): 1})
+
+    def test_cube_is_only_rebuilt_when_tickets_change(self):
+        cube = pivot.get_cube()
+        self.assertIs(pivot.get_cube(), cube)
+
+        tickets_factories.create_ticket(num_days=1)
+        new_cube = pivot.get_cube()
+        self.assertIsNot(new_cube, cube)
+        self.assertEqual(new_cube.size, 5)
+
+    def test_get(self):
+        rsp = self.client.get('/reports/ticket-explorer/?rows=rate&columns=dinner&day=Sunday')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.context['headings'], ['Rate / Dinner', 'None', 'Conference', 'Contributors', 'Both', 'Total'])
+        self.assertEqual(rsp.context['rows'], [
+            ['free', 0, 0, 0, 0, 0],
+            ['individual', 0, 0, 0, 0, 0],
+            ['corporate', 0, 0, 1, 0, 1],
+            ['education', 0, 0, 0, 0, 0],
+            ['Total', 0, 0, 1, 0, 1],
+        ])
+
+    def test_get_with_unknown_dimensions(self):
+        rsp = self.client.get('/reports/ticket-explorer/?rows=password&rate=cheap')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.context['rows'][-1], ['Total', 3, 3, 2, 1, 1, 10])
+
+
+class TestTicketSummaryReport(ReportsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        tickets_factories.create_ticket(num_days=1)
+        tickets_factories.create_ticket(num_days=2, rate='corporate')
+        tickets_factories.create_ticket(num_days=3)
+        tickets_factories.create_completed_free_ticket(cls.bob)
+
+    def test_get_context_data(self):
+        report = reports.TicketSummaryReport()
+        expected = {
+            'title': 'Ticket summary',
+            'headings': [],
+            'rows': [
+                ['Tickets', 4],
+                ['Days', 9],
+                ['Cost (excl. VAT)', '£300'],  # 300 == (15 + 30) + (30 + 120) + (15 + 90) + 0
+            ],
+        }
+        with self.assertNumQueries(1):
+            self.assertEqual(report.get_context_data(), expected)
+
+    def test_get(self):
+        rsp = self.client.get('/reports/ticket-summary/')
+        self.assertEqual(rsp.status_code, 200)
+
+    def test_get_csv(self):
+        rsp = self.client.get('/reports/ticket-summary/?format=csv')
+        self.assertEqual(rsp.status_code, 200)
+        content = b''.join(rsp.streaming_content).decode('utf8')
+        self.assertEqual(content, 'Tickets,4\r\nDays,9\r\nCost (excl. VAT),£300\r\n')
+
 
 class TestOrdersReport(ReportsTestCase):
     @classmethod
@@ -141,10 +600,35 @@ class TestOrdersReport(ReportsTestCase):
         }
         self.assertEqual(report.get_context_data(), expected)
 
+    def test_num_queries_does_not_depend_on_number_of_orders(self):
+        report = reports.OrdersReport()
+        with self.assertNumQueries(2):
+            report.get_context_data()
+
+        tickets_factories.create_confirmed_order_for_self_and_others()
+        tickets_factories.create_pending_order_for_others()
+
+        with self.assertNumQueries(2):
+            rows = report.get_context_data()['rows']
+
+        self.assertEqual([row[4:6] for row in rows], [[1, '£54'], [1, '£90'], [3, '£306'], [2, '£180']])
+
     def test_get(self):
         rsp = self.client.get('/reports/all-orders/')
         self.assertEqual(rsp.status_code, 200)
 
+    def test_get_csv(self):
+        rsp = self.client.get('/reports/all-orders/?format=csv')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(rsp['Content-Disposition'], 'attachment; filename="all-orders.csv"')
+        content = b''.join(rsp.streaming_content).decode('utf8')
+        self.assertEqual(content.splitlines(), [
+            'ID,Rate,Purchaser,Email,Tickets,Cost (incl. VAT),Status',
+            f'{self.order1.order_id},individual,Alice,alice@example.com,1,£54,pending',
+            f'{self.order2.order_id},individual,Bob,bob@example.com,1,£90,successful',
+        ])
+
 
 class TestUnpaidOrdersReport(ReportsTestCase):
     @classmethod
@@ -198,10 +682,105 @@ class TestTicketsReport(ReportsTestCase):
         }
         self.assertEqual(report.get_context_data(), expected)
 
+    def test_num_queries_does_not_depend_on_number_of_tickets(self):
+        report = reports.TicketsReport()
+        with self.assertNumQueries(2):
+            report.get_context_data()
+
+        tickets_factories.create_confirmed_order_for_self_and_others()
+        tickets_factories.create_free_ticket('dave@example.com')
+
+        with self.assertNumQueries(2):
+            rows = report.get_context_data()['rows']
+
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[6][1:3], ['free', 'dave@example.com'])
+
     def test_get(self):
         rsp = self.client.get('/reports/all-tickets/')
         self.assertEqual(rsp.status_code, 200)
 
+    def test_get_tsv(self):
+        rsp = self.client.get('/reports/all-tickets/?format=tsv')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp['Content-Type'], 'text/tab-separated-values; charset=utf-8')
+        content = b''.join(rsp.streaming_content).decode('utf8')
+        self.assertEqual(content.splitlines(), [
+            'ID\tRate\tTicket holder\tDays\tCost (incl. VAT)\tStatus',
+            f'{self.ticket1.ticket_id}\tindividual\tAlice\tThursday, Friday, Saturday\t£126\tAssigned',
+            f'{self.ticket2.ticket_id}\tindividual\tbob@example.com\tFriday, Saturday\t£90\tUnclaimed',
+            f'{self.ticket3.ticket_id}\tindividual\tcarol@example.com\tSaturday, Sunday\t£90\tUnclaimed',
+        ])
+
+    def test_export_rows_are_read_in_chunks(self):
+        report = reports.TicketsReport()
+        report.export_chunk_size = 2
+
+        # One query for the tickets, and one for the invitations for each
+        # chunk of two tickets
+        with self.assertNumQueries(3):
+            rows = list(report.get_export_rows())
+
+        self.assertEqual(rows[1:], report.get_context_data()['rows'])
+
+
+class TestFreeTicketsReport(ReportsTestCase):
+    def test_num_queries_does_not_depend_on_number_of_tickets(self):
+        report = reports.FreeTicketsReport()
+        tickets_factories.create_free_ticket('carol@example.com')
+        with self.assertNumQueries(2):
+            report.get_context_data()
+
+        tickets_factories.create_completed_free_ticket(self.bob, pot='Sponsor: Acme')
+
+        with self.assertNumQueries(2):
+            rows = report.get_context_data()['rows']
+
+        self.assertEqual(rows[0][1:], ['carol@example.com', '', 'Financial assistance', 'Unclaimed'])
+        self.assertEqual(rows[1][1:], ['Bob', 'Thursday, Friday, Saturday', 'Sponsor: Acme', 'Assigned'])
+
+    def test_get(self):
+        rsp = self.client.get('/reports/free-tickets/')
+        self.assertEqual(rsp.status_code, 200)
+
+
+class TestChildrensDayTicketsReport(ReportsTestCase):
+    def test_num_queries_does_not_depend_on_number_of_tickets(self):
+        report = reports.ChildrensDayTicketsReport()
+        children_factories.create_confirmed_order()
+        with self.assertNumQueries(1):
+            report.get_context_data()
+
+        children_factories.create_confirmed_order()
+
+        with self.assertNumQueries(1):
+            rows = report.get_context_data()['rows']
+
+        self.assertEqual(len(rows), 2)
+
+    def test_get(self):
+        rsp = self.client.get('/reports/childrens-day-tickets/')
+        self.assertEqual(rsp.status_code, 200)
+
+
+class TestAccommodationBookingsReport(ReportsTestCase):
+    def test_num_queries_does_not_depend_on_number_of_bookings(self):
+        report = reports.AccommodationBookingsReport()
+        accommodation_factories.create_booking()
+        with self.assertNumQueries(1):
+            report.get_context_data()
+
+        accommodation_factories.create_booking(tickets_factories.create_ticket(num_days=2).owner)
+
+        with self.assertNumQueries(1):
+            rows = report.get_context_data()['rows']
+
+        self.assertEqual([row[3] for row in rows], ['', ['Thursday', 'Friday']])
+
+    def test_get(self):
+        rsp = self.client.get('/reports/accommodation-booked-through-us/')
+        self.assertEqual(rsp.status_code, 200)
+
 
 class TestUnclaimedTicketsReport(ReportsTestCase):
     @classmethod
@@ -7,21 +7,32 @@
 #    functions in this module.  This means that test data should always be
 #    in a consistent state.
 
-from django_slack import slack_message
 import stripe
 
+from django.conf import settings
 from django.db import transaction
+from django.db.models import F
 from django.db.utils import IntegrityError
+from django.utils import timezone
 
-from ironcage.stripe_integration import create_charge_for_order, refund_charge
+from children import actions as children_actions
+from ironcage.bulk_mail import BulkMailer
+from ironcage.stripe_integration import NON_RETRYABLE_STRIPE_ERRORS, STRIPE_ERROR_MESSAGE, create_charge_for_order, is_live_mode, refund_charge
+from jobs.queue import enqueue
 
-from .mailer import send_invitation_mail, send_order_confirmation_mail, send_order_refund_mail
-from .models import Order, Ticket
+from . import jobs
+from .mailer import build_invitation_reminder_mail
+from .models import Order, SoldOut, StripeEvent, Ticket, TicketInvitation
 
 import structlog
 logger = structlog.get_logger()
 
 
+# Invitations for free tickets created in bulk are sent this many at a time,
+# each batch over its own connection to the mail server
+INVITATION_BATCH_SIZE = 50
+
+
 def create_pending_order(purchaser, rate, days_for_self=None, email_addrs_and_days_for_others=None, company_details=None):
     logger.info('create_pending_order', purchaser=purchaser.id, rate=rate)
     with transaction.atomic():
@@ -40,26 +51,113 @@ def update_pending_order(order, rate, days_for_self=None, email_addrs_and_days_f
         order.update(rate, days_for_self, email_addrs_and_days_for_others, company_details)
 
 
+def start_stripe_charge(order, token):
+    '''Mark the order as processing, and enqueue a job to charge the card.
+
+    The order is confirmed, or marked as failed, by that job or by our
+    webhook hearing from Stripe about the charge, whichever happens first.
+    '''
+    logger.info('start_stripe_charge', order=order.order_id, token=token)
+    assert order.payment_required()
+    with transaction.atomic():
+        order.mark_as_processing()
+        enqueue(jobs.process_stripe_charge, order_id=order.id, token=token)
+
+
 def process_stripe_charge(order, token):
     logger.info('process_stripe_charge', order=order.order_id, token=token)
-    assert order.payment_required()
+    assert order.is_unconfirmed()
     try:
         charge = create_charge_for_order(order, token)
-        confirm_order(order, charge.id, charge.created)
     except stripe.error.CardError as e:
         mark_order_as_failed(order, e._message)
+    except NON_RETRYABLE_STRIPE_ERRORS:
+        logger.exception('process_stripe_charge_error', order=order.order_id)
+        mark_order_as_failed(order, STRIPE_ERROR_MESSAGE)
+    else:
+        confirm_order_or_refund(order, charge.id, charge.created)
+
+
+def confirm_order_or_refund(order, charge_id, charge_created):
+    try:
+        confirm_order(order, charge_id, charge_created)
+    except SoldOut as e:
+        # The purchaser can change their order and try again
+        refund_charge(charge_id)
+        mark_order_as_failed(order, str(e))
     except IntegrityError:
-        refund_charge(charge.id)
-        mark_order_as_errored_after_charge(order, charge.id)
+        refund_charge(charge_id)
+        mark_order_as_errored_after_charge(order, charge_id)
+
+
+def record_stripe_event(event):
+    '''Record an event that Stripe has sent to our webhook, and if we haven't
+    seen it before, enqueue a job to process it.'''
+    logger.info('record_stripe_event', event_id=event['id'], type=event['type'])
+    with transaction.atomic():
+        stripe_event, created = StripeEvent.objects.get_or_create(
+            event_id=event['id'],
+            defaults={'type': event['type'], 'payload': event},
+        )
+        if created:
+            enqueue(jobs.process_stripe_event, event_id=stripe_event.event_id)
+    return stripe_event
+
+
+def process_stripe_event(stripe_event):
+    logger.info('process_stripe_event', event_id=stripe_event.event_id, type=stripe_event.type)
+    with transaction.atomic():
+        # An event from test mode must never confirm an order that should be
+        # paid for with a real card, nor one from live mode an order in a test
+        # deployment.
+        if bool(stripe_event.payload.get('livemode')) != is_live_mode():
+            logger.warning('stripe_event_ignored', event_id=stripe_event.event_id, livemode=stripe_event.payload.get('livemode'))
+
+        elif stripe_event.type in ['charge.succeeded', 'charge.failed']:
+            charge = stripe_event.charge()
+            succeeded = stripe_event.type == 'charge.succeeded'
+            if charge['metadata'].get('app') == 'children':
+                children_actions.process_stripe_charge_event(charge, succeeded)
+            else:
+                process_stripe_charge_event(charge, succeeded)
+
+        stripe_event.processed_at = timezone.now()
+        stripe_event.save()
+
+
+def process_stripe_charge_event(charge, succeeded):
+    '''Confirm the order that a charge was for, or mark it as failed, when
+    our webhook hears from Stripe about the charge.'''
+    order = Order.objects.get_for_charge_for_update(charge)
+
+    # The order is only processing if neither this event nor the job that
+    # created the charge has already confirmed it or marked it as failed.
+    if order is None:
+        pass
+    elif succeeded:
+        if order.is_processing():
+            confirm_order_or_refund(order, charge['id'], charge['created'])
+        elif order.payment_required():
+            # The job that created the charge gave up waiting to hear from
+            # Stripe, and marked the order as failed, but the card was
+            # charged after all.
+            if charge['amount'] == order.cost_pence_incl_vat():
+                confirm_order_or_refund(order, charge['id'], charge['created'])
+            else:
+                # The order has been changed since
+                logger.warning('refund_charge_for_changed_order', order=order.order_id, charge_id=charge['id'])
+                refund_charge(charge['id'])
+    elif order.is_processing():
+        mark_order_as_failed(order, charge['failure_message'] or 'Your card was declined.')
 
 
 def confirm_order(order, charge_id, charge_created):
     logger.info('confirm_order', order=order.order_id, charge_id=charge_id)
     with transaction.atomic():
         order.confirm(charge_id, charge_created)
-    send_receipt(order)
-    send_ticket_invitations(order)
-    slack_message('tickets/order_created.slack', {'order': order})
+        send_receipt(order)
+        send_ticket_invitations(order)
+        enqueue(jobs.send_order_created_slack_message, order_id=order.id)
 
 
 def mark_order_as_failed(order, charge_failure_reason):
@@ -81,10 +179,32 @@ def create_free_ticket(email_addr, pot):
             email_addr=email_addr,
             pot=pot,
         )
-    send_invitation_mail(ticket)
+        enqueue(jobs.send_ticket_invitation, ticket_id=ticket.id)
     return ticket
 
 
+def create_free_tickets(email_addrs_pots_and_days):
+    '''Create free tickets for those of the given email addresses that don't
+    already have a ticket, and queue their invitations to be sent in batches.
+
+    Return the tickets that were created and the email addresses that were
+    skipped.
+    '''
+    logger.info('create_free_tickets', num_tickets=len(email_addrs_pots_and_days))
+    with transaction.atomic():
+        existing = Ticket.objects.email_addrs_with_tickets(email_addr for email_addr, _, _ in email_addrs_pots_and_days)
+        skipped = [email_addr for email_addr, _, _ in email_addrs_pots_and_days if email_addr.lower() in existing]
+        tickets = Ticket.objects.bulk_create_free_with_invitations([
+            row for row in email_addrs_pots_and_days if row[0].lower() not in existing
+        ])
+
+        for ix in range(0, len(tickets), INVITATION_BATCH_SIZE):
+            batch = tickets[ix:ix + INVITATION_BATCH_SIZE]
+            enqueue(jobs.send_free_ticket_invitations, ticket_ids=[ticket.id for ticket in batch])
+
+    return tickets, skipped
+
+
 def update_free_ticket(ticket, days):
     logger.info('update_free_ticket', ticket=ticket.ticket_id, days=days)
     with transaction.atomic():
@@ -92,14 +212,11 @@ def update_free_ticket(ticket, days):
 
 
 def send_receipt(order):
-    logger.info('send_receipt', order=order.order_id)
-    send_order_confirmation_mail(order)
+    enqueue(jobs.send_receipt, order_id=order.id)
 
 
 def send_ticket_invitations(order):
-    logger.info('send_ticket_invitations', order=order.order_id)
-    for ticket in order.unclaimed_tickets():
-        send_invitation_mail(ticket)
+    enqueue(jobs.send_ticket_invitations, order_id=order.id)
 
 
 def claim_ticket_invitation(owner, invitation):
@@ -108,11 +225,65 @@ def claim_ticket_invitation(owner, invitation):
         invitation.claim_for_owner(owner)
 
 
+def send_invitation_reminders(batch_size=None, exclude_ids=(), mailer=None, now=None):
+    '''Send reminders for a batch of the unclaimed ticket invitations that are
+    due one, and record that they have been reminded.
+
+    The batch is locked while its reminders are sent, so that if this runs in
+    two processes at once, they remind different invitations.  Invitations
+    whose reminders fail to be sent are not recorded as reminded, so they are
+    still due, and invitations in exclude_ids are skipped, so that the caller
+    can leave failures until it next runs.
+
+    Return the ids of the invitations in the batch, and the number of
+    reminders sent.
+    '''
+    if batch_size is None:
+        batch_size = settings.TICKET_INVITATION_REMINDER_BATCH_SIZE
+    if mailer is None:
+        mailer = BulkMailer()
+    if now is None:
+        now = timezone.now()
+
+    with transaction.atomic():
+        # The invitations are locked before their tickets and orders are
+        # loaded, since Postgres can't lock rows on the nullable side of the
+        # join to orders.
+        ids = list(
+            TicketInvitation.objects.due_for_reminder(now)
+            .exclude(id__in=exclude_ids)
+            .select_for_update(skip_locked=True)
+            .order_by('created_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return ids, 0
+
+        invitations = TicketInvitation.objects.filter(id__in=ids).select_related('ticket__order__purchaser').order_by('created_at')
+        mails = [(*build_invitation_reminder_mail(invitation), invitation.id) for invitation in invitations]
+
+        sent_ids = []
+
+        def record(result):
+            if result.sent:
+                sent_ids.append(result.mail[3])
+
+        mailer.send(mails, on_result=record)
+
+        TicketInvitation.objects.filter(id__in=sent_ids).update(
+            num_reminders=F('num_reminders') + 1,
+            last_reminded_at=now,
+        )
+
+    logger.info('send_invitation_reminders', num_invitations=len(ids), num_sent=len(sent_ids))
+    return ids, len(sent_ids)
+
+
 def reassign_ticket(ticket, email_addr):
     logger.info('reassign_ticket', ticket=ticket.ticket_id, email_addr=email_addr)
     with transaction.atomic():
         ticket.reassign(email_addr)
-    send_invitation_mail(ticket)
+        enqueue(jobs.send_ticket_invitation, ticket_id=ticket.id)
 
 
 def refund_order(order):
@@ -121,4 +292,4 @@ def refund_order(order):
     with transaction.atomic():
         order.delete_tickets_and_mark_as_refunded()
     refund_charge(order.stripe_charge_id)
-    send_order_refund_mail(order)
+    enqueue(jobs.send_refund_mail, order_id=order.id)
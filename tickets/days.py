@@ -0,0 +1,139 @@
+'''Sets of conference days.
+
+Tickets and grant applications each have a boolean field for each day in
+DAYS.  A DaySet packs those flags into the bits of an int, in the order of
+DAYS, so that sets of days can be compared, combined, and counted cheaply.
+
+The same bitmask, and the number of days, can be computed in SQL by
+day_mask_expression() and num_days_expression(), so that filtering and
+aggregating by days can be done by the database.
+'''
+
+from django.db import models
+from django.db.models.functions import Cast
+
+from .constants import DAYS
+
+
+BITS = {day: 1 << ix for ix, day in enumerate(DAYS)}
+
+ALL_DAYS_MASK = (1 << len(DAYS)) - 1
+
+
+class DaySet:
+    '''An immutable set of days, stored as a bitmask.
+
+    >>> days = DaySet.from_days(['sat', 'thu'])
+    >>> list(days), len(days), 'fri' in days
+    (['thu', 'sat'], 2, False)
+    '''
+
+    __slots__ = ('mask',)
+
+    def __init__(self, mask=0):
+        if not 0 <= mask <= ALL_DAYS_MASK:
+            raise ValueError(f'Invalid day mask: {mask}')
+        object.__setattr__(self, 'mask', mask)
+
+    @classmethod
+    def from_days(cls, days):
+        '''Return the set of the given days, which are keys of DAYS.'''
+
+        mask = 0
+        for day in days:
+            try:
+                mask |= BITS[day]
+            except KeyError:
+                raise ValueError(f'Unknown day: {day}')
+        return cls(mask)
+
+    @classmethod
+    def from_flags(cls, flags):
+        '''Return the set of days whose flag is true, where flags maps keys of
+        DAYS to booleans, as in a row returned by .values().'''
+
+        return cls(sum(bit for day, bit in BITS.items() if flags[day]))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('DaySet is immutable')
+
+    def __iter__(self):
+        return (day for day, bit in BITS.items() if self.mask & bit)
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    def __contains__(self, day):
+        return bool(self.mask & BITS.get(day, 0))
+
+    def __int__(self):
+        return self.mask
+
+    def __eq__(self, other):
+        if not isinstance(other, DaySet):
+            return NotImplemented
+        return self.mask == other.mask
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __or__(self, other):
+        return DaySet(self.mask | other.mask)
+
+    def __and__(self, other):
+        return DaySet(self.mask & other.mask)
+
+    def __sub__(self, other):
+        return DaySet(self.mask & ~other.mask)
+
+    def __repr__(self):
+        return f'DaySet({list(self)!r})'
+
+    def names(self):
+        return [DAYS[day] for day in self]
+
+    def as_flags(self):
+        '''Return a dict mapping each key of DAYS to whether it is in the set,
+        suitable for passing as field values to a model with a field for each
+        day.'''
+
+        return {day: bool(self.mask & bit) for day, bit in BITS.items()}
+
+
+def day_mask_expression(prefix=''):
+    '''Return an expression for the bitmask of a model's days, as used by
+    DaySet.  prefix is for days of a related model, eg 'ticket__'.'''
+
+    return sum(Cast(f'{prefix}{day}', models.IntegerField()) * bit for day, bit in BITS.items())
+
+
+def num_days_expression(prefix=''):
+    '''Return an expression for the number of a model's days.'''
+
+    return sum(Cast(f'{prefix}{day}', models.IntegerField()) for day in DAYS)
+
+
+class DaysMixin:
+    '''Methods for models with a boolean field for each day in DAYS.
+
+    The boolean fields remain the source of truth, and can be used directly
+    by templates and queries.
+    '''
+
+    @property
+    def day_set(self):
+        return DaySet(sum(bit for day, bit in BITS.items() if getattr(self, day)))
+
+    @day_set.setter
+    def day_set(self, days):
+        for day, value in days.as_flags().items():
+            setattr(self, day, value)
+
+    def days(self):
+        return self.day_set.names()
+
+    def days_abbrev(self):
+        return list(self.day_set)
+
+    def num_days(self):
+        return len(self.day_set)
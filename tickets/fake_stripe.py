@@ -0,0 +1,52 @@
+'''Fake Stripe webhook events, for testing and load testing the webhook without
+talking to Stripe.'''
+
+import hashlib
+import hmac
+import json
+import time
+from uuid import uuid4
+
+
+def charge_event(order, succeeded=True):
+    '''Return an event like the one Stripe sends when a charge for the order
+    succeeds or fails.'''
+
+    charge_id = f'ch_fake_{uuid4().hex[:16]}'
+    return {
+        'id': f'evt_fake_{uuid4().hex[:16]}',
+        'object': 'event',
+        'type': 'charge.succeeded' if succeeded else 'charge.failed',
+        'created': int(time.time()),
+        'livemode': False,
+        'data': {
+            'object': {
+                'id': charge_id,
+                'object': 'charge',
+                'amount': order.cost_pence_incl_vat(),
+                'currency': 'gbp',
+                'created': int(time.time()),
+                'status': 'succeeded' if succeeded else 'failed',
+                'failure_message': None if succeeded else 'Your card was declined.',
+                'metadata': {'app': order._meta.app_label, 'order_id': order.order_id},
+            },
+        },
+    }
+
+
+def sign(payload, secret, timestamp=None):
+    '''Return a Stripe-Signature header for the payload, as Stripe would
+    compute it with our webhook's secret.'''
+
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed_payload = f'{timestamp}.{payload}'.encode('utf8')
+    signature = hmac.new(secret.encode('utf8'), signed_payload, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def encode(event, secret):
+    '''Return the body and Stripe-Signature header for posting the event to our
+    webhook.'''
+
+    payload = json.dumps(event)
+    return payload, sign(payload, secret)
@@ -1,8 +1,12 @@
+import codecs
+
 from django import forms
 from django.core.exceptions import ValidationError
 
 from ironcage.widgets import ButtonsCheckbox, ButtonsRadio, EmailInput
 
+from . import ticket_csv
+
 
 WHO_CHOICES = [
     ('self', 'Myself'),
@@ -83,6 +87,30 @@ TicketForOthersFormSet = forms.formset_factory(
 )
 
 
+class TicketsCsvForm(forms.Form):
+    csv_file = forms.FileField(
+        required=False,
+        widget=forms.FileInput(attrs={'accept': '.csv,text/csv'}),
+    )
+    keep_uploaded_tickets = forms.BooleanField(
+        required=False,
+    )
+
+    def clean_csv_file(self):
+        csv_file = self.cleaned_data['csv_file']
+        if csv_file is None:
+            return None
+
+        # The file is decoded and validated a line at a time, so that a large
+        # file isn't read into memory all at once
+        try:
+            self.email_addrs_and_days = ticket_csv.read(codecs.iterdecode(csv_file, 'utf-8-sig'))
+        except ticket_csv.InvalidTicketsCsv as e:
+            raise ValidationError(e.errors)
+
+        return csv_file
+
+
 class CompanyDetailsForm(forms.Form):
     company_name = forms.CharField(
         widget=forms.TextInput(attrs={'class': 'form-control'})
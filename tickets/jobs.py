@@ -0,0 +1,84 @@
+import time
+
+from django_slack import slack_message
+
+from django.db import transaction
+
+from jobs.queue import job
+
+from . import actions
+from .mailer import send_invitation_mail, send_invitation_mails, send_order_confirmation_mail, send_order_refund_mail
+from .models import Order, StripeEvent, Ticket
+
+import structlog
+logger = structlog.get_logger()
+
+
+@job
+def send_receipt(order_id):
+    order = Order.objects.select_related('purchaser').get(pk=order_id)
+    logger.info('send_receipt', order=order.order_id)
+    send_order_confirmation_mail(order)
+
+
+@job
+def send_ticket_invitations(order_id):
+    order = Order.objects.select_related('purchaser').get(pk=order_id)
+    logger.info('send_ticket_invitations', order=order.order_id)
+    tickets = order.unclaimed_tickets()
+    start = time.perf_counter()
+    num_sent = send_invitation_mails(tickets)
+    logger.info('sent_ticket_invitations', order=order.order_id, num_sent=num_sent, elapsed=round(time.perf_counter() - start, 3))
+
+
+@job
+def send_order_created_slack_message(order_id):
+    order = Order.objects.select_related('purchaser').get(pk=order_id)
+    slack_message('tickets/order_created.slack', {'order': order})
+
+
+@job
+def send_ticket_invitation(ticket_id):
+    ticket = Ticket.objects.select_related('order__purchaser').get(pk=ticket_id)
+    send_invitation_mail(ticket)
+
+
+@job
+def send_free_ticket_invitations(ticket_ids):
+    tickets = Ticket.objects.filter(pk__in=ticket_ids).prefetch_related('invitations').order_by('id')
+    start = time.perf_counter()
+    num_sent = send_invitation_mails(tickets)
+    logger.info('sent_free_ticket_invitations', num_sent=num_sent, elapsed=round(time.perf_counter() - start, 3))
+
+
+@job
+def send_refund_mail(order_id):
+    order = Order.objects.select_related('purchaser').get(pk=order_id)
+    send_order_refund_mail(order)
+
+
+def give_up_stripe_charge(order_id, token):
+    # The card couldn't be charged after several attempts, so the purchaser is
+    # allowed to try again.  If the card was charged after all, our webhook
+    # still confirms the order when it hears about the charge.
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        if order.is_processing():
+            actions.mark_order_as_failed(order, actions.STRIPE_ERROR_MESSAGE)
+
+
+@job(on_dead=give_up_stripe_charge)
+def process_stripe_charge(order_id, token):
+    # The order is locked while the card is charged, so that if our webhook
+    # hears about the charge in the meantime, it waits to see what happened.
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        if order.is_processing():
+            actions.process_stripe_charge(order, token)
+
+
+@job
+def process_stripe_event(event_id):
+    stripe_event = StripeEvent.objects.get(event_id=event_id)
+    if stripe_event.processed_at is None:
+        actions.process_stripe_event(stripe_event)
@@ -4,7 +4,7 @@ from django.conf import settings
 from django.template.loader import get_template
 from django.urls import reverse
 
-from ironcage.emails import send_mail
+from ironcage.emails import send_mail, send_mails
 
 
 INVITATION_TEMPLATE = '''
@@ -37,7 +37,22 @@ We look forward to seeing you in Cardiff!
 '''.strip()
 
 
-def send_invitation_mail(ticket):
+INVITATION_REMINDER_TEMPLATE = '''
+Hello!
+
+{ticket_given} for PyCon UK 2017, but you haven't claimed it yet.
+
+Please click here to claim your ticket, so that we know that you're coming:
+
+    {url}
+
+We look forward to seeing you in Cardiff!
+
+~ The PyCon UK 2017 team
+'''.strip()
+
+
+def build_invitation_mail(ticket):
     invitation = ticket.invitation()
     url = settings.DOMAIN + invitation.get_absolute_url()
     if ticket.order is None:
@@ -46,13 +61,44 @@ def send_invitation_mail(ticket):
         purchaser_name = ticket.order.purchaser.name
         body = INVITATION_TEMPLATE.format(purchaser_name=purchaser_name, url=url)
 
-    send_mail(
+    return (
         f'PyCon UK 2017 ticket invitation ({ticket.ticket_id})',
         body,
         invitation.email_addr,
     )
 
 
+def send_invitation_mail(ticket):
+    send_mail(*build_invitation_mail(ticket))
+
+
+def send_invitation_mails(tickets):
+    '''Send invitation mails for several tickets over a single connection.
+
+    To avoid a query per ticket, each ticket's invitations and order's
+    purchaser should already have been loaded.
+    '''
+    return send_mails([build_invitation_mail(ticket) for ticket in tickets])
+
+
+def build_invitation_reminder_mail(invitation):
+    '''To avoid queries, the invitation's ticket and its order's purchaser
+    should already have been loaded.'''
+
+    ticket = invitation.ticket
+    url = settings.DOMAIN + invitation.get_absolute_url()
+    if ticket.order is None:
+        ticket_given = 'You have been assigned a ticket'
+    else:
+        ticket_given = f'{ticket.order.purchaser.name} has purchased you a ticket'
+
+    return (
+        f'Reminder: PyCon UK 2017 ticket invitation ({ticket.ticket_id})',
+        INVITATION_REMINDER_TEMPLATE.format(ticket_given=ticket_given, url=url),
+        invitation.email_addr,
+    )
+
+
 def send_order_confirmation_mail(order):
     assert not order.payment_required()
 
@@ -1,20 +1,37 @@
-from django.core.management import BaseCommand
 from django.db.models import Q
 
-from ...actions import create_free_ticket
+from .createfreetickets import Command as CreateFreeTicketsCommand
 
 from accounts.models import User
 
 
-class Command(BaseCommand):
+POT = 'Financial assistance'
+
+
+class Command(CreateFreeTicketsCommand):
+    help = '''
+Creates free tickets for everybody who has been offered financial assistance,
+or who only requested a ticket, and who doesn't already have a ticket.
+
+With --csv, tickets are instead created for everybody listed in a CSV file, as
+with createfreetickets, with "Financial assistance" as the default pot.
+    '''.strip()
+
     def add_arguments(self, parser):
+        parser.add_argument('--csv', help='Path to CSV file of tickets to create')
         parser.add_argument('--dry-run', action='store_true')
 
-    def handle(self, *args, dry_run, **kwargs):
-        for u in User.objects.filter(
-            Q(grant_application__amount_offered__gt=0) | Q(grant_application__requested_ticket_only=True),
-            ticket=None
-        ):
-            print(u.email_addr)
-            if not dry_run:
-                create_free_ticket(u.email_addr, 'Financial assistance')
+    def handle(self, *args, csv, dry_run, **kwargs):
+        if csv is not None:
+            email_addrs_pots_and_days = self.read_csv(csv, POT)
+        else:
+            email_addrs = User.objects.filter(
+                Q(grant_application__amount_offered__gt=0) | Q(grant_application__requested_ticket_only=True),
+                ticket=None
+            ).values_list('email_addr', flat=True)
+            email_addrs_pots_and_days = [(email_addr, POT, []) for email_addr in email_addrs]
+
+        for email_addr, _, _ in email_addrs_pots_and_days:
+            self.stdout.write(email_addr)
+
+        self.create_free_tickets(email_addrs_pots_and_days, dry_run)
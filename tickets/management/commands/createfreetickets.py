@@ -1,13 +1,41 @@
-from django.core.management import BaseCommand
+import time
 
-from ...actions import create_free_ticket
+from django.core.management import BaseCommand, CommandError
+
+from ... import ticket_csv
+from ...actions import create_free_ticket, create_free_tickets
+from ...models import SoldOut, Ticket
 
 
 class Command(BaseCommand):
+    help = '''
+Creates free tickets, and sends an invitation for each.
+
+With --csv, a ticket is created for each row of a CSV file with columns
+email_addr, pot, and optionally days, like:
+
+    email_addr,pot,days
+    alice@example.com,Sponsor: Sirius Cybernetics Corp.,thu fri
+
+Rows without a pot are given the pot passed with --pot.  Addresses that
+already have a ticket are skipped.
+
+Without --csv, email addresses are entered one-by-one, and --pot is required.
+    '''.strip()
+
     def add_arguments(self, parser):
-        parser.add_argument('--pot', required=True, help='Pot to which tickets are to be assigned')
+        parser.add_argument('--pot', help='Pot to which tickets are to be assigned')
+        parser.add_argument('--csv', help='Path to CSV file of tickets to create')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, pot, csv, dry_run, **kwargs):
+        if csv is not None:
+            self.create_free_tickets(self.read_csv(csv, pot), dry_run)
+            return
+
+        if pot is None:
+            raise CommandError('--pot is required unless --csv is given')
 
-    def handle(self, *args, pot, **kwargs):
         self.stdout.write('Enter email addresses to send ticket invitations to one-by-one')
         while True:
             try:
@@ -17,3 +45,31 @@ class Command(BaseCommand):
                 create_free_ticket(email_addr, pot)
             except (KeyboardInterrupt, EOFError):
                 break
+
+    def read_csv(self, path, pot):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            try:
+                return ticket_csv.read_free_tickets(f, pot)
+            except ticket_csv.InvalidTicketsCsv as e:
+                raise CommandError('\n'.join([f'Could not read {path}:'] + e.errors))
+
+    def create_free_tickets(self, email_addrs_pots_and_days, dry_run):
+        if dry_run:
+            existing = Ticket.objects.email_addrs_with_tickets(email_addr for email_addr, _, _ in email_addrs_pots_and_days)
+            num_skipped = sum(email_addr.lower() in existing for email_addr, _, _ in email_addrs_pots_and_days)
+            self.stdout.write('This is a dry run')
+            self.stdout.write(f'Running this would create {len(email_addrs_pots_and_days) - num_skipped} ticket(s), and skip {num_skipped} address(es) that already have a ticket')
+            return
+
+        start = time.perf_counter()
+        try:
+            tickets, skipped = create_free_tickets(email_addrs_pots_and_days)
+        except SoldOut as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        for email_addr in skipped:
+            self.stdout.write(f'Skipped {email_addr}, who already has a ticket')
+
+        rate = len(tickets) / elapsed if elapsed else 0
+        self.stdout.write(f'Created {len(tickets)} ticket(s), and skipped {len(skipped)}, in {elapsed:.2f}s ({rate:.0f} tickets/s)')
@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.urls import reverse
+
+from accounts.models import User
+from ironcage.stripe_integration import is_test_mode
+
+from ... import actions
+from ...fake_stripe import charge_event, encode
+from ...models import Order
+
+
+class Command(BaseCommand):
+    help = 'Posts fake Stripe charge events for processing orders to the webhook, for load testing it offline (only when DEBUG is set, or with Stripe test keys)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='URL of the webhook (defaults to the webhook on settings.DOMAIN)')
+        parser.add_argument('--create-orders', type=int, default=0, help='Create this many processing orders first (only when DEBUG is set)')
+        parser.add_argument('--failure-rate', type=float, default=0, help='Proportion of charges that fail')
+        parser.add_argument('--duplicates', type=int, default=1, help='Number of times to send each event')
+        parser.add_argument('--concurrency', type=int, default=10, help='Number of events to send at once')
+
+    def handle(self, *args, url, create_orders, failure_rate, duplicates, concurrency, **kwargs):
+        # Confirming real orders with fake charges would issue tickets that
+        # nobody has paid for.
+        if not (settings.DEBUG or is_test_mode()):
+            raise CommandError('Fake events can only be sent when DEBUG is set or Stripe test keys are used')
+
+        url = url or settings.DOMAIN + reverse('tickets:stripe_webhook')
+
+        if create_orders:
+            if not settings.DEBUG:
+                raise CommandError('Orders can only be created when DEBUG is set')
+            self.create_orders(create_orders)
+
+        events = [
+            charge_event(order, succeeded=random.random() >= failure_rate)
+            for order in Order.objects.filter(status='processing')
+        ]
+        requests = [encode(event, settings.STRIPE_WEBHOOK_SECRET) for event in events for _ in range(duplicates)]
+        random.shuffle(requests)
+
+        self.stdout.write(f'Sending {len(requests)} event(s) for {len(events)} order(s) to {url}')
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda request: post(url, *request), requests))
+        elapsed = time.perf_counter() - start
+
+        statuses = sorted({status for status, _ in results})
+        latencies = sorted(latency for _, latency in results)
+
+        for status in statuses:
+            self.stdout.write(f'{status}: {sum(1 for s, _ in results if s == status)}')
+        if latencies:
+            self.stdout.write(f'Sent in {elapsed:.2f} s ({len(results) / elapsed:.1f} events/s)')
+            self.stdout.write(f'Median latency {percentile(latencies, 50) * 1000:.1f} ms, 95th percentile {percentile(latencies, 95) * 1000:.1f} ms')
+
+    def create_orders(self, num_orders):
+        for ix in range(num_orders):
+            user = User.objects.create_user(email_addr=f'fake-{uuid4().hex}@example.com', name=f'Fake purchaser {ix}')
+            order = actions.create_pending_order(user, 'individual', days_for_self=['thu'])
+            order.mark_as_processing()
+
+
+def post(url, payload, signature):
+    request = Request(url, data=payload.encode('utf8'), headers={
+        'Content-Type': 'application/json',
+        'Stripe-Signature': signature,
+    })
+    start = time.perf_counter()
+    try:
+        with urlopen(request) as response:
+            status = response.status
+    except HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, len(values) * p // 100)]
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from ironcage import bulk_mail
+
+from ...actions import send_invitation_reminders
+from ...models import TicketInvitation
+
+
+class Command(BaseCommand):
+    help = '''
+Sends reminders to people who have not claimed their ticket invitations.
+
+Reminders are sent settings.TICKET_INVITATION_REMINDER_DAYS days after each
+invitation, and each invitation records how many reminders it has been sent,
+so this should be run periodically (eg hourly, by the Heroku Scheduler) and
+only sends the reminders that have become due since it last ran.
+
+Reminders are sent in batches, each in its own transaction, so that if this is
+stopped, the reminders in earlier batches are not sent again.
+    '''.strip()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.TICKET_INVITATION_REMINDER_BATCH_SIZE, help='Number of reminders to send in each batch')
+        parser.add_argument('--max-batches', type=int, help='Most batches to send before stopping (default: no limit)')
+        parser.add_argument('--dry-run', action='store_true', help='If provided, prints the number of reminders due and stops')
+        bulk_mail.add_arguments(parser)
+
+    def handle(self, *args, batch_size, max_batches, dry_run, workers, rate, **kwargs):
+        if dry_run:
+            num_due = TicketInvitation.objects.due_for_reminder().count()
+            self.stdout.write(f'There are {num_due} reminder(s) due')
+            return
+
+        mailer = bulk_mail.BulkMailer(num_workers=workers, rate=rate)
+        attempted_ids = []
+        num_batches = 0
+        num_sent = 0
+
+        while max_batches is None or num_batches < max_batches:
+            ids, num_sent_in_batch = send_invitation_reminders(batch_size, exclude_ids=attempted_ids, mailer=mailer)
+            if not ids:
+                break
+
+            attempted_ids.extend(ids)
+            num_batches += 1
+            num_sent += num_sent_in_batch
+
+        num_failed = len(attempted_ids) - num_sent
+        self.stdout.write(f'Sent {num_sent} reminder(s) in {num_batches} batch(es), with {num_failed} failure(s)')
@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+
+from ...constants import DAYS
+from ...models import DayInventory
+
+
+class Command(BaseCommand):
+    help = 'Sets the number of tickets that can be sold for a day'
+
+    def add_arguments(self, parser):
+        parser.add_argument('day', choices=list(DAYS))
+        parser.add_argument('capacity', type=int)
+
+    def handle(self, *args, day, capacity, **kwargs):
+        inventory = DayInventory.objects.set_capacity(day, capacity)
+        self.stdout.write(str(inventory))
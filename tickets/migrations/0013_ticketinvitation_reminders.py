@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-17 18:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0012_dayinventory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketinvitation',
+            name='last_reminded_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ticketinvitation',
+            name='num_reminders',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='ticketinvitation',
+            index_together=set([('status', 'created_at', 'last_reminded_at')]),
+        ),
+    ]
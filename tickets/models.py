@@ -1,17 +1,28 @@
-from collections import defaultdict
-from datetime import datetime, timezone
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
 
 from django.conf import settings
 from django.contrib.postgres.fields import JSONField
-from django.db import models
+from django.core.cache import cache
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Lower
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.utils.crypto import get_random_string
 
-from ironcage.utils import Scrambler
+from ironcage.utils import Scrambler, clear_prefetched, is_prefetched
 
 from .constants import DAYS
-from .prices import cost_excl_vat, cost_incl_vat
+from .days import DaySet, DaysMixin, num_days_expression
+from .prices import PRICES_INCL_VAT, cost_excl_vat, cost_incl_vat
+from .signals import bulk_created
+
+
+# Orders with more tickets than this are shown as a summary of how many
+# tickets there are for each number of days, rather than a row per ticket
+MAX_TICKETS_LISTED = 20
 
 
 class Order(models.Model):
@@ -28,13 +39,29 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    id_scrambler = Scrambler(1000)
+    id_scrambler = Scrambler(1000, bits=settings.ID_SCRAMBLER_BITS)
 
     class Manager(models.Manager):
         def get_by_order_id_or_404(self, order_id):
-            id = self.model.id_scrambler.backward(order_id)
+            try:
+                id = self.model.id_scrambler.backward(order_id)
+            except ValueError:
+                raise Http404
             return get_object_or_404(self.model, pk=id)
 
+        def get_for_charge_for_update(self, charge):
+            '''Return the order that a Stripe charge was for, locked until the
+            end of the transaction, or None if the charge wasn't for an order
+            for tickets.'''
+            metadata = charge['metadata']
+            if metadata.get('app') != self.model._meta.app_label:
+                return None
+            try:
+                id = self.model.id_scrambler.backward(metadata.get('order_id'))
+            except ValueError:
+                return None
+            return self.select_for_update().filter(pk=id).first()
+
         def create_pending(self, purchaser, rate, days_for_self=None, email_addrs_and_days_for_others=None, company_details=None):
             assert days_for_self is not None or email_addrs_and_days_for_others is not None
 
@@ -63,8 +90,83 @@ class Order(models.Model):
                 unconfirmed_details=unconfirmed_details,
             )
 
+        def sales_by_period(self, period):
+            '''Return the number of tickets, the number of days, and the revenue
+            (incl. VAT) of successful orders charged in each hour, day or week,
+            along with the running totals of each, as a list of dicts like:
+
+                {
+                    'period': datetime(2017, 6, 1, tzinfo=timezone.utc),
+                    'num_tickets': 10,
+                    'num_days': 25,
+                    'revenue': 1080,
+                    'cumulative_num_tickets': 40,
+                    'cumulative_num_days': 90,
+                    'cumulative_revenue': 4020,
+                }
+
+            Periods with no sales are omitted.  This is computed in a single
+            query.
+            '''
+            assert period in ['hour', 'day', 'week']
+
+            num_days = ' + '.join(f't.{day}::int' for day in DAYS)
+            prices = ', '.join('(%s, %s, %s)' for _ in PRICES_INCL_VAT)
+            price_params = [
+                param
+                for rate, rate_prices in PRICES_INCL_VAT.items()
+                for param in [rate, rate_prices['ticket_price'], rate_prices['day_price']]
+            ]
+
+            sql = f'''
+                WITH periods AS (
+                    SELECT
+                        date_trunc(%s, o.stripe_charge_created) AS period,
+                        COUNT(t.id) AS num_tickets,
+                        SUM({num_days}) AS num_days,
+                        SUM(p.ticket_price + p.day_price * ({num_days})) AS revenue
+                    FROM {self.model._meta.db_table} o
+                    JOIN {Ticket._meta.db_table} t ON t.order_id = o.id
+                    JOIN (VALUES {prices}) AS p (rate, ticket_price, day_price) ON p.rate = o.rate
+                    WHERE o.status = 'successful'
+                    GROUP BY 1
+                )
+                SELECT
+                    period,
+                    num_tickets,
+                    num_days,
+                    revenue,
+                    SUM(num_tickets) OVER running,
+                    SUM(num_days) OVER running,
+                    SUM(revenue) OVER running
+                FROM periods
+                WINDOW running AS (ORDER BY period)
+                ORDER BY period
+            '''
+
+            keys = [
+                'period',
+                'num_tickets',
+                'num_days',
+                'revenue',
+                'cumulative_num_tickets',
+                'cumulative_num_days',
+                'cumulative_revenue',
+            ]
+
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [period] + price_params)
+                return [
+                    dict(zip(keys, [row[0]] + [int(value) for value in row[1:]]))
+                    for row in cursor.fetchall()
+                ]
+
     objects = Manager()
 
+    # The list returned by all_tickets(), which is discarded whenever the
+    # order's tickets change.
+    _tickets = None
+
     def __str__(self):
         return self.order_id
 
@@ -98,18 +200,20 @@ class Order(models.Model):
             'email_addrs_and_days_for_others': email_addrs_and_days_for_others,
         }
         self.save()
+        self.invalidate_tickets()
 
     def confirm(self, charge_id, charge_created):
-        assert self.payment_required()
+        assert self.is_unconfirmed()
 
-        days_for_self = self.unconfirmed_details['days_for_self']
-        if days_for_self is not None:
-            self.tickets.create_for_user(self.purchaser, days_for_self)
+        # This raises SoldOut if there aren't enough tickets left for any of
+        # the days, in which case nothing is changed.
+        DayInventory.objects.reserve(self.day_counts())
 
-        email_addrs_and_days_for_others = self.unconfirmed_details['email_addrs_and_days_for_others']
-        if email_addrs_and_days_for_others is not None:
-            for email_addr, days in email_addrs_and_days_for_others:
-                self.tickets.create_with_invitation(email_addr, days)
+        Ticket.objects.bulk_create_for_order(
+            self,
+            self.unconfirmed_details['days_for_self'],
+            self.unconfirmed_details['email_addrs_and_days_for_others'],
+        )
 
         self.stripe_charge_id = charge_id
         self.stripe_charge_created = datetime.fromtimestamp(charge_created, tz=timezone.utc)
@@ -117,6 +221,13 @@ class Order(models.Model):
         self.status = 'successful'
 
         self.save()
+        self.invalidate_tickets()
+
+    def mark_as_processing(self):
+        self.stripe_charge_failure_reason = ''
+        self.status = 'processing'
+
+        self.save()
 
     def mark_as_failed(self, charge_failure_reason):
         self.stripe_charge_failure_reason = charge_failure_reason
@@ -130,15 +241,43 @@ class Order(models.Model):
         self.status = 'errored'
 
         self.save()
+        self.invalidate_tickets()
 
     def delete_tickets_and_mark_as_refunded(self):
+        DayInventory.objects.release(self.day_counts())
         self.tickets.all().delete()
         self.status = 'refunded'
 
         self.save()
+        self.invalidate_tickets()
+
+    def day_counts(self):
+        '''Return a Counter mapping each day to the number of the order's
+        tickets that are for that day.'''
+        if self.is_unconfirmed():
+            days_for_self = self.unconfirmed_details['days_for_self'] or []
+            email_addrs_and_days_for_others = self.unconfirmed_details['email_addrs_and_days_for_others'] or []
+            return Counter(days_for_self) + Counter(day for _, days in email_addrs_and_days_for_others for day in days)
+        else:
+            return Counter(day for ticket in self.all_tickets() for day in ticket.days_abbrev())
 
     def all_tickets(self):
-        if self.payment_required():
+        '''Return a list of the order's tickets, or of UnconfirmedTickets if the
+        order hasn't been paid for.
+
+        The list is built the first time this is called, and is then reused
+        until invalidate_tickets() is called.
+        '''
+        if self._tickets is None:
+            self._tickets = self.load_tickets()
+        return self._tickets
+
+    def invalidate_tickets(self):
+        self._tickets = None
+        clear_prefetched(self, 'tickets')
+
+    def load_tickets(self):
+        if self.is_unconfirmed():
             tickets = []
 
             days_for_self = self.unconfirmed_details['days_for_self']
@@ -160,8 +299,10 @@ class Order(models.Model):
                     )
                     tickets.append(ticket)
             return tickets
+        elif is_prefetched(self, 'tickets'):
+            return sorted(self.tickets.all(), key=lambda ticket: ticket.id)
         else:
-            return self.tickets.order_by('id')
+            return list(self.tickets.select_related('owner').prefetch_related('invitations').order_by('id'))
 
     def form_data(self):
         assert self.payment_required()
@@ -223,6 +364,9 @@ class Order(models.Model):
     def ticket_details(self):
         return [ticket.details() for ticket in self.all_tickets()]
 
+    def lists_tickets(self):
+        return self.num_tickets() <= MAX_TICKETS_LISTED
+
     def ticket_summary(self):
         num_tickets_by_num_days = defaultdict(int)
 
@@ -268,7 +412,7 @@ class Order(models.Model):
         return len(self.all_tickets())
 
     def unclaimed_tickets(self):
-        return self.tickets.filter(owner=None)
+        return [ticket for ticket in self.all_tickets() if ticket.owner is None]
 
     def ticket_for_self(self):
         tickets = [ticket for ticket in self.all_tickets() if ticket.owner == self.purchaser]
@@ -285,6 +429,15 @@ class Order(models.Model):
     def payment_required(self):
         return self.status in ['pending', 'failed']
 
+    def is_processing(self):
+        return self.status == 'processing'
+
+    def is_unconfirmed(self):
+        '''Return whether the order's tickets have yet to be created, either
+        because it hasn't been paid for, or because its payment is still being
+        processed.'''
+        return self.payment_required() or self.is_processing()
+
     def company_addr_formatted(self):
         if self.rate == 'corporate':
             lines = [line.strip(',') for line in self.company_addr.splitlines() if line]
@@ -293,7 +446,7 @@ class Order(models.Model):
             return None
 
 
-class Ticket(models.Model):
+class Ticket(DaysMixin, models.Model):
     order = models.ForeignKey(Order, related_name='tickets', null=True, on_delete=models.CASCADE)
     pot = models.CharField(max_length=100, null=True)
     owner = models.OneToOneField(settings.AUTH_USER_MODEL, null=True, on_delete=models.CASCADE)
@@ -306,29 +459,146 @@ class Ticket(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    id_scrambler = Scrambler(2000)
+    id_scrambler = Scrambler(2000, bits=settings.ID_SCRAMBLER_BITS)
 
     class Manager(models.Manager):
         def get_by_ticket_id_or_404(self, ticket_id):
-            id = self.model.id_scrambler.backward(ticket_id)
+            try:
+                id = self.model.id_scrambler.backward(ticket_id)
+            except ValueError:
+                raise Http404
             return get_object_or_404(self.model, pk=id)
 
         def create_for_user(self, user, days):
-            day_fields = {day: (day in days) for day in DAYS}
-            return self.create(owner=user, **day_fields)
+            return self.create(owner=user, **DaySet.from_days(days).as_flags())
 
         def create_with_invitation(self, email_addr, days):
-            day_fields = {day: (day in days) for day in DAYS}
-            ticket = self.create(**day_fields)
+            ticket = self.create(**DaySet.from_days(days).as_flags())
             ticket.invitations.create(email_addr=email_addr)
             return ticket
 
+        def bulk_create_for_order(self, order, days_for_self, email_addrs_and_days_for_others):
+            '''Create the tickets for an order, and invitations for the tickets
+            for others, with one INSERT for the tickets and one for the
+            invitations.
+
+            Since bulk_create() doesn't send post_save, bulk_created is sent
+            instead.
+            '''
+            tickets = []
+
+            if days_for_self is not None:
+                day_fields = DaySet.from_days(days_for_self).as_flags()
+                tickets.append(self.model(order=order, owner=order.purchaser, **day_fields))
+
+            email_addrs = []
+            for email_addr, days in email_addrs_and_days_for_others or []:
+                day_fields = DaySet.from_days(days).as_flags()
+                tickets.append(self.model(order=order, **day_fields))
+                email_addrs.append(email_addr)
+
+            # On PostgreSQL, bulk_create() sets the primary keys of the tickets
+            self.bulk_create(tickets)
+
+            tickets_for_others = tickets[len(tickets) - len(email_addrs):]
+            TicketInvitation.objects.bulk_create_with_tokens([
+                TicketInvitation(ticket=ticket, email_addr=email_addr)
+                for ticket, email_addr in zip(tickets_for_others, email_addrs)
+            ])
+
+            bulk_created.send(sender=self.model, instances=tickets)
+
+            return tickets
+
         def create_free_with_invitation(self, email_addr, pot):
-            days = {day: False for day in DAYS}
-            ticket = self.create(pot=pot, **days)
+            ticket = self.create(pot=pot, **DaySet().as_flags())
             ticket.invitations.create(email_addr=email_addr)
             return ticket
 
+        def bulk_create_free_with_invitations(self, email_addrs_pots_and_days):
+            '''Create free tickets, each with an invitation, with one INSERT for
+            the tickets and one for the invitations.
+
+            Tickets are taken from the inventory for any days that are given,
+            which raises SoldOut if there aren't enough left.
+            '''
+            DayInventory.objects.reserve(Counter(
+                day for _, _, days in email_addrs_pots_and_days for day in days
+            ))
+
+            tickets = [
+                self.model(pot=pot, **DaySet.from_days(days).as_flags())
+                for _, pot, days in email_addrs_pots_and_days
+            ]
+            self.bulk_create(tickets)
+
+            TicketInvitation.objects.bulk_create_with_tokens([
+                TicketInvitation(ticket=ticket, email_addr=email_addr)
+                for ticket, (email_addr, _, _) in zip(tickets, email_addrs_pots_and_days)
+            ])
+
+            bulk_created.send(sender=self.model, instances=tickets)
+
+            return tickets
+
+        def email_addrs_with_tickets(self, email_addrs):
+            '''Return the set of those email addresses, in lower case, that
+            already have a ticket, either as its owner or through an
+            invitation.  This is computed in a single query.'''
+
+            email_addrs = {email_addr.lower() for email_addr in email_addrs}
+
+            owners = self.annotate(
+                lower_email_addr=Lower('owner__email_addr'),
+            ).filter(lower_email_addr__in=email_addrs).values_list('lower_email_addr', flat=True)
+
+            invitees = TicketInvitation.objects.annotate(
+                lower_email_addr=Lower('email_addr'),
+            ).filter(lower_email_addr__in=email_addrs).values_list('lower_email_addr', flat=True)
+
+            return set(owners.union(invitees))
+
+        def counts_by_rate_and_num_days(self):
+            '''Return the number of tickets for each combination of rate and
+            number of days, along with how many of those tickets are for each
+            day, as a list of dicts like:
+
+                {
+                    'rate': 'individual',
+                    'num_days': 2,
+                    'num_tickets': 10,
+                    'num_thu': 6,
+                    'num_fri': 8,
+                    'num_sat': 4,
+                    'num_sun': 2,
+                    'num_mon': 0,
+                }
+
+            This is computed in a single query.
+            '''
+            day_counts = {
+                f'num_{day}': Sum(Cast(day, models.IntegerField()))
+                for day in DAYS
+            }
+
+            return list(
+                self.annotate(
+                    rate=Coalesce('order__rate', Value('free')),
+                    num_days=num_days_expression(),
+                ).values(
+                    'rate',
+                    'num_days',
+                ).annotate(
+                    num_tickets=Count('id'),
+                    **day_counts
+                ).values(
+                    'rate',
+                    'num_days',
+                    'num_tickets',
+                    *day_counts
+                ).order_by()
+            )
+
     objects = Manager()
 
     def __str__(self):
@@ -355,6 +625,7 @@ class Ticket(models.Model):
             pass
 
         self.invitations.create(email_addr=email_addr)
+        clear_prefetched(self, 'invitations')
 
     def details(self):
         return {
@@ -365,15 +636,6 @@ class Ticket(models.Model):
             'cost_incl_vat': self.cost_incl_vat(),
         }
 
-    def days(self):
-        return [DAYS[day] for day in DAYS if getattr(self, day)]
-
-    def days_abbrev(self):
-        return [day for day in DAYS if getattr(self, day)]
-
-    def num_days(self):
-        return len(self.days())
-
     def ticket_holder_name(self):
         if self.owner:
             return self.owner.name
@@ -394,17 +656,30 @@ class Ticket(models.Model):
 
     def invitation(self):
         # This will raise an exception if a ticket has multiple invitations
+        if is_prefetched(self, 'invitations'):
+            invitations = self.invitations.all()
+            if len(invitations) == 0:
+                raise TicketInvitation.DoesNotExist
+            elif len(invitations) > 1:
+                raise TicketInvitation.MultipleObjectsReturned
+            return invitations[0]
         return self.invitations.get()
 
     def is_free_ticket(self):
         return not self.order
 
     def is_incomplete(self):
-        return self.days() == []
+        return not self.day_set
 
     def update_days(self, days):
-        for day in DAYS:
-            setattr(self, day, (day in days))
+        # Tickets for days that are added are reserved, and tickets for days
+        # that are removed are released.
+        old_days = self.day_set
+        new_days = DaySet.from_days(days)
+        DayInventory.objects.reserve(Counter(new_days - old_days))
+        DayInventory.objects.release(Counter(old_days - new_days))
+
+        self.day_set = new_days
         self.save()
 
 
@@ -445,15 +720,77 @@ class TicketInvitation(models.Model):
     email_addr = models.EmailField()  # This should be unique=True
     token = models.CharField(max_length=12, unique=True)  # An index is automatically created since unique=True
     status = models.CharField(max_length=10, default='unclaimed')
+    num_reminders = models.IntegerField(default=0)
+    last_reminded_at = models.DateTimeField(null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        index_together = [['status', 'created_at', 'last_reminded_at']]
+
     class Manager(models.Manager):
         def create(self, **kwargs):
             token = get_random_string(length=12)
             return super().create(token=token, **kwargs)
 
+        def due_for_reminder(self, now=None):
+            '''Return the unclaimed invitations that are due a reminder.
+
+            The nth reminder is due settings.TICKET_INVITATION_REMINDER_DAYS[n]
+            days after the invitation was created.  If reminders have fallen
+            behind, they are still spaced out by the difference between those
+            numbers of days, rather than sent all at once.
+            '''
+            if now is None:
+                now = datetime.now(timezone.utc)
+
+            due = Q()
+            prev_days = None
+            for num_reminders, days in enumerate(settings.TICKET_INVITATION_REMINDER_DAYS):
+                q = Q(num_reminders=num_reminders, created_at__lte=now - timedelta(days=days))
+                if prev_days is not None:
+                    q &= Q(last_reminded_at__lte=now - timedelta(days=days - prev_days))
+                due |= q
+                prev_days = days
+
+            if not due:
+                return self.none()
+
+            # Every invitation that is due was created at least this long ago,
+            # which lets the index on (status, created_at, last_reminded_at)
+            # be scanned for just the range of created_at that could be due.
+            min_days = min(settings.TICKET_INVITATION_REMINDER_DAYS)
+            return self.filter(due, status='unclaimed', created_at__lte=now - timedelta(days=min_days))
+
+        def bulk_create_with_tokens(self, invitations, max_attempts=3):
+            '''Give each invitation a token that isn't already in use, and save
+            them all with a single INSERT.
+
+            Tokens are checked against those already in the database before
+            the INSERT, and if another process takes one of them in the
+            meantime, new tokens are generated and the INSERT is retried.
+            '''
+            if not invitations:
+                return invitations
+
+            for attempt in range(1, max_attempts + 1):
+                tokens = generate_unique_tokens(len(invitations))
+                for invitation, token in zip(invitations, tokens):
+                    invitation.token = token
+
+                try:
+                    with transaction.atomic():
+                        self.bulk_create(invitations)
+                    break
+                except IntegrityError:
+                    if attempt == max_attempts:
+                        raise
+
+            bulk_created.send(sender=self.model, instances=invitations)
+
+            return invitations
+
     objects = Manager()
 
     def get_absolute_url(self):
@@ -468,3 +805,165 @@ class TicketInvitation(models.Model):
         ticket.save()
         self.status = 'claimed'
         self.save()
+
+
+class SoldOut(Exception):
+    def __init__(self, days):
+        self.days = days
+        super().__init__(f'Sorry, tickets for {", ".join(DAYS[day] for day in days)} have sold out')
+
+
+class DayInventory(models.Model):
+    '''The number of tickets that can be sold for a day, and the number that
+    are left.  If there is no inventory for a day, there is no limit to the
+    number of tickets for that day.
+
+    remaining is only changed with UPDATEs that check and decrement it in a
+    single statement, so that concurrent orders can't oversell a day, and
+    the database won't let it go below zero.
+    '''
+
+    day = models.CharField(max_length=3, unique=True)
+    capacity = models.PositiveIntegerField()
+    remaining = models.PositiveIntegerField()
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    AVAILABILITY_CACHE_KEY = 'tickets:availability'
+
+    class Manager(models.Manager):
+        def reserve(self, day_counts):
+            '''Take the given number of tickets for each day from the inventory,
+            raising SoldOut if there aren't enough left for any day.
+
+            This should be called in a transaction, so that if tickets for one
+            day are sold out, tickets for other days are given back.
+            '''
+            sold_out = []
+
+            with connection.cursor() as cursor:
+                # Days are updated in the same order by every transaction, so
+                # that two transactions can't deadlock.
+                for day in sorted(day for day in day_counts if day_counts[day] > 0):
+                    cursor.execute(
+                        f'''
+                        UPDATE {self.model._meta.db_table}
+                        SET remaining = remaining - %(n)s, updated_at = now()
+                        WHERE day = %(day)s AND remaining >= %(n)s
+                        RETURNING remaining
+                        ''',
+                        {'day': day, 'n': day_counts[day]},
+                    )
+                    if cursor.fetchone() is None and self.filter(day=day).exists():
+                        sold_out.append(day)
+
+            if sold_out:
+                raise SoldOut(sold_out)
+
+            self.invalidate_availability()
+
+        def release(self, day_counts):
+            '''Give back the given number of tickets for each day.'''
+
+            with connection.cursor() as cursor:
+                for day in sorted(day for day in day_counts if day_counts[day] > 0):
+                    cursor.execute(
+                        f'''
+                        UPDATE {self.model._meta.db_table}
+                        SET remaining = LEAST(remaining + %(n)s, capacity), updated_at = now()
+                        WHERE day = %(day)s
+                        ''',
+                        {'day': day, 'n': day_counts[day]},
+                    )
+
+            self.invalidate_availability()
+
+        def set_capacity(self, day, capacity):
+            '''Set the number of tickets that can be sold for a day, counting the
+            tickets that have already been sold.  The day is locked while the
+            tickets are counted, so that no tickets are sold meanwhile.
+
+            If the day has no inventory yet, it is created first in its own
+            transaction, so that orders confirmed from then on are limited.
+            Orders confirmed before then don't lock the inventory, so the
+            ticket table is locked too, which waits for any of them that are
+            still in progress, and so their tickets are counted.
+            '''
+
+            self.get_or_create(day=day, defaults={'capacity': capacity, 'remaining': capacity})
+
+            with transaction.atomic():
+                inventory = self.select_for_update().get(day=day)
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LOCK TABLE {Ticket._meta.db_table} IN SHARE ROW EXCLUSIVE MODE')
+                num_sold = Ticket.objects.filter(**{day: True}).count()
+                inventory.capacity = capacity
+                inventory.remaining = max(capacity - num_sold, 0)
+                inventory.save()
+
+            self.invalidate_availability()
+            return inventory
+
+        def availability(self):
+            '''Return a dict mapping each day to the number of tickets left, or
+            to None if there is no limit.
+
+            This is cached briefly, so it can be out of date, and should only be
+            used for showing what is available.  reserve() is what stops days
+            being oversold.
+            '''
+            availability = cache.get(self.model.AVAILABILITY_CACHE_KEY)
+            if availability is None:
+                availability = {day: None for day in DAYS}
+                availability.update(self.values_list('day', 'remaining'))
+                cache.set(self.model.AVAILABILITY_CACHE_KEY, availability, settings.TICKET_AVAILABILITY_CACHE_TIMEOUT)
+            return availability
+
+        def unavailable_days(self, day_counts):
+            '''Return the days, according to availability(), for which there
+            aren't enough tickets left.'''
+            availability = self.availability()
+            return [
+                day for day in DAYS
+                if day_counts.get(day, 0) > 0 and availability[day] is not None and availability[day] < day_counts[day]
+            ]
+
+        def invalidate_availability(self):
+            key = self.model.AVAILABILITY_CACHE_KEY
+            cache.delete(key)
+            transaction.on_commit(lambda: cache.delete(key))
+
+    objects = Manager()
+
+    def __str__(self):
+        return f'{DAYS[self.day]}: {self.remaining} of {self.capacity} left'
+
+
+class StripeEvent(models.Model):
+    '''An event that Stripe has sent to our webhook.  Stripe may send an event
+    more than once, so events are keyed by Stripe's ID for the event, and each
+    is only processed once.'''
+
+    event_id = models.CharField(max_length=80, unique=True)
+    type = models.CharField(max_length=80)
+    payload = JSONField()
+    processed_at = models.DateTimeField(null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def charge(self):
+        return self.payload['data']['object']
+
+
+def generate_unique_tokens(n):
+    '''Return n distinct random tokens for invitations, none of which belong to
+    an existing invitation.'''
+
+    tokens = set()
+
+    while len(tokens) < n:
+        candidates = {get_random_string(length=12) for _ in range(n - len(tokens))} - tokens
+        in_use = set(TicketInvitation.objects.filter(token__in=candidates).values_list('token', flat=True))
+        tokens |= candidates - in_use
+
+    return list(tokens)
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# Sent when instances of a model are saved with bulk_create(), which doesn't
+# send post_save
+bulk_created = Signal(providing_args=['instances'])
@@ -24,7 +24,7 @@
       };
     };
 
-    if (who.match('others')) {
+    if (who.match('others') && !usingUploadedTickets()) {
       var numValidForms = 0;
 
       $('[data-formset-form]').filter(':not([data-formset-form-deleted])').each(function(ix, form) {
@@ -57,6 +57,11 @@
     };
   };
 
+  function usingUploadedTickets() {
+    // Tickets in an uploaded file are checked, and totalled, by the server
+    return $('input[name=csv_file]').val() || $('input[name=keep_uploaded_tickets]:checked').length > 0;
+  };
+
   function maybeShowRestOfForm() {
     var who = $('#order-form')[0].elements.who.value;
     var rate = $('#order-form')[0].elements.rate.value;
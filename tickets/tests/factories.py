@@ -51,6 +51,22 @@ def create_pending_order_for_self_and_others(user=None, rate=None):
     )
 
 
+def create_pending_group_order(user=None, num_tickets=30):
+    user = user or create_user()
+    return actions.create_pending_order(
+        purchaser=user,
+        rate='corporate',
+        email_addrs_and_days_for_others=[
+            (f'attendee{ix}@example.com', ['thu', 'fri', 'sat', 'sun', 'mon'][:ix % 5 + 1])
+            for ix in range(num_tickets)
+        ],
+        company_details={
+            'name': 'Sirius Cybernetics Corp.',
+            'addr': 'Eadrax, Sirius Tau',
+        },
+    )
+
+
 def confirm_order(order):
     actions.confirm_order(order, 'ch_abcdefghijklmnopqurstuvw', 1495355163)
 
@@ -1,13 +1,24 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import stripe
+
 from django_slack.utils import get_backend as get_slack_backend
 
 from django.core import mail
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.mail import get_connection
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from . import factories
 from ironcage.tests import utils
 
+from jobs.models import Job
 from tickets import actions
-from tickets.models import TicketInvitation
+from tickets.models import DayInventory, Order, TicketInvitation
 
 
 class CreatePendingOrderTests(TestCase):
@@ -249,6 +260,22 @@ class ConfirmOrderTests(TestCase):
 
         self.assertEqual(len(mail.outbox), 3)
 
+    @override_settings(JOBS_RUN_INLINE=False)
+    def test_side_effects_are_enqueued(self):
+        order = factories.create_pending_order_for_self_and_others()
+        actions.confirm_order(order, 'ch_abcdefghijklmnopqurstuvw', 1495355163)
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(Job.objects.values_list('name', flat=True)),
+            ['tickets.jobs.send_order_created_slack_message', 'tickets.jobs.send_receipt', 'tickets.jobs.send_ticket_invitations'],
+        )
+
+        call_command('runjobs', once=True)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(Job.objects.filter(status='done').count(), 3)
+
     def test_after_order_marked_as_failed(self):
         order = factories.create_pending_order_for_self()
         actions.mark_order_as_failed(order, 'There was a problem')
@@ -279,6 +306,41 @@ class ConfirmOrderTests(TestCase):
         self.assertIn('Alice has just placed an order for 1 ticket at the individual rate', text)
 
 
+class SendTicketInvitationsTests(TestCase):
+    def create_confirmed_order_for_others(self, num_others):
+        order = actions.create_pending_order(
+            purchaser=factories.create_user(),
+            rate='individual',
+            email_addrs_and_days_for_others=[
+                (f'attendee{ix}@example.com', ['fri']) for ix in range(num_others)
+            ],
+        )
+        order.confirm('ch_abcdefghijklmnopqurstuvw', 1495355163)
+        return order
+
+    def test_send_ticket_invitations(self):
+        order = self.create_confirmed_order_for_others(3)
+
+        with patch('ironcage.emails.get_connection', wraps=get_connection) as get_connection_mock:
+            actions.send_ticket_invitations(order)
+
+        self.assertEqual(get_connection_mock.call_count, 1)
+        self.assertEqual(
+            sorted(email.to[0] for email in mail.outbox),
+            ['attendee0@example.com', 'attendee1@example.com', 'attendee2@example.com'],
+        )
+
+    def test_send_ticket_invitations_queries_do_not_depend_on_number_of_tickets(self):
+        def num_queries_to_send(num_others):
+            order = self.create_confirmed_order_for_others(num_others)
+            order = Order.objects.get(pk=order.pk)
+            with CaptureQueriesContext(connection) as ctx:
+                actions.send_ticket_invitations(order)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(num_queries_to_send(1), num_queries_to_send(20))
+
+
 class MarkOrderAsFailed(TestCase):
     def test_mark_order_as_failed(self):
         order = factories.create_pending_order_for_self()
@@ -309,6 +371,51 @@ class CreateFreeTicketTests(TestCase):
         self.assertEqual(len(mail.outbox), 1)
 
 
+class CreateFreeTicketsTests(TestCase):
+    def test_create_free_tickets(self):
+        factories.create_free_ticket('alice@example.com')
+        factories.create_confirmed_order_for_self(factories.create_user(email_addr='Bob@example.com'))
+        mail.outbox = []
+
+        email_addrs_pots_and_days = [
+            ('ALICE@example.com', 'Sponsor', []),
+            ('bob@example.com', 'Sponsor', []),
+            ('carol@example.com', 'Sponsor', ['thu', 'fri']),
+        ] + [
+            (f'attendee{ix}@example.com', 'Sponsor', []) for ix in range(60)
+        ]
+
+        # There is a query per day and per batch of invitations, but not per
+        # ticket, and the reports that depend on tickets are invalidated again
+        # once the transaction is committed
+        with override_settings(JOBS_RUN_INLINE=False), self.assertNumQueries(18):
+            tickets, skipped = actions.create_free_tickets(email_addrs_pots_and_days)
+
+        self.assertEqual(skipped, ['ALICE@example.com', 'bob@example.com'])
+        self.assertEqual(len(tickets), 61)
+        self.assertEqual(tickets[0].days(), ['Thursday', 'Friday'])
+        self.assertEqual(tickets[0].pot, 'Sponsor')
+        self.assertEqual(tickets[0].invitation().email_addr, 'carol@example.com')
+
+        call_command('runjobs', once=True)
+        self.assertEqual(len(mail.outbox), 61)
+
+    def test_invitations_are_sent_in_batches(self):
+        email_addrs_pots_and_days = [(f'attendee{ix}@example.com', 'Sponsor', []) for ix in range(120)]
+
+        with override_settings(JOBS_RUN_INLINE=False):
+            actions.create_free_tickets(email_addrs_pots_and_days)
+
+        jobs = Job.objects.filter(name='tickets.jobs.send_free_ticket_invitations')
+        self.assertEqual([len(job.kwargs['ticket_ids']) for job in jobs.order_by('id')], [50, 50, 20])
+
+        with patch('ironcage.emails.get_connection', wraps=get_connection) as get_connection_mock:
+            call_command('runjobs', once=True)
+
+        self.assertEqual(len(mail.outbox), 120)
+        self.assertEqual(get_connection_mock.call_count, 3)
+
+
 class UpdateFreeTicketTests(TestCase):
     def test_update_free_ticket(self):
         ticket = factories.create_free_ticket()
@@ -337,6 +444,23 @@ class ProcessStripeChargeTests(TestCase):
         self.order.refresh_from_db()
         self.assertEqual(self.order.status, 'failed')
 
+    def test_process_stripe_charge_invalid_request(self):
+        token = 'tok_ abcdefghijklmnopqurstuvwx'
+        error = stripe.error.InvalidRequestError('No such token: tok_ abcdefghijklmnopqurstuvwx', 'source')
+        with utils.patched_charge_creation_error(error):
+            actions.process_stripe_charge(self.order, token)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'failed')
+        self.assertEqual(self.order.stripe_charge_failure_reason, actions.STRIPE_ERROR_MESSAGE)
+
+    def test_process_stripe_charge_connection_error_is_raised(self):
+        token = 'tok_ abcdefghijklmnopqurstuvwx'
+        error = stripe.error.APIConnectionError('Could not connect to Stripe')
+        with utils.patched_charge_creation_error(error), self.assertRaises(stripe.error.APIConnectionError):
+            actions.process_stripe_charge(self.order, token)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
     def test_process_stripe_charge_error_after_charge(self):
         factories.create_confirmed_order_for_self(self.order.purchaser)
         token = 'tok_ abcdefghijklmnopqurstuvwx'
@@ -348,6 +472,18 @@ class ProcessStripeChargeTests(TestCase):
         self.assertEqual(self.order.status, 'errored')
         self.assertEqual(self.order.stripe_charge_id, 'ch_abcdefghijklmnopqurstuvw')
 
+    def test_process_stripe_charge_when_sold_out(self):
+        DayInventory.objects.set_capacity('thu', 0)
+        token = 'tok_ abcdefghijklmnopqurstuvwx'
+
+        with utils.patched_charge_creation_success(), utils.patched_refund_creation_expected():
+            actions.process_stripe_charge(self.order, token)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'failed')
+        self.assertEqual(self.order.stripe_charge_failure_reason, 'Sorry, tickets for Thursday have sold out')
+        self.assertFalse(self.order.tickets.exists())
+
 
 class TicketInvitationTests(TestCase):
     def test_claim_ticket_invitation(self):
@@ -360,6 +496,74 @@ class TicketInvitationTests(TestCase):
         self.assertIsNotNone(bob.get_ticket())
 
 
+@override_settings(TICKET_INVITATION_REMINDER_DAYS=[3, 7, 14])
+class SendInvitationRemindersTests(TestCase):
+    def create_invitations(self, num_invitations, days_ago=5, domain='example.com'):
+        for ix in range(num_invitations):
+            factories.create_free_ticket(f'attendee{ix}@{domain}')
+        TicketInvitation.objects.update(created_at=timezone.now() - timedelta(days=days_ago))
+        mail.outbox = []
+
+    def test_send_reminders(self):
+        order = factories.create_confirmed_order_for_others()
+        TicketInvitation.objects.update(created_at=timezone.now() - timedelta(days=5))
+        mail.outbox = []
+
+        ids, num_sent = actions.send_invitation_reminders()
+
+        self.assertEqual(len(ids), 2)
+        self.assertEqual(num_sent, 2)
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ['bob@example.com', 'carol@example.com'])
+        self.assertIn(f'{order.purchaser.name} has purchased you a ticket', mail.outbox[0].body)
+
+        for invitation in TicketInvitation.objects.all():
+            self.assertEqual(invitation.num_reminders, 1)
+            self.assertIsNotNone(invitation.last_reminded_at)
+
+        self.assertEqual(actions.send_invitation_reminders(), ([], 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_batches_are_bounded(self):
+        self.create_invitations(5)
+
+        ids, num_sent = actions.send_invitation_reminders(batch_size=3)
+
+        self.assertEqual((len(ids), num_sent), (3, 3))
+        self.assertEqual(TicketInvitation.objects.filter(num_reminders=1).count(), 3)
+
+        ids, num_sent = actions.send_invitation_reminders(batch_size=3)
+
+        self.assertEqual((len(ids), num_sent), (2, 2))
+        self.assertEqual(TicketInvitation.objects.filter(num_reminders=1).count(), 5)
+
+    def test_number_of_queries_does_not_depend_on_batch_size(self):
+        self.create_invitations(1)
+        with CaptureQueriesContext(connection) as one:
+            actions.send_invitation_reminders()
+
+        TicketInvitation.objects.all().delete()
+        self.create_invitations(10)
+        with CaptureQueriesContext(connection) as ten:
+            actions.send_invitation_reminders()
+
+        self.assertEqual(len(one), len(ten))
+
+    def test_failures_are_not_recorded(self):
+        self.create_invitations(2)
+        self.create_invitations(1, domain='example.org')
+
+        with override_settings(EMAIL_BACKEND='ironcage.tests.test_bulk_mail.FailingEmailBackend'):
+            ids, num_sent = actions.send_invitation_reminders()
+
+        self.assertEqual((len(ids), num_sent), (3, 2))
+        failed = TicketInvitation.objects.get(email_addr='attendee0@example.org')
+        self.assertEqual(failed.num_reminders, 0)
+        self.assertIsNone(failed.last_reminded_at)
+
+        self.assertEqual(actions.send_invitation_reminders(exclude_ids=ids), ([], 0))
+        self.assertEqual(actions.send_invitation_reminders()[0], [failed.id])
+
+
 class ReassignTicketTests(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -0,0 +1,130 @@
+from datetime import timedelta
+from io import StringIO
+import os
+import tempfile
+
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import factories
+
+from grants.tests import factories as grants_factories
+from tickets.models import DayInventory, Ticket, TicketInvitation
+
+
+class SendFakeStripeEventsTests(TestCase):
+    @override_settings(DEBUG=False, STRIPE_API_KEY_SECRET='sk_live_abcdefghijklmnop')
+    def test_refuses_to_run_with_live_keys(self):
+        order = factories.create_pending_order_for_self()
+        order.mark_as_processing()
+
+        with self.assertRaisesMessage(CommandError, 'Fake events can only be sent'):
+            call_command('sendfakestripeevents', '--url=http://localhost:1/', stdout=StringIO())
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'processing')
+
+
+class CreateFreeTicketsTests(TestCase):
+    def write_csv(self, text):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_create_from_csv(self):
+        factories.create_free_ticket('alice@example.com')
+        mail.outbox = []
+        path = self.write_csv('email_addr,pot,days\nalice@example.com,,\nbob@example.com,,thu fri\ncarol@example.com,Sponsor,\n')
+        stdout = StringIO()
+
+        call_command('createfreetickets', csv=path, pot='Speakers', stdout=stdout)
+
+        self.assertIn('Skipped alice@example.com, who already has a ticket', stdout.getvalue())
+        self.assertIn('Created 2 ticket(s), and skipped 1', stdout.getvalue())
+        self.assertEqual(
+            sorted(Ticket.objects.values_list('invitations__email_addr', 'pot')),
+            [('alice@example.com', 'Financial assistance'), ('bob@example.com', 'Speakers'), ('carol@example.com', 'Sponsor')],
+        )
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_create_from_csv_for_sold_out_day(self):
+        DayInventory.objects.set_capacity('fri', 1)
+        path = self.write_csv('alice@example.com,Sponsor,thu fri\nbob@example.com,Sponsor,fri\n')
+
+        with self.assertRaisesMessage(CommandError, 'Sorry, tickets for Friday have sold out'):
+            call_command('createfreetickets', csv=path, stdout=StringIO())
+
+        self.assertEqual(Ticket.objects.count(), 0)
+
+    def test_dry_run(self):
+        factories.create_free_ticket('alice@example.com')
+        path = self.write_csv('alice@example.com,Sponsor\nbob@example.com,Sponsor\n')
+        stdout = StringIO()
+
+        call_command('createfreetickets', csv=path, dry_run=True, stdout=stdout)
+
+        self.assertIn('Running this would create 1 ticket(s), and skip 1 address(es) that already have a ticket', stdout.getvalue())
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_invalid_csv(self):
+        path = self.write_csv('alice@example.com\n')
+
+        with self.assertRaisesMessage(CommandError, 'Line 1: No pot given for alice@example.com'):
+            call_command('createfreetickets', csv=path)
+
+        self.assertEqual(Ticket.objects.count(), 0)
+
+
+class CreateFinancialAssistanceTicketsTests(TestCase):
+    def test_create(self):
+        application = grants_factories.create_application()
+        application.amount_offered = 100
+        application.save()
+        grants_factories.create_application()
+
+        call_command('createfinancialassistancetickets', stdout=StringIO())
+
+        ticket = Ticket.objects.get()
+        self.assertEqual(ticket.pot, 'Financial assistance')
+        self.assertEqual(ticket.invitation().email_addr, application.applicant.email_addr)
+
+
+@override_settings(TICKET_INVITATION_REMINDER_DAYS=[3, 7, 14])
+class SendTicketInvitationRemindersTests(TestCase):
+    def setUp(self):
+        for ix in range(5):
+            factories.create_free_ticket(f'attendee{ix}@example.com')
+        TicketInvitation.objects.update(created_at=timezone.now() - timedelta(days=4))
+        mail.outbox = []
+
+    def test_send_reminders(self):
+        stdout = StringIO()
+        call_command('sendticketinvitationreminders', '--batch-size=2', stdout=stdout)
+
+        self.assertEqual(stdout.getvalue(), 'Sent 5 reminder(s) in 3 batch(es), with 0 failure(s)\n')
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(TicketInvitation.objects.filter(num_reminders=1).count(), 5)
+
+        stdout = StringIO()
+        call_command('sendticketinvitationreminders', stdout=stdout)
+
+        self.assertEqual(stdout.getvalue(), 'Sent 0 reminder(s) in 0 batch(es), with 0 failure(s)\n')
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_max_batches(self):
+        stdout = StringIO()
+        call_command('sendticketinvitationreminders', '--batch-size=2', '--max-batches=1', stdout=stdout)
+
+        self.assertEqual(stdout.getvalue(), 'Sent 2 reminder(s) in 1 batch(es), with 0 failure(s)\n')
+        self.assertEqual(TicketInvitation.objects.filter(num_reminders=1).count(), 2)
+
+    def test_dry_run(self):
+        stdout = StringIO()
+        call_command('sendticketinvitationreminders', '--dry-run', stdout=stdout)
+
+        self.assertEqual(stdout.getvalue(), 'There are 5 reminder(s) due\n')
+        self.assertEqual(len(mail.outbox), 0)
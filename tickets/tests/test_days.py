@@ -0,0 +1,87 @@
+from django.test import SimpleTestCase, TestCase
+
+from . import factories
+
+from tickets.days import DaySet, day_mask_expression, num_days_expression
+from tickets.models import Ticket
+
+
+class DaySetTests(SimpleTestCase):
+    def test_from_days(self):
+        days = DaySet.from_days(['sat', 'thu'])
+        self.assertEqual(int(days), 0b00101)
+        self.assertEqual(list(days), ['thu', 'sat'])
+        self.assertEqual(len(days), 2)
+        self.assertIn('thu', days)
+        self.assertNotIn('fri', days)
+
+    def test_from_unknown_day(self):
+        with self.assertRaises(ValueError):
+            DaySet.from_days(['thu', 'tue'])
+
+    def test_from_flags(self):
+        days = DaySet.from_flags({'thu': False, 'fri': True, 'sat': False, 'sun': False, 'mon': True})
+        self.assertEqual(list(days), ['fri', 'mon'])
+
+    def test_invalid_mask(self):
+        with self.assertRaises(ValueError):
+            DaySet(1 << 5)
+
+    def test_empty(self):
+        self.assertFalse(DaySet())
+        self.assertEqual(len(DaySet()), 0)
+
+    def test_set_operations(self):
+        a = DaySet.from_days(['thu', 'fri'])
+        b = DaySet.from_days(['fri', 'sat'])
+        self.assertEqual(a | b, DaySet.from_days(['thu', 'fri', 'sat']))
+        self.assertEqual(a & b, DaySet.from_days(['fri']))
+        self.assertEqual(a - b, DaySet.from_days(['thu']))
+
+    def test_names(self):
+        self.assertEqual(DaySet.from_days(['mon', 'thu']).names(), ['Thursday', 'Monday'])
+
+    def test_as_flags(self):
+        self.assertEqual(
+            DaySet.from_days(['fri']).as_flags(),
+            {'thu': False, 'fri': True, 'sat': False, 'sun': False, 'mon': False},
+        )
+
+    def test_is_immutable(self):
+        with self.assertRaises(AttributeError):
+            DaySet().mask = 1
+
+
+class DaysMixinTests(TestCase):
+    def test_day_set(self):
+        ticket = factories.create_ticket(num_days=3)
+        self.assertEqual(ticket.day_set, DaySet.from_days(['thu', 'fri', 'sat']))
+        self.assertEqual(ticket.days(), ['Thursday', 'Friday', 'Saturday'])
+        self.assertEqual(ticket.days_abbrev(), ['thu', 'fri', 'sat'])
+        self.assertEqual(ticket.num_days(), 3)
+
+    def test_set_day_set(self):
+        ticket = factories.create_ticket(num_days=3)
+        ticket.day_set = DaySet.from_days(['sun'])
+        self.assertFalse(ticket.thu)
+        self.assertTrue(ticket.sun)
+
+
+class DayExpressionTests(TestCase):
+    def test_day_mask_and_num_days(self):
+        factories.create_ticket(num_days=1)
+        factories.create_ticket(num_days=3)
+
+        rows = Ticket.objects.annotate(
+            day_mask=day_mask_expression(),
+            num_days=num_days_expression(),
+        ).values_list('day_mask', 'num_days').order_by('id')
+
+        self.assertEqual(list(rows), [(0b00001, 1), (0b00111, 3)])
+
+    def test_prefix(self):
+        ticket = factories.create_ticket_with_unclaimed_invitation()
+
+        masks = ticket.invitations.annotate(day_mask=day_mask_expression('ticket__')).values_list('day_mask', flat=True)
+
+        self.assertEqual(list(masks), [int(ticket.day_set)])
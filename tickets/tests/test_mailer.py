@@ -5,7 +5,7 @@ from django.test import TestCase
 
 from . import factories
 
-from tickets.mailer import send_invitation_mail, send_order_confirmation_mail
+from tickets.mailer import build_invitation_reminder_mail, send_invitation_mail, send_order_confirmation_mail
 from tickets.models import TicketInvitation
 
 
@@ -44,6 +44,25 @@ class MailerTests(TestCase):
         self.assertTrue(re.search(r'You have been assigned a ticket for PyCon UK 2017', email.body))
         self.assertTrue(re.search(r'http://testserver/tickets/invitations/\w{12}/', email.body))
 
+    def test_build_invitation_reminder_mail(self):
+        factories.create_confirmed_order_for_others(self.alice)
+        invitation = TicketInvitation.objects.get(email_addr='bob@example.com')
+
+        subject, body, to_addr = build_invitation_reminder_mail(invitation)
+
+        self.assertEqual(to_addr, 'bob@example.com')
+        self.assertEqual(subject, f'Reminder: PyCon UK 2017 ticket invitation ({invitation.ticket.ticket_id})')
+        self.assertIn("Alice has purchased you a ticket for PyCon UK 2017, but you haven't claimed it yet", body)
+        self.assertIn(f'http://testserver/tickets/invitations/{invitation.token}/', body)
+
+    def test_build_invitation_reminder_mail_for_free_ticket(self):
+        factories.create_free_ticket(self.alice)
+        invitation = TicketInvitation.objects.get(email_addr='alice@example.com')
+
+        subject, body, to_addr = build_invitation_reminder_mail(invitation)
+
+        self.assertIn("You have been assigned a ticket for PyCon UK 2017, but you haven't claimed it yet", body)
+
     def test_send_order_confirmation_mail_for_order_for_self(self):
         order = factories.create_confirmed_order_for_self(self.alice)
 
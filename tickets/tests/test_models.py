@@ -1,7 +1,18 @@
-from django.test import TestCase
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import threading
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from . import factories
 
+from tickets import actions
+from tickets.models import DayInventory, Order, SoldOut, Ticket, TicketInvitation
+
 
 class OrderTests(TestCase):
     def test_cost_incl_vat_for_confirmed_order(self):
@@ -197,3 +208,414 @@ Cathays Park
 Cardiff
 '''.strip()
         self.assertEqual(order.company_addr_formatted(), 'City Hall, Cathays Park, Cardiff')
+
+
+class OrderTicketsTests(TestCase):
+    def test_all_tickets_is_memoised(self):
+        order = factories.create_confirmed_order_for_self_and_others()
+        order = Order.objects.get(pk=order.pk)
+
+        with self.assertNumQueries(3):
+            # One query for the tickets, and one each for their owners'
+            # invitations and the order's purchaser
+            order.cost_incl_vat()
+            order.vat()
+            order.brief_summary()
+            order.ticket_summary()
+            order.ticket_details()
+            order.ticket_for_self()
+            order.tickets_for_others()
+
+    def test_all_tickets_uses_prefetched_tickets(self):
+        order = factories.create_confirmed_order_for_self_and_others()
+        order = Order.objects.select_related('purchaser').prefetch_related('tickets__invitations', 'tickets__owner').get(pk=order.pk)
+
+        with self.assertNumQueries(0):
+            order.ticket_details()
+            order.ticket_for_self()
+
+    def test_all_tickets_after_update(self):
+        order = factories.create_pending_order_for_self()
+        self.assertEqual(order.num_tickets(), 1)
+        actions.update_pending_order(
+            order,
+            rate='individual',
+            email_addrs_and_days_for_others=[
+                ('bob@example.com', ['fri']),
+                ('carol@example.com', ['sat']),
+            ]
+        )
+        self.assertEqual(order.num_tickets(), 2)
+
+    def test_all_tickets_after_confirm(self):
+        order = factories.create_pending_order_for_self()
+        self.assertNotIsInstance(order.all_tickets()[0], Ticket)
+        factories.confirm_order(order)
+        self.assertIsInstance(order.all_tickets()[0], Ticket)
+
+    def test_all_tickets_after_refund(self):
+        order = factories.create_confirmed_order_for_self()
+        self.assertEqual(order.num_tickets(), 1)
+        order.delete_tickets_and_mark_as_refunded()
+        self.assertEqual(order.num_tickets(), 0)
+
+
+class OrderManagerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        order = factories.create_pending_order_for_self(num_days=3)
+        actions.confirm_order(order, 'ch_1', 1495355163)  # 2017-05-21 08:26 (Sunday)
+        order = factories.create_pending_order_for_self_and_others()
+        actions.confirm_order(order, 'ch_2', 1495357800)  # 2017-05-21 09:10
+        order = factories.create_pending_order_for_self(rate='corporate', num_days=2)
+        actions.confirm_order(order, 'ch_3', 1495533600)  # 2017-05-23 10:00 (Tuesday)
+        factories.create_pending_order_for_self()
+
+    def test_sales_by_period_by_day(self):
+        with self.assertNumQueries(1):
+            sales = Order.objects.sales_by_period('day')
+
+        self.assertEqual(sales, [{
+            'period': datetime(2017, 5, 21, tzinfo=timezone.utc),
+            'num_tickets': 4,
+            'num_days': 10,
+            'revenue': 432,
+            'cumulative_num_tickets': 4,
+            'cumulative_num_days': 10,
+            'cumulative_revenue': 432,
+        }, {
+            'period': datetime(2017, 5, 23, tzinfo=timezone.utc),
+            'num_tickets': 1,
+            'num_days': 2,
+            'revenue': 180,
+            'cumulative_num_tickets': 5,
+            'cumulative_num_days': 12,
+            'cumulative_revenue': 612,
+        }])
+
+    def test_sales_by_period_by_hour(self):
+        sales = Order.objects.sales_by_period('hour')
+        self.assertEqual(
+            [(s['period'].hour, s['num_tickets'], s['revenue'], s['cumulative_revenue']) for s in sales],
+            [(8, 1, 126, 126), (9, 3, 306, 432), (10, 1, 180, 612)],
+        )
+
+    def test_sales_by_period_by_week(self):
+        sales = Order.objects.sales_by_period('week')
+        self.assertEqual(
+            [(s['period'].date().isoformat(), s['num_tickets'], s['cumulative_num_tickets']) for s in sales],
+            [('2017-05-15', 4, 4), ('2017-05-22', 1, 5)],
+        )
+
+
+class TicketManagerTests(TestCase):
+    def test_counts_by_rate_and_num_days(self):
+        factories.create_confirmed_order_for_self_and_others()
+        factories.create_ticket(rate='corporate', num_days=2)
+        factories.create_free_ticket()
+
+        counts = sorted(Ticket.objects.counts_by_rate_and_num_days(), key=lambda c: (c['rate'], c['num_days']))
+
+        self.assertEqual(counts, [{
+            'rate': 'corporate',
+            'num_days': 2,
+            'num_tickets': 1,
+            'num_thu': 1,
+            'num_fri': 1,
+            'num_sat': 0,
+            'num_sun': 0,
+            'num_mon': 0,
+        }, {
+            'rate': 'free',
+            'num_days': 0,
+            'num_tickets': 1,
+            'num_thu': 0,
+            'num_fri': 0,
+            'num_sat': 0,
+            'num_sun': 0,
+            'num_mon': 0,
+        }, {
+            'rate': 'individual',
+            'num_days': 2,
+            'num_tickets': 2,
+            'num_thu': 0,
+            'num_fri': 1,
+            'num_sat': 2,
+            'num_sun': 1,
+            'num_mon': 0,
+        }, {
+            'rate': 'individual',
+            'num_days': 3,
+            'num_tickets': 1,
+            'num_thu': 1,
+            'num_fri': 1,
+            'num_sat': 1,
+            'num_sun': 0,
+            'num_mon': 0,
+        }])
+
+
+class TicketBulkCreateTests(TestCase):
+    def test_bulk_create_for_order(self):
+        order = factories.create_pending_order_for_self_and_others()
+        factories.confirm_order(order)
+
+        [ticket_for_self] = order.tickets.filter(owner=order.purchaser)
+        self.assertEqual(ticket_for_self.days(), ['Thursday', 'Friday', 'Saturday'])
+
+        invitations = TicketInvitation.objects.filter(ticket__order=order).order_by('ticket_id')
+        self.assertEqual(
+            [(i.email_addr, i.ticket.days()) for i in invitations],
+            [('bob@example.com', ['Friday', 'Saturday']), ('carol@example.com', ['Saturday', 'Sunday'])],
+        )
+        self.assertEqual(len({i.token for i in invitations}), 2)
+
+    def test_confirm_queries_do_not_depend_on_number_of_tickets(self):
+        user = factories.create_user()
+
+        def num_queries_to_confirm(num_others):
+            order = actions.create_pending_order(
+                purchaser=user,
+                rate='corporate',
+                days_for_self=None,
+                email_addrs_and_days_for_others=[
+                    (f'attendee{ix}@example.com', ['fri']) for ix in range(num_others)
+                ],
+                company_details={'name': 'Sirius Cybernetics Corp.', 'addr': 'Eadrax, Sirius Tau'},
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                order.confirm('ch_abcdefghijklmnopqurstuvw', 1495355163)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(num_queries_to_confirm(1), num_queries_to_confirm(40))
+
+    def test_bulk_create_with_tokens_avoids_tokens_in_use(self):
+        ticket = factories.create_ticket_with_unclaimed_invitation()
+        token_in_use = ticket.invitations.get().token
+        new_ticket = factories.create_free_ticket()
+        new_ticket.invitations.all().delete()
+
+        with patch('tickets.models.get_random_string', side_effect=[token_in_use, 'abcdefghijkl']):
+            [invitation] = TicketInvitation.objects.bulk_create_with_tokens([
+                TicketInvitation(ticket=new_ticket, email_addr='zaphod@example.com'),
+            ])
+
+        self.assertEqual(invitation.token, 'abcdefghijkl')
+
+    def test_bulk_create_with_tokens_retries_after_collision(self):
+        ticket = factories.create_ticket_with_unclaimed_invitation()
+        token_in_use = ticket.invitations.get().token
+        new_ticket = factories.create_free_ticket()
+        new_ticket.invitations.all().delete()
+
+        # Simulate another process claiming the token between the check and
+        # the INSERT
+        with patch('tickets.models.generate_unique_tokens', side_effect=[[token_in_use], ['abcdefghijkl']]):
+            [invitation] = TicketInvitation.objects.bulk_create_with_tokens([
+                TicketInvitation(ticket=new_ticket, email_addr='zaphod@example.com'),
+            ])
+
+        self.assertEqual(invitation.token, 'abcdefghijkl')
+        self.assertEqual(new_ticket.invitations.get().token, 'abcdefghijkl')
+
+
+@override_settings(TICKET_INVITATION_REMINDER_DAYS=[3, 7, 14])
+class TicketInvitationDueForReminderTests(TestCase):
+    now = datetime(2017, 9, 1, 12, tzinfo=timezone.utc)
+
+    def create_invitation(self, days_ago, num_reminders=0, last_reminded_days_ago=None):
+        ticket = factories.create_free_ticket()
+        invitation = ticket.invitation()
+        last_reminded_at = None if last_reminded_days_ago is None else self.now - timedelta(days=last_reminded_days_ago)
+        TicketInvitation.objects.filter(pk=invitation.pk).update(
+            created_at=self.now - timedelta(days=days_ago),
+            num_reminders=num_reminders,
+            last_reminded_at=last_reminded_at,
+        )
+        return invitation
+
+    def assertDue(self, invitations):
+        self.assertEqual(set(TicketInvitation.objects.due_for_reminder(self.now)), set(invitations))
+
+    def test_first_reminder(self):
+        due = self.create_invitation(days_ago=3)
+        self.create_invitation(days_ago=2.9)
+        self.assertDue([due])
+
+    def test_later_reminders(self):
+        due_second = self.create_invitation(days_ago=7, num_reminders=1, last_reminded_days_ago=4)
+        due_third = self.create_invitation(days_ago=20, num_reminders=2, last_reminded_days_ago=7)
+        self.create_invitation(days_ago=6, num_reminders=1, last_reminded_days_ago=3)
+        self.create_invitation(days_ago=30, num_reminders=3, last_reminded_days_ago=16)
+        self.assertDue([due_second, due_third])
+
+    def test_reminders_that_have_fallen_behind_are_spaced_out(self):
+        self.create_invitation(days_ago=20, num_reminders=1, last_reminded_days_ago=1)
+        due = self.create_invitation(days_ago=20, num_reminders=1, last_reminded_days_ago=4)
+        self.assertDue([due])
+
+    def test_claimed_invitations_are_not_due(self):
+        invitation = self.create_invitation(days_ago=10)
+        TicketInvitation.objects.filter(pk=invitation.pk).update(status='claimed')
+        self.assertDue([])
+
+    @override_settings(TICKET_INVITATION_REMINDER_DAYS=[])
+    def test_no_reminders(self):
+        self.create_invitation(days_ago=10)
+        self.assertDue([])
+
+
+class DayInventoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        DayInventory.objects.set_capacity('fri', 3)
+
+    def remaining(self, day):
+        return DayInventory.objects.get(day=day).remaining
+
+    def test_reserve(self):
+        DayInventory.objects.reserve(Counter({'thu': 5, 'fri': 2}))
+        self.assertEqual(self.remaining('fri'), 1)
+
+    def test_reserve_when_sold_out(self):
+        with self.assertRaises(SoldOut) as cm:
+            with transaction.atomic():
+                DayInventory.objects.set_capacity('thu', 10)
+                DayInventory.objects.reserve(Counter({'thu': 1, 'fri': 4}))
+
+        self.assertEqual(cm.exception.days, ['fri'])
+        self.assertEqual(str(cm.exception), 'Sorry, tickets for Friday have sold out')
+        self.assertEqual(self.remaining('fri'), 3)
+
+    def test_release(self):
+        DayInventory.objects.reserve(Counter({'fri': 3}))
+        DayInventory.objects.release(Counter({'fri': 2}))
+        self.assertEqual(self.remaining('fri'), 2)
+
+    def test_set_capacity_counts_tickets_sold(self):
+        factories.create_confirmed_order_for_self_and_others()
+        inventory = DayInventory.objects.set_capacity('sat', 10)
+        self.assertEqual(inventory.remaining, 7)
+
+    @override_settings(TICKET_AVAILABILITY_CACHE_TIMEOUT=10)
+    def test_availability_is_cached(self):
+        self.assertEqual(DayInventory.objects.availability(), {'thu': None, 'fri': 3, 'sat': None, 'sun': None, 'mon': None})
+
+        with self.assertNumQueries(0):
+            DayInventory.objects.availability()
+
+        DayInventory.objects.reserve(Counter({'fri': 1}))
+        self.assertEqual(DayInventory.objects.availability()['fri'], 2)
+
+    def test_unavailable_days(self):
+        self.assertEqual(DayInventory.objects.unavailable_days(Counter({'thu': 100, 'fri': 3})), [])
+        self.assertEqual(DayInventory.objects.unavailable_days(Counter({'thu': 100, 'fri': 4})), ['fri'])
+
+    def test_confirm_reserves_tickets(self):
+        factories.create_confirmed_order_for_self_and_others()
+        self.assertEqual(self.remaining('fri'), 1)
+
+    def test_confirm_when_sold_out(self):
+        DayInventory.objects.set_capacity('fri', 1)
+        order = factories.create_pending_order_for_self_and_others()
+
+        with self.assertRaises(SoldOut):
+            with transaction.atomic():
+                order.confirm('ch_abcdefghijklmnopqurstuvw', 1495355163)
+
+        self.assertEqual(self.remaining('fri'), 1)
+        self.assertEqual(Ticket.objects.count(), 0)
+
+    def test_refund_releases_tickets(self):
+        order = factories.create_confirmed_order_for_self_and_others()
+        order.delete_tickets_and_mark_as_refunded()
+        self.assertEqual(self.remaining('fri'), 3)
+
+    def test_update_days(self):
+        ticket = factories.create_free_ticket()
+        ticket.update_days(['thu', 'fri'])
+        self.assertEqual(self.remaining('fri'), 2)
+        ticket.update_days(['sat'])
+        self.assertEqual(self.remaining('fri'), 3)
+
+
+class DayInventoryConcurrencyTests(TransactionTestCase):
+    def test_parallel_confirmations_for_last_tickets(self):
+        cache.clear()
+        DayInventory.objects.set_capacity('fri', 5)
+
+        orders = [
+            actions.create_pending_order(
+                purchaser=factories.create_user(),
+                rate='individual',
+                email_addrs_and_days_for_others=[(f'attendee{ix}@example.com', ['fri'])],
+            )
+            for ix in range(12)
+        ]
+
+        barrier = threading.Barrier(len(orders))
+        outcomes = []
+
+        def confirm(order):
+            try:
+                barrier.wait(5)
+                with transaction.atomic():
+                    order.confirm('ch_abcdefghijklmnopqurstuvw', 1495355163)
+                outcomes.append('confirmed')
+            except SoldOut:
+                outcomes.append('sold out')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=confirm, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count('confirmed'), 5)
+        self.assertEqual(outcomes.count('sold out'), 7)
+        self.assertEqual(Ticket.objects.filter(fri=True).count(), 5)
+        self.assertEqual(DayInventory.objects.get(day='fri').remaining, 0)
+
+    def test_set_capacity_counts_tickets_being_confirmed(self):
+        cache.clear()
+        order = actions.create_pending_order(
+            purchaser=factories.create_user(),
+            rate='individual',
+            email_addrs_and_days_for_others=[('attendee@example.com', ['sat'])],
+        )
+
+        confirmed = threading.Event()
+        proceed = threading.Event()
+        inventories = []
+
+        def confirm():
+            try:
+                with transaction.atomic():
+                    order.confirm('ch_abcdefghijklmnopqurstuvw', 1495355163)
+                    confirmed.set()
+                    proceed.wait(5)
+            finally:
+                connection.close()
+
+        def set_capacity():
+            try:
+                inventories.append(DayInventory.objects.set_capacity('sat', 10))
+            finally:
+                connection.close()
+
+        confirm_thread = threading.Thread(target=confirm)
+        confirm_thread.start()
+        confirmed.wait(5)
+
+        set_capacity_thread = threading.Thread(target=set_capacity)
+        set_capacity_thread.start()
+        set_capacity_thread.join(0.5)
+        self.assertTrue(set_capacity_thread.is_alive())
+
+        proceed.set()
+        confirm_thread.join()
+        set_capacity_thread.join()
+
+        self.assertEqual(inventories[0].remaining, 9)
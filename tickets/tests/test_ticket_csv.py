@@ -0,0 +1,98 @@
+from io import StringIO
+
+from django.test import SimpleTestCase
+
+from tickets import ticket_csv
+
+
+class ReadTests(SimpleTestCase):
+    def read(self, text):
+        return ticket_csv.read(StringIO(text))
+
+    def assertErrors(self, text, errors):
+        with self.assertRaises(ticket_csv.InvalidTicketsCsv) as cm:
+            self.read(text)
+        self.assertEqual(cm.exception.errors, errors)
+
+    def test_read(self):
+        text = 'email_addr,days\nalice@example.com,thu fri sat\n\nbob@example.com,Sunday;Monday\n'
+        self.assertEqual(self.read(text), [
+            ['alice@example.com', ['thu', 'fri', 'sat']],
+            ['bob@example.com', ['sun', 'mon']],
+        ])
+
+    def test_read_without_header(self):
+        self.assertEqual(self.read('alice@example.com,sat thu\n'), [['alice@example.com', ['thu', 'sat']]])
+
+    def test_read_invalid_rows(self):
+        text = '\n'.join([
+            'email_addr,days',
+            'alice@example.com,thu',
+            'bob@example,fri',
+            'carol@example.com',
+            'dave@example.com,',
+            'erin@example.com,tue',
+            'alice@example.com,fri',
+        ])
+        self.assertErrors(text, [
+            'Line 3: bob@example is not a valid email address',
+            'Line 4: Expected an email address and a list of days',
+            'Line 5: No days given for dave@example.com',
+            'Line 6: Unknown day: tue',
+            'Line 7: alice@example.com is also on line 2',
+        ])
+
+    def test_read_duplicates_in_different_case(self):
+        self.assertErrors('Alice@example.com,thu\nalice@EXAMPLE.com,fri\n', [
+            'Line 2: alice@EXAMPLE.com is also on line 1',
+        ])
+
+    def test_read_stops_after_too_many_errors(self):
+        text = '\n'.join(f'attendee{ix}@example,thu' for ix in range(100))
+        with self.assertRaises(ticket_csv.InvalidTicketsCsv) as cm:
+            self.read(text)
+        self.assertEqual(len(cm.exception.errors), ticket_csv.MAX_ERRORS + 1)
+        self.assertEqual(cm.exception.errors[-1], 'Too many errors, so the rest of the file was not checked')
+
+    def test_read_too_many_rows(self):
+        text = '\n'.join(f'attendee{ix}@example.com,thu' for ix in range(ticket_csv.MAX_ROWS + 1))
+        self.assertErrors(text, [f'There can be at most {ticket_csv.MAX_ROWS} tickets in one file'])
+
+    def test_read_empty_file(self):
+        self.assertErrors('email_addr,days\n', ['The file does not contain any tickets'])
+
+
+class ReadFreeTicketsTests(SimpleTestCase):
+    def test_read_free_tickets(self):
+        text = 'email_addr,pot,days\nalice@example.com,Sponsor,thu fri\nbob@example.com,,\ncarol@example.com\n'
+        self.assertEqual(ticket_csv.read_free_tickets(StringIO(text), pot='Speakers'), [
+            ['alice@example.com', 'Sponsor', ['thu', 'fri']],
+            ['bob@example.com', 'Speakers', []],
+            ['carol@example.com', 'Speakers', []],
+        ])
+
+    def test_read_free_tickets_without_pot(self):
+        with self.assertRaises(ticket_csv.InvalidTicketsCsv) as cm:
+            ticket_csv.read_free_tickets(StringIO('alice@example.com,,thu\n'))
+        self.assertEqual(cm.exception.errors, ['Line 1: No pot given for alice@example.com'])
+
+    def test_read_free_tickets_duplicates_in_different_case(self):
+        with self.assertRaises(ticket_csv.InvalidTicketsCsv) as cm:
+            ticket_csv.read_free_tickets(StringIO('Alice@example.com,Sponsor\nalice@example.com,Sponsor\n'))
+        self.assertEqual(cm.exception.errors, ['Line 2: alice@example.com is also on line 1'])
+
+    def test_read_free_tickets_has_no_row_limit(self):
+        text = '\n'.join(f'attendee{ix}@example.com,Sponsor' for ix in range(ticket_csv.MAX_ROWS + 1))
+        self.assertEqual(len(ticket_csv.read_free_tickets(StringIO(text))), ticket_csv.MAX_ROWS + 1)
+
+
+class WriteTests(SimpleTestCase):
+    def test_round_trip(self):
+        email_addrs_and_days = [
+            ['alice@example.com', ['thu', 'fri', 'sat']],
+            ['bob@example.com', ['sun', 'mon']],
+        ]
+        f = StringIO()
+        ticket_csv.write(email_addrs_and_days, f)
+        f.seek(0)
+        self.assertEqual(ticket_csv.read(f), email_addrs_and_days)
@@ -1,13 +1,20 @@
 from datetime import datetime, timedelta, timezone
 
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase, override_settings
 
+import stripe
+
 from ironcage.tests import utils
+from jobs.models import Job
+from jobs.queue import run_next_job
 
 from . import factories
 
-from tickets import actions
-from tickets.models import TicketInvitation
+from tickets import actions, fake_stripe
+from tickets.models import DayInventory, StripeEvent, TicketInvitation
 
 
 class NewOrderTests(TestCase):
@@ -19,7 +26,7 @@ class NewOrderTests(TestCase):
         self.client.force_login(self.alice)
         rsp = self.client.get('/tickets/orders/new/')
         self.assertInHTML('<tr><td class="text-center">5 days</td><td class="text-center">£198</td><td class="text-center">£396</td><td class="text-center">£66</td></tr>', rsp.content.decode())
-        self.assertContains(rsp, '<form method="post" id="order-form">')
+        self.assertContains(rsp, '<form method="post" id="order-form" enctype="multipart/form-data">')
         self.assertNotContains(rsp, 'to buy a ticket')
 
     @override_settings(TICKET_SALES_CLOSE_AT=datetime.now(timezone.utc) - timedelta(days=1))
@@ -37,7 +44,7 @@ class NewOrderTests(TestCase):
         self.client.force_login(self.alice)
         rsp = self.client.get('/tickets/orders/new/?deadline-bypass-token=abc123', follow=True)
         self.assertNotContains(rsp, 'ticket sales have closed')
-        self.assertContains(rsp, '<form method="post" id="order-form">')
+        self.assertContains(rsp, '<form method="post" id="order-form" enctype="multipart/form-data">')
 
     @override_settings(
         TICKET_SALES_CLOSE_AT=datetime.now(timezone.utc) - timedelta(days=1),
@@ -80,6 +87,26 @@ class NewOrderTests(TestCase):
         rsp = self.client.post('/tickets/orders/new/', form_data, follow=True)
         self.assertContains(rsp, 'You are ordering 1 ticket')
 
+    def test_post_when_sold_out(self):
+        DayInventory.objects.set_capacity('fri', 0)
+        self.client.force_login(self.alice)
+        form_data = {
+            'who': 'self',
+            'rate': 'individual',
+            'days': ['thu', 'fri', 'sat'],
+            # The formset gets POSTed even when order is only for self
+            'form-TOTAL_FORMS': '2',
+            'form-INITIAL_FORMS': '0',
+            'form-MIN_NUM_FORMS': '1',
+            'form-MAX_NUM_FORMS': '1000',
+            'form-0-email_addr': '',
+            'form-1-email_addr': '',
+        }
+        rsp = self.client.post('/tickets/orders/new/', form_data, follow=True)
+        self.assertContains(rsp, 'Sorry, tickets for Friday have sold out')
+        self.assertContains(rsp, 'Tickets for Friday have sold out.')
+        self.assertNotContains(rsp, 'You are ordering 1 ticket')
+
     def test_post_for_self_corporate(self):
         self.client.force_login(self.alice)
         form_data = {
@@ -137,7 +164,7 @@ class NewOrderTests(TestCase):
     def test_get_when_not_authenticated(self):
         rsp = self.client.get('/tickets/orders/new/')
         self.assertInHTML('<tr><td class="text-center">5 days</td><td class="text-center">£198</td><td class="text-center">£396</td><td class="text-center">£66</td></tr>', rsp.content.decode())
-        self.assertNotContains(rsp, '<form method="post" id="order-form">')
+        self.assertNotContains(rsp, '<form method="post" id="order-form" enctype="multipart/form-data">')
         self.assertContains(rsp, 'Please <a href="/accounts/register/?next=/tickets/orders/new/">sign up</a> or <a href="/accounts/login/?next=/tickets/orders/new/">sign in</a> to buy a ticket.', html=True)
 
     def test_post_when_not_authenticated(self):
@@ -154,7 +181,7 @@ class OrderEditTests(TestCase):
         self.client.force_login(self.order.purchaser)
         rsp = self.client.get(f'/tickets/orders/{self.order.order_id}/edit/')
         self.assertInHTML('<tr><td class="text-center">5 days</td><td class="text-center">£198</td><td class="text-center">£396</td><td class="text-center">£66</td></tr>', rsp.content.decode())
-        self.assertContains(rsp, '<form method="post" id="order-form">')
+        self.assertContains(rsp, '<form method="post" id="order-form" enctype="multipart/form-data">')
         self.assertNotContains(rsp, 'Please create an account to buy a ticket.')
 
     def test_get_when_user_has_order_for_self(self):
@@ -259,6 +286,85 @@ class OrderEditTests(TestCase):
         self.assertContains(rsp, 'This order has already been paid')
 
 
+class GroupOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = factories.create_user()
+
+    def csv_file(self, num_tickets):
+        rows = ['email_addr,days'] + [f'attendee{ix}@example.com,thu fri' for ix in range(num_tickets)]
+        return SimpleUploadedFile('tickets.csv', '\n'.join(rows).encode('utf-8'), content_type='text/csv')
+
+    def form_data(self, **kwargs):
+        return {
+            'who': 'others',
+            'rate': 'corporate',
+            'company_name': 'Sirius Cybernetics Corp.',
+            'company_addr': 'Eadrax, Sirius Tau',
+            'form-TOTAL_FORMS': '1',
+            'form-INITIAL_FORMS': '0',
+            'form-MIN_NUM_FORMS': '1',
+            'form-MAX_NUM_FORMS': '1000',
+            'form-0-email_addr': '',
+            **kwargs,
+        }
+
+    def test_new_order_with_csv(self):
+        self.client.force_login(self.alice)
+        rsp = self.client.post('/tickets/orders/new/', self.form_data(csv_file=self.csv_file(30)), follow=True)
+        self.assertContains(rsp, 'You are ordering 30 tickets')
+        self.assertContains(rsp, '<td>30 tickets for 2 days</td>', html=True)
+        self.assertNotContains(rsp, 'attendee0@example.com')
+
+        order = rsp.context['order']
+        self.assertEqual(order.unconfirmed_details['email_addrs_and_days_for_others'][0], ['attendee0@example.com', ['thu', 'fri']])
+
+    def test_new_order_with_invalid_csv(self):
+        self.client.force_login(self.alice)
+        csv_file = SimpleUploadedFile('tickets.csv', b'alice@example.com,thu\nbob@example,fri\n', content_type='text/csv')
+        rsp = self.client.post('/tickets/orders/new/', self.form_data(csv_file=csv_file), follow=True)
+        self.assertContains(rsp, 'There were problems with the file')
+        self.assertContains(rsp, 'Line 2: bob@example is not a valid email address')
+        self.assertFalse(self.alice.orders.exists())
+
+    def test_edit_order_with_uploaded_tickets(self):
+        order = factories.create_pending_group_order(self.alice)
+        self.client.force_login(self.alice)
+        rsp = self.client.get(f'/tickets/orders/{order.order_id}/edit/')
+        self.assertContains(rsp, 'Keep the 30 tickets already in this order')
+        self.assertNotContains(rsp, 'attendee0@example.com')
+
+    def test_edit_order_keeping_uploaded_tickets(self):
+        order = factories.create_pending_group_order(self.alice)
+        self.client.force_login(self.alice)
+        form_data = self.form_data(company_name='Megadodo Publications', keep_uploaded_tickets='on')
+        rsp = self.client.post(f'/tickets/orders/{order.order_id}/edit/', form_data, follow=True)
+        self.assertContains(rsp, 'You are ordering 30 tickets')
+        self.assertContains(rsp, 'Megadodo Publications')
+
+    def test_edit_order_replacing_uploaded_tickets(self):
+        order = factories.create_pending_group_order(self.alice)
+        self.client.force_login(self.alice)
+        form_data = self.form_data(keep_uploaded_tickets='on', csv_file=self.csv_file(25))
+        rsp = self.client.post(f'/tickets/orders/{order.order_id}/edit/', form_data, follow=True)
+        self.assertContains(rsp, 'You are ordering 25 tickets')
+
+    def test_download_tickets(self):
+        order = factories.create_pending_group_order(self.alice)
+        self.client.force_login(self.alice)
+        rsp = self.client.get(f'/tickets/orders/{order.order_id}/tickets.csv')
+        self.assertEqual(rsp['Content-Type'], 'text/csv')
+        lines = rsp.content.decode().splitlines()
+        self.assertEqual(lines[:3], ['email_addr,days', 'attendee0@example.com,thu', 'attendee1@example.com,thu fri'])
+        self.assertEqual(len(lines), 31)
+
+    def test_download_tickets_when_not_authorized(self):
+        order = factories.create_pending_group_order(self.alice)
+        self.client.force_login(factories.create_user('Bob'))
+        rsp = self.client.get(f'/tickets/orders/{order.order_id}/tickets.csv', follow=True)
+        self.assertRedirects(rsp, '/')
+
+
 class OrderTests(TestCase):
     def test_for_confirmed_order_for_self(self):
         order = factories.create_confirmed_order_for_self()
@@ -334,6 +440,13 @@ class OrderTests(TestCase):
         self.assertRedirects(rsp, '/')
         self.assertContains(rsp, 'Only the purchaser of an order can view the order')
 
+    def test_malformed_order_id(self):
+        user = factories.create_user()
+        self.client.force_login(user)
+        for order_id in ['ZZZZ', 'abcd', 'ABCDEF']:
+            rsp = self.client.get(f'/tickets/orders/{order_id}/')
+            self.assertEqual(rsp.status_code, 404)
+
 
 class OrderPaymentTests(TestCase):
     @classmethod
@@ -375,6 +488,17 @@ class OrderPaymentTests(TestCase):
         self.assertRedirects(rsp, f'/tickets/orders/{self.order.order_id}/edit/')
         self.assertContains(rsp, 'You already have a ticket.  Please amend your order.  Your card has not been charged.')
 
+    def test_when_sold_out(self):
+        DayInventory.objects.set_capacity('thu', 0)
+        self.client.force_login(self.order.purchaser)
+        rsp = self.client.post(
+            f'/tickets/orders/{self.order.order_id}/payment/',
+            {'stripeToken': 'tok_abcdefghijklmnopqurstuvwx'},
+            follow=True,
+        )
+        self.assertRedirects(rsp, f'/tickets/orders/{self.order.order_id}/edit/')
+        self.assertContains(rsp, 'Sorry, tickets for Thursday have sold out.  Please amend your order.  Your card has not been charged.')
+
     def test_when_already_paid(self):
         factories.confirm_order(self.order)
         self.client.force_login(self.order.purchaser)
@@ -406,6 +530,210 @@ class OrderPaymentTests(TestCase):
         self.assertContains(rsp, 'Only the purchaser of an order can pay for the order')
 
 
+class AsyncOrderPaymentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = factories.create_pending_order_for_self()
+
+    @override_settings(JOBS_RUN_INLINE=False)
+    def test_payment_is_processed_by_job(self):
+        self.client.force_login(self.order.purchaser)
+        rsp = self.client.post(
+            f'/tickets/orders/{self.order.order_id}/payment/',
+            {'stripeToken': 'tok_abcdefghijklmnopqurstuvwx'},
+            follow=True,
+        )
+        self.assertContains(rsp, 'Your payment is being processed')
+        self.assertContains(rsp, '<th>Date</th><td>Processing</td>', html=True)
+        self.assertContains(rsp, '<div id="payment-processing">')
+        self.assertNotContains(rsp, '<div id="stripe-form">')
+
+        with utils.patched_charge_creation_success():
+            call_command('runjobs', once=True)
+
+        rsp = self.client.get(f'/tickets/orders/{self.order.order_id}/')
+        self.assertContains(rsp, '<th>Date</th><td>May 21, 2017</td>', html=True)
+        self.assertNotContains(rsp, '<div id="payment-processing">')
+
+    @override_settings(JOBS_RUN_INLINE=False)
+    def test_payment_fails_when_stripe_rejects_request(self):
+        self.client.force_login(self.order.purchaser)
+        self.client.post(f'/tickets/orders/{self.order.order_id}/payment/', {'stripeToken': 'tok_abcdefghijklmnopqurstuvwx'})
+
+        error = stripe.error.InvalidRequestError('No such token: tok_abcdefghijklmnopqurstuvwx', 'source')
+        with utils.patched_charge_creation_error(error):
+            call_command('runjobs', once=True)
+
+        self.assertEqual(Job.objects.get().status, 'done')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'failed')
+        self.assertTrue(self.order.payment_required())
+
+    @override_settings(JOBS_RUN_INLINE=False)
+    def test_payment_fails_when_charge_job_dies(self):
+        self.client.force_login(self.order.purchaser)
+        self.client.post(f'/tickets/orders/{self.order.order_id}/payment/', {'stripeToken': 'tok_abcdefghijklmnopqurstuvwx'})
+
+        job = Job.objects.get()
+        error = stripe.error.APIConnectionError('Could not connect to Stripe')
+        with utils.patched_charge_creation_error(error):
+            for attempt in range(job.max_attempts):
+                Job.objects.filter(pk=job.pk).update(run_after=datetime.now(timezone.utc))
+                run_next_job()
+
+                self.order.refresh_from_db()
+                if attempt < job.max_attempts - 1:
+                    self.assertEqual(self.order.status, 'processing')
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'dead')
+        self.assertEqual(self.order.status, 'failed')
+        self.assertEqual(self.order.stripe_charge_failure_reason, actions.STRIPE_ERROR_MESSAGE)
+        self.assertTrue(self.order.payment_required())
+
+    def test_payment_fails_when_inline_charge_job_fails(self):
+        self.client.force_login(self.order.purchaser)
+
+        error = stripe.error.APIConnectionError('Could not connect to Stripe')
+        with utils.patched_charge_creation_error(error):
+            rsp = self.client.post(
+                f'/tickets/orders/{self.order.order_id}/payment/',
+                {'stripeToken': 'tok_abcdefghijklmnopqurstuvwx'},
+                follow=True,
+            )
+        self.assertEqual(rsp.status_code, 200)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'failed')
+        self.assertTrue(self.order.payment_required())
+
+    def test_when_processing(self):
+        self.order.mark_as_processing()
+        self.client.force_login(self.order.purchaser)
+        rsp = self.client.post(
+            f'/tickets/orders/{self.order.order_id}/payment/',
+            {'stripeToken': 'tok_abcdefghijklmnopqurstuvwx'},
+            follow=True,
+        )
+        self.assertRedirects(rsp, f'/tickets/orders/{self.order.order_id}/')
+        self.assertContains(rsp, 'Payment for this order is being processed')
+
+
+class StripeWebhookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = factories.create_pending_order_for_self()
+
+    def setUp(self):
+        self.order.mark_as_processing()
+
+    def post_event(self, event, secret=None):
+        payload, signature = fake_stripe.encode(event, secret or settings.STRIPE_WEBHOOK_SECRET)
+        return self.client.post(
+            '/tickets/stripe/webhook/',
+            payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=signature,
+        )
+
+    def test_charge_succeeded(self):
+        rsp = self.post_event(fake_stripe.charge_event(self.order))
+        self.assertEqual(rsp.status_code, 200)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'successful')
+        self.assertEqual(self.order.num_tickets(), 1)
+
+    def test_charge_failed(self):
+        rsp = self.post_event(fake_stripe.charge_event(self.order, succeeded=False))
+        self.assertEqual(rsp.status_code, 200)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'failed')
+        self.assertEqual(self.order.stripe_charge_failure_reason, 'Your card was declined.')
+
+    def test_duplicate_event_is_processed_once(self):
+        event = fake_stripe.charge_event(self.order)
+
+        self.post_event(event)
+        rsp = self.post_event(event)
+        self.assertEqual(rsp.status_code, 200)
+
+        self.assertEqual(StripeEvent.objects.filter(event_id=event['id']).count(), 1)
+        self.assertEqual(self.order.tickets.count(), 1)
+
+    def test_event_for_order_that_is_no_longer_processing(self):
+        factories.confirm_order(self.order)
+        charge_id = self.order.stripe_charge_id
+
+        self.post_event(fake_stripe.charge_event(self.order, succeeded=False))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'successful')
+        self.assertEqual(self.order.stripe_charge_id, charge_id)
+        self.assertIsNotNone(StripeEvent.objects.get().processed_at)
+
+    def test_event_for_charge_not_for_ticket_order(self):
+        event = fake_stripe.charge_event(self.order)
+        event['data']['object']['metadata'] = {}
+
+        rsp = self.post_event(event)
+        self.assertEqual(rsp.status_code, 200)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'processing')
+
+    def test_charge_succeeded_for_order_given_up_on(self):
+        actions.mark_order_as_failed(self.order, actions.STRIPE_ERROR_MESSAGE)
+
+        self.post_event(fake_stripe.charge_event(self.order))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'successful')
+        self.assertEqual(self.order.num_tickets(), 1)
+
+    def test_charge_succeeded_for_order_changed_since_given_up_on(self):
+        event = fake_stripe.charge_event(self.order)
+        actions.mark_order_as_failed(self.order, actions.STRIPE_ERROR_MESSAGE)
+        actions.update_pending_order(self.order, 'individual', days_for_self=['thu'])
+
+        with utils.patched_refund_creation_expected() as mock:
+            self.post_event(event)
+
+        mock.assert_called_once()
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.payment_required())
+        self.assertEqual(self.order.tickets.count(), 0)
+
+    def test_event_from_other_mode_is_ignored(self):
+        event = fake_stripe.charge_event(self.order)
+        event['livemode'] = True
+
+        rsp = self.post_event(event)
+        self.assertEqual(rsp.status_code, 200)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'processing')
+        self.assertIsNotNone(StripeEvent.objects.get().processed_at)
+
+    @override_settings(STRIPE_API_KEY_SECRET='sk_live_abcdefghijklmnop')
+    def test_test_mode_event_does_not_confirm_live_order(self):
+        rsp = self.post_event(fake_stripe.charge_event(self.order))
+        self.assertEqual(rsp.status_code, 200)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'processing')
+        self.assertEqual(self.order.tickets.count(), 0)
+
+    def test_bad_signature(self):
+        rsp = self.post_event(fake_stripe.charge_event(self.order), secret='not-the-secret')
+        self.assertEqual(rsp.status_code, 400)
+
+        self.assertEqual(StripeEvent.objects.count(), 0)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'processing')
+
+
 class OrderReceiptTests(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -508,6 +836,12 @@ class TicketTests(TestCase):
         self.assertRedirects(rsp, '/')
         self.assertContains(rsp, 'Only the owner of a ticket can view the ticket')
 
+    def test_malformed_ticket_id(self):
+        user = factories.create_user()
+        self.client.force_login(user)
+        rsp = self.client.get('/tickets/tickets/ZZZZ/')
+        self.assertEqual(rsp.status_code, 404)
+
 
 class TicketEditTests(TestCase):
     def test_get_incomplete_free_ticket(self):
@@ -0,0 +1,191 @@
+'''Reading and writing lists of tickets for other people as CSV.
+
+For an order, each row has an email address and the days that the ticket is
+for, separated by spaces or semicolons, like:
+
+    email_addr,days
+    alice@example.com,thu fri sat
+    bob@example.com,Friday;Saturday
+
+For free tickets, each row has an email address, the pot that the ticket is
+from, and optionally the days that the ticket is for, like:
+
+    email_addr,pot,days
+    carol@example.com,Sponsor: Sirius Cybernetics Corp.,thu fri
+    dave@example.com,Financial assistance,
+
+The header row is optional, and days can be given as abbreviations or in
+full, in any case.  This lets a large group order, or a pot of free tickets,
+be uploaded rather than entered one ticket at a time.
+'''
+
+import csv
+import re
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+from .constants import DAYS
+from .days import DaySet
+
+
+# The most tickets that can be uploaded in one file for an order
+MAX_ROWS = 500
+
+# Reading stops after this many errors
+MAX_ERRORS = 20
+
+HEADER = ['email_addr', 'days']
+
+# The longest name of a pot that a ticket can have
+MAX_POT_LENGTH = 100
+
+DAYS_BY_NAME = {
+    **{day: day for day in DAYS},
+    **{name.lower(): day for day, name in DAYS.items()},
+}
+
+
+class InvalidTicketsCsv(Exception):
+    def __init__(self, errors):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+
+def read(lines):
+    '''Return a list of [email_addr, days] pairs, as stored in an order's
+    unconfirmed_details, from an iterable of lines of CSV.
+
+    Rows are validated as they are read, and if any are invalid,
+    InvalidTicketsCsv is raised with an error for each, giving its line number.
+    '''
+
+    return _read(lines, parse_row)
+
+
+def read_free_tickets(lines, pot=None):
+    '''Return a list of [email_addr, pot, days] triples from an iterable of
+    lines of CSV, validated as read() validates them.  If pot is given, it is
+    used for rows that don't name a pot.
+
+    Since free tickets are created by staff, there is no limit on the number
+    of rows.
+    '''
+
+    return _read(lines, lambda row: parse_free_ticket_row(row, pot), max_rows=None)
+
+
+def _read(lines, parse_row, max_rows=MAX_ROWS):
+    rows = []
+    line_nums_by_email_addr = {}
+    errors = []
+
+    reader = csv.reader(lines)
+
+    try:
+        for row in reader:
+            line_num = reader.line_num
+
+            if not any(cell.strip() for cell in row):
+                continue
+
+            if line_num == 1 and row[0].strip().lower() == HEADER[0]:
+                continue
+
+            if len(rows) == max_rows:
+                errors.append(f'There can be at most {max_rows} tickets in one file')
+                break
+
+            try:
+                parsed_row = parse_row(row)
+                email_addr = parsed_row[0]
+                # Email addresses are compared without case, as they are when
+                # checking for existing tickets.
+                if email_addr.lower() in line_nums_by_email_addr:
+                    raise ValidationError(f'{email_addr} is also on line {line_nums_by_email_addr[email_addr.lower()]}')
+            except ValidationError as e:
+                errors.append(f'Line {line_num}: {e.message}')
+                if len(errors) == MAX_ERRORS:
+                    errors.append('Too many errors, so the rest of the file was not checked')
+                    break
+                continue
+
+            line_nums_by_email_addr[email_addr.lower()] = line_num
+            rows.append(list(parsed_row))
+
+    except UnicodeDecodeError:
+        raise InvalidTicketsCsv(['The file is not encoded as UTF-8'])
+    except csv.Error as e:
+        raise InvalidTicketsCsv([f'The file is not valid CSV ({e})'])
+
+    if errors:
+        raise InvalidTicketsCsv(errors)
+
+    if not rows:
+        raise InvalidTicketsCsv(['The file does not contain any tickets'])
+
+    return rows
+
+
+def parse_row(row):
+    '''Return the email address and list of days given in a row, or raise
+    ValidationError.'''
+
+    if len(row) != 2:
+        raise ValidationError('Expected an email address and a list of days')
+
+    email_addr = parse_email_addr(row[0])
+    days = parse_days(row[1])
+    if not days:
+        raise ValidationError(f'No days given for {email_addr}')
+
+    return email_addr, days
+
+
+def parse_free_ticket_row(row, default_pot=None):
+    '''Return the email address, pot, and list of days given in a row for a free
+    ticket, or raise ValidationError.'''
+
+    if not 1 <= len(row) <= 3:
+        raise ValidationError('Expected an email address, a pot, and optionally a list of days')
+
+    row = row + [''] * (3 - len(row))
+
+    email_addr = parse_email_addr(row[0])
+
+    pot = row[1].strip() or default_pot
+    if not pot:
+        raise ValidationError(f'No pot given for {email_addr}')
+    if len(pot) > MAX_POT_LENGTH:
+        raise ValidationError(f'The name of the pot for {email_addr} is too long')
+
+    return email_addr, pot, parse_days(row[2])
+
+
+def parse_email_addr(cell):
+    email_addr = cell.strip()
+    try:
+        validate_email(email_addr)
+    except ValidationError:
+        raise ValidationError(f'{email_addr} is not a valid email address')
+    return email_addr
+
+
+def parse_days(cell):
+    names = [name for name in re.split(r'[\s;]+', cell.lower()) if name]
+
+    unknown_names = [name for name in names if name not in DAYS_BY_NAME]
+    if unknown_names:
+        raise ValidationError(f'Unknown day: {unknown_names[0]}')
+
+    return list(DaySet.from_days(DAYS_BY_NAME[name] for name in names))
+
+
+def write(email_addrs_and_days, f):
+    '''Write a list of (email_addr, days) pairs to f in the format that read()
+    reads.'''
+
+    writer = csv.writer(f)
+    writer.writerow(HEADER)
+    for email_addr, days in email_addrs_and_days:
+        writer.writerow([email_addr, ' '.join(days)])
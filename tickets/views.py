@@ -1,15 +1,24 @@
+from collections import Counter
 from datetime import datetime, timezone
 
+import stripe
+
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
+from ironcage.stripe_integration import construct_event
+
 from . import actions
-from .forms import CompanyDetailsForm, TicketForm, TicketForSelfForm, TicketForOthersFormSet
-from .models import Order, Ticket, TicketInvitation
+from .constants import DAYS
+from . import ticket_csv
+from .forms import CompanyDetailsForm, TicketForm, TicketForSelfForm, TicketForOthersFormSet, TicketsCsvForm
+from .models import MAX_TICKETS_LISTED, DayInventory, Order, SoldOut, Ticket, TicketInvitation
 from .prices import PRICES_INCL_VAT, cost_incl_vat
 
 
@@ -21,6 +30,7 @@ def new_order(request):
         form = TicketForm(request.POST)
         self_form = TicketForSelfForm(request.POST)
         others_formset = TicketForOthersFormSet(request.POST)
+        csv_form = TicketsCsvForm(request.POST, request.FILES)
         company_details_form = CompanyDetailsForm(request.POST)
 
         if form.is_valid():
@@ -33,15 +43,15 @@ def new_order(request):
                     days_for_self = self_form.cleaned_data['days']
                     email_addrs_and_days_for_others = None
             elif who == 'others':
-                valid = others_formset.is_valid()
+                email_addrs_and_days_for_others = _email_addrs_and_days_for_others(others_formset, csv_form)
+                valid = email_addrs_and_days_for_others is not None
                 if valid:
                     days_for_self = None
-                    email_addrs_and_days_for_others = others_formset.email_addrs_and_days
             elif who == 'self and others':
-                valid = self_form.is_valid() and others_formset.is_valid()
+                email_addrs_and_days_for_others = _email_addrs_and_days_for_others(others_formset, csv_form)
+                valid = self_form.is_valid() and email_addrs_and_days_for_others is not None
                 if valid:
                     days_for_self = self_form.cleaned_data['days']
-                    email_addrs_and_days_for_others = others_formset.email_addrs_and_days
             else:
                 assert False
 
@@ -56,6 +66,15 @@ def new_order(request):
                 else:
                     company_details = None
 
+            if valid:
+                day_counts = Counter(days_for_self or [])
+                for _, days in email_addrs_and_days_for_others or []:
+                    day_counts.update(days)
+                unavailable_days = DayInventory.objects.unavailable_days(day_counts)
+                if unavailable_days:
+                    messages.warning(request, str(SoldOut(unavailable_days)))
+                    valid = False
+
             if valid:
                 order = actions.create_pending_order(
                     purchaser=request.user,
@@ -76,14 +95,17 @@ def new_order(request):
         form = TicketForm()
         self_form = TicketForSelfForm()
         others_formset = TicketForOthersFormSet()
+        csv_form = TicketsCsvForm()
         company_details_form = CompanyDetailsForm()
 
     context = {
         'form': form,
         'self_form': self_form,
         'others_formset': others_formset,
+        'csv_form': csv_form,
         'company_details_form': company_details_form,
         'user_can_buy_for_self': request.user.is_authenticated() and not request.user.get_ticket(),
+        'sold_out_days': [DAYS[day] for day, remaining in DayInventory.objects.availability().items() if remaining == 0],
         'rates_table_data': _rates_table_data(),
         'rates_data': _rates_data(),
         'js_paths': ['tickets/order_form.js'],
@@ -100,14 +122,22 @@ def order_edit(request, order_id):
         messages.warning(request, 'Only the purchaser of an order can update the order')
         return redirect('index')
 
+    if order.is_processing():
+        messages.error(request, 'Payment for this order is being processed')
+        return redirect(order)
+
     if not order.payment_required():
         messages.error(request, 'This order has already been paid')
         return redirect(order)
 
+    num_tickets_for_others = len(order.unconfirmed_details['email_addrs_and_days_for_others'] or [])
+    num_uploaded_tickets = num_tickets_for_others if num_tickets_for_others > MAX_TICKETS_LISTED else None
+
     if request.method == 'POST':
         form = TicketForm(request.POST)
         self_form = TicketForSelfForm(request.POST)
         others_formset = TicketForOthersFormSet(request.POST)
+        csv_form = TicketsCsvForm(request.POST, request.FILES)
         company_details_form = CompanyDetailsForm(request.POST)
 
         if form.is_valid():
@@ -120,15 +150,15 @@ def order_edit(request, order_id):
                     days_for_self = self_form.cleaned_data['days']
                     email_addrs_and_days_for_others = None
             elif who == 'others':
-                valid = others_formset.is_valid()
+                email_addrs_and_days_for_others = _email_addrs_and_days_for_others(others_formset, csv_form, order)
+                valid = email_addrs_and_days_for_others is not None
                 if valid:
                     days_for_self = None
-                    email_addrs_and_days_for_others = others_formset.email_addrs_and_days
             elif who == 'self and others':
-                valid = self_form.is_valid() and others_formset.is_valid()
+                email_addrs_and_days_for_others = _email_addrs_and_days_for_others(others_formset, csv_form, order)
+                valid = self_form.is_valid() and email_addrs_and_days_for_others is not None
                 if valid:
                     days_for_self = self_form.cleaned_data['days']
-                    email_addrs_and_days_for_others = others_formset.email_addrs_and_days
             else:
                 assert False
 
@@ -157,13 +187,23 @@ def order_edit(request, order_id):
     else:
         form = TicketForm(order.form_data())
         self_form = TicketForSelfForm(order.self_form_data())
-        others_formset = TicketForOthersFormSet(order.others_formset_data())
+        if num_uploaded_tickets:
+            # Rather than showing a very long formset, let the purchaser keep
+            # the tickets that they have already uploaded or upload a new file
+            others_formset = TicketForOthersFormSet()
+            csv_form = TicketsCsvForm(initial={'keep_uploaded_tickets': True})
+        else:
+            others_formset = TicketForOthersFormSet(order.others_formset_data())
+            csv_form = TicketsCsvForm()
         company_details_form = CompanyDetailsForm(order.company_details_form_data())
 
     context = {
+        'order': order,
         'form': form,
         'self_form': self_form,
         'others_formset': others_formset,
+        'csv_form': csv_form,
+        'num_uploaded_tickets': num_uploaded_tickets,
         'company_details_form': company_details_form,
         'user_can_buy_for_self': not request.user.get_ticket(),
         'rates_table_data': _rates_table_data(),
@@ -174,6 +214,46 @@ def order_edit(request, order_id):
     return render(request, 'tickets/order_edit.html', context)
 
 
+def _email_addrs_and_days_for_others(others_formset, csv_form, order=None):
+    '''Return the email addresses and days of the tickets for others, from an
+    uploaded CSV file if there is one, or else from the order being edited if
+    the purchaser has chosen to keep the tickets they uploaded before, or else
+    from the formset.  Return None if they aren't valid.'''
+
+    if not csv_form.is_valid():
+        return None
+
+    if csv_form.cleaned_data['csv_file'] is not None:
+        return csv_form.email_addrs_and_days
+
+    if order is not None and csv_form.cleaned_data['keep_uploaded_tickets']:
+        email_addrs_and_days_for_others = order.unconfirmed_details['email_addrs_and_days_for_others']
+        if email_addrs_and_days_for_others is not None:
+            return email_addrs_and_days_for_others
+
+    if not others_formset.is_valid():
+        return None
+
+    return others_formset.email_addrs_and_days
+
+
+@login_required
+def order_tickets_csv(request, order_id):
+    order = Order.objects.get_by_order_id_or_404(order_id)
+
+    if request.user != order.purchaser:
+        messages.warning(request, 'Only the purchaser of an order can view the order')
+        return redirect('index')
+
+    if not order.payment_required():
+        return redirect(order)
+
+    response = HttpResponse(content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{order.order_id}-tickets.csv"'
+    ticket_csv.write(order.unconfirmed_details['email_addrs_and_days_for_others'] or [], response)
+    return response
+
+
 @login_required
 def order(request, order_id):
     order = Order.objects.get_by_order_id_or_404(order_id)
@@ -213,6 +293,10 @@ def order_payment(request, order_id):
         messages.warning(request, 'Only the purchaser of an order can pay for the order')
         return redirect('index')
 
+    if order.is_processing():
+        messages.error(request, 'Payment for this order is being processed')
+        return redirect(order)
+
     if not order.payment_required():
         messages.error(request, 'This order has already been paid')
         return redirect(order)
@@ -221,15 +305,37 @@ def order_payment(request, order_id):
         messages.warning(request, 'You already have a ticket.  Please amend your order.  Your card has not been charged.')
         return redirect('tickets:order_edit', order.order_id)
 
+    unavailable_days = DayInventory.objects.unavailable_days(order.day_counts())
+    if unavailable_days:
+        messages.warning(request, f'{SoldOut(unavailable_days)}.  Please amend your order.  Your card has not been charged.')
+        return redirect('tickets:order_edit', order.order_id)
+
     token = request.POST['stripeToken']
-    actions.process_stripe_charge(order, token)
+    actions.start_stripe_charge(order, token)
 
-    if not order.payment_required():
+    # If jobs are run inline, the payment will already have been processed
+    order.refresh_from_db()
+
+    if order.is_processing():
+        messages.info(request, 'Your payment is being processed.')
+    elif not order.payment_required():
         messages.success(request, 'Payment for this order has been received.')
 
     return redirect(order)
 
 
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    try:
+        event = construct_event(request.body.decode('utf8'), request.META.get('HTTP_STRIPE_SIGNATURE', ''))
+    except (ValueError, stripe.error.SignatureVerificationError):
+        return HttpResponseBadRequest()
+
+    actions.record_stripe_event(event)
+    return HttpResponse()
+
+
 @login_required
 def order_receipt(request, order_id):
     order = Order.objects.get_by_order_id_or_404(order_id)
@@ -238,7 +344,7 @@ def order_receipt(request, order_id):
         messages.warning(request, 'Only the purchaser of an order can view the receipt')
         return redirect('index')
 
-    if order.payment_required():
+    if order.is_unconfirmed():
         messages.error(request, 'This order has not been paid')
         return redirect(order)
 
@@ -286,12 +392,18 @@ def ticket_edit(request, ticket_id):
         form = TicketForSelfForm(request.POST)
         if form.is_valid():
             days = form.cleaned_data['days']
-            actions.update_free_ticket(ticket, days)
-            return redirect(ticket)
+            try:
+                actions.update_free_ticket(ticket, days)
+            except SoldOut as e:
+                form.add_error('days', str(e))
+            else:
+                return redirect(ticket)
+    else:
+        form = TicketForSelfForm({'days': ticket.days_abbrev()})
 
     context = {
         'ticket': ticket,
-        'form': TicketForSelfForm({'days': ticket.days_abbrev()}),
+        'form': form,
     }
 
     return render(request, 'tickets/ticket_edit.html', context)
@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 
@@ -15,11 +16,14 @@ class Nomination(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    id_scrambler = Scrambler(5000)
+    id_scrambler = Scrambler(5000, bits=settings.ID_SCRAMBLER_BITS)
 
     class Manager(models.Manager):
         def get_by_nomination_id_or_404(self, nomination_id):
-            id = self.model.id_scrambler.backward(nomination_id)
+            try:
+                id = self.model.id_scrambler.backward(nomination_id)
+            except ValueError:
+                raise Http404
             return get_object_or_404(self.model, pk=id)
 
     objects = Manager()